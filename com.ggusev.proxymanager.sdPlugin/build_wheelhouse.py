@@ -0,0 +1,53 @@
+"""
+Download the wheels of code/requirements.txt into code/wheelhouse,
+so init.py installs them with pip --no-index, without the network.
+
+Run with the Python the plugin will use:
+
+    python3 build_wheelhouse.py
+
+or for other interpreters and platforms, one run of pip download per combination:
+
+    python3 build_wheelhouse.py --python-version 3.8 --python-version 3.12 \\
+        --platform macosx_11_0_arm64 --platform macosx_10_12_x86_64
+"""
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PLUGIN_DIR_PATH: Path = Path(__file__).parent
+PLUGIN_CODE_REQUIREMENTS_PATH: Path = PLUGIN_DIR_PATH / "code" / "requirements.txt"
+PLUGIN_CODE_WHEELHOUSE_PATH: Path = PLUGIN_DIR_PATH / "code" / "wheelhouse"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--python-version", action="append", default=[], help="example: 3.8")
+    parser.add_argument("--platform", action="append", default=[], help="example: macosx_11_0_arm64")
+    parser.add_argument("--wheelhouse", type=Path, default=PLUGIN_CODE_WHEELHOUSE_PATH)
+    args = parser.parse_args()
+
+    targets = [(python_version, platform)
+               for python_version in args.python_version or [None]
+               for platform in args.platform or [None]]
+    for python_version, platform in targets:
+        command = [
+            sys.executable, "-m", "pip", "download",
+            "--only-binary=:all:",
+            "-r", str(PLUGIN_CODE_REQUIREMENTS_PATH),
+            "-d", str(args.wheelhouse),
+        ]
+        if python_version:
+            command += ["--python-version", python_version]
+        if platform:
+            command += ["--platform", platform]
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        print(f"python {python_version or 'current'}, platform {platform or 'current'}: "
+              f"{time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
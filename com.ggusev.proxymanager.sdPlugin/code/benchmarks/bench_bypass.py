@@ -0,0 +1,89 @@
+"""
+Bypass domain lists of --entries entries: loading and collapsing a file, diffing against the current list,
+and applying it through the stand-in networksetup.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_bypass --entries 10000
+
+A tenth of the generated entries are wildcard domains, the rest are hosts, some below a wildcard domain,
+and duplicates spelled differently.
+"""
+import argparse
+import itertools
+import os
+import random
+import tempfile
+from pathlib import Path
+from typing import List
+
+from macos_proxy_settings import bypass, networksetup
+from .utils import format_result, install_stand_ins, measure
+
+
+def generate_entries(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    teams = [f"team{index}" for index in range(max(count // 10, 1))]
+    entries = [f"*.{team}.corp.example.com" for team in teams]
+    while len(entries) < count:
+        team = rng.choice(teams)
+        host = f"host{rng.randrange(count)}"
+        kind = rng.random()
+        if kind < 0.5:
+            entries.append(f"{host}.{team}.corp.example.com")  # covered by the wildcard of the team
+        elif kind < 0.9:
+            entries.append(f"{host}.{team}.example.net")
+        else:
+            entries.append(f"{host.upper()}.{team}.example.net.")  # a duplicate spelled differently
+    rng.shuffle(entries)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0, help="stand-in latency per command, seconds")
+    args = parser.parse_args()
+
+    entries = generate_entries(count=args.entries)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir)
+        path = tmp_path / "bypass.txt"
+        path.write_text("\n".join(entries), encoding="utf-8")
+
+        def load_changed_file() -> List[str]:
+            os.utime(path, ns=(0, path.stat().st_mtime_ns + 1))
+            return bypass.load_file(path)
+
+        domains = bypass.load_file(path)
+        current = list(reversed(domains))
+        results = {
+            "load_file": measure(load_changed_file, runs=args.runs),
+            "load_file_unchanged": measure(lambda: bypass.load_file(path), runs=args.runs),
+            "collapse": measure(lambda: bypass.collapse(entries), runs=args.runs),
+            "diff_unchanged": measure(lambda: bypass.diff(current=current, desired=domains), runs=args.runs),
+        }
+
+        install_stand_ins(tmp_path=tmp_path, latency=args.latency)
+        # every run writes, the lists alternate
+        lists = itertools.cycle([domains[1:], domains])
+        results["apply_changed"] = measure(
+            lambda: bypass.apply_bypass_domains(networkservice="Wi-Fi", domains=next(lists)),
+            runs=args.runs,
+        )
+        # every run after the warm-up only reads
+        results["apply_unchanged"] = measure(
+            lambda: bypass.apply_bypass_domains(networkservice="Wi-Fi", domains=domains),
+            runs=args.runs,
+        )
+
+    argv = ["networksetup", "-setproxybypassdomains", "Wi-Fi", *domains]
+    print(f"{len(entries)} entries, {len(domains)} after collapsing, "
+          f"{networksetup.argv_size(argv)} of {networksetup.max_argv_size()} argument bytes")
+    for name, result in results.items():
+        print(f"{name:<20} {format_result(result)}")
+
+
+if __name__ == '__main__':
+    main()
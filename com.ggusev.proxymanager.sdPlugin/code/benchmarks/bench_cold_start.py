@@ -0,0 +1,68 @@
+"""
+Cold start of main.py up to connecting to the Stream Deck, checked against a budget.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_cold_start --budget-ms 800
+
+Every run is a new interpreter importing main, which is what main.py does before it connects.
+Exits with 1 if the median run exceeds --budget-ms, printing the slowest imports.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from startup import parse_importtime
+
+CODE_DIR_PATH = Path(__file__).parents[1]
+
+
+def run_once(importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", "import main"]
+    return subprocess.run(command, cwd=CODE_DIR_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          encoding="utf-8", check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--top-imports", type=int, default=15)
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    run_once()  # warm up the file system cache
+    durations_ms = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        run_once()
+        durations_ms.append((time.perf_counter() - start) * 1000)
+    durations_ms.sort()
+    median_ms = statistics.median(durations_ms)
+    imports = [item for item in parse_importtime(run_once(importtime=True).stderr) if item["depth"] == 1]
+
+    print(f"cold start: median={median_ms:.1f}ms min={durations_ms[0]:.1f}ms max={durations_ms[-1]:.1f}ms "
+          f"budget={args.budget_ms:.0f}ms")
+    for item in imports[:args.top_imports]:
+        print(f"  {item['module']:<40} cumulative={item['cumulative_ms']:.1f}ms")
+    if args.output:
+        args.output.write_text(json.dumps({
+            "median_ms": median_ms,
+            "durations_ms": durations_ms,
+            "budget_ms": args.budget_ms,
+            "imports": imports[:args.top_imports],
+        }, indent=2), encoding="utf-8")
+    if median_ms > args.budget_ms:
+        print(f"cold start exceeds the budget by {median_ms - args.budget_ms:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Read, write and monitoring hot paths against a stand-in networksetup, with results written to JSON.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_hot_paths --output results.json
+    python -m benchmarks.bench_hot_paths --latency 0.005 --baseline results.json
+
+The stand-in runs as a real process per command, so the numbers include process start-up.
+--latency adds a delay to every command, --networkservices sets how many services the stand-in serves.
+--baseline prints the ratio of every mean to the one in an earlier results file.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.executor import configure_executor
+from macos_proxy_settings.simple_settings import (
+    ProxyTypes,
+    ReadBackends,
+    configure_cache,
+    get_proxy,
+    set_proxy,
+    set_read_backend,
+)
+from .utils import format_result, install_stand_ins, measure
+
+MONITORING_CONTEXT_COUNTS = [1, 10, 100, 1000]
+
+
+def git_commit() -> Optional[str]:
+    p = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return p.stdout.decode("utf-8").strip() or None
+
+
+def bench_get_proxy(networkservice: str, runs: int) -> Dict[str, Dict[str, float]]:
+    return {
+        f"get_proxy[{proxy_type.value}]": measure(
+            lambda: get_proxy(proxy_type=proxy_type, networkservice=networkservice),
+            runs=runs,
+        )
+        for proxy_type in ProxyTypes
+    }
+
+
+def bench_set_proxy(networkservice: str, runs: int) -> Dict[str, Dict[str, float]]:
+    return {
+        f"set_proxy[{ProxyTypes.HTTP_HTTPS.value}]": measure(
+            lambda: set_proxy(
+                proxy_type=ProxyTypes.HTTP_HTTPS,
+                networkservice=networkservice,
+                domain="127.0.0.1",
+                port="8080",
+            ),
+            runs=runs,
+        ),
+    }
+
+
+def bench_listnetworkserviceorder(runs: int) -> Dict[str, Dict[str, float]]:
+    stdout = subprocess.run(["networksetup", "-listnetworkserviceorder"], stdout=subprocess.PIPE).stdout.decode("utf-8")
+    return {
+        "listnetworkserviceorder": measure(networksetup.listnetworkserviceorder, runs=runs),
+        "listnetworkserviceorder[parse]": measure(
+            lambda: networksetup.parse_listnetworkserviceorder(stdout),
+            runs=runs * 100,
+        ),
+    }
+
+
+def bench_monitoring_iteration(networkservices: List[str], runs: int) -> Dict[str, Dict[str, float]]:
+    # main needs streamdeck_sdk, so it is only imported by this benchmark
+    import main
+    from monitoring import MonitoringParams
+
+    action = main.ConnectDisconnectAction()
+    action.set_state = lambda context, state: None  # there is no Stream Deck to send to
+    proxy_types = list(ProxyTypes)
+    result = {}
+    for context_count in MONITORING_CONTEXT_COUNTS:
+        for contexts in main.MONITORING_REGISTRY.snapshot().values():
+            for context in contexts:
+                main.MONITORING_REGISTRY.remove(context=context)
+        for index in range(context_count):
+            main.MONITORING_REGISTRY.add(
+                context=f"context-{index}",
+                monitoring_params=MonitoringParams(
+                    networkservice=networkservices[index % len(networkservices)],
+                    proxy_type=proxy_types[index // len(networkservices) % len(proxy_types)],
+                    domain="127.0.0.1",
+                    port="1080",
+                ),
+            )
+        result[f"monitoring_iteration[{context_count}]"] = measure(action.monitoring_iteration, runs=runs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0, help="stand-in latency per command, seconds")
+    parser.add_argument("--networkservices", type=int, default=10)
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    parser.add_argument("--baseline", type=Path, help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    networkservices = ["Wi-Fi"] + [f"Service {index}" for index in range(1, args.networkservices)]
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        install_stand_ins(tmp_path=Path(tmp_dir), latency=args.latency, networkservices=networkservices)
+        set_read_backend(ReadBackends.NETWORKSETUP)
+        configure_cache(ttl=0, max_size=1)  # every call reaches networksetup
+        configure_executor(max_workers=4)
+        results.update(bench_get_proxy(networkservice="Wi-Fi", runs=args.runs))
+        results.update(bench_set_proxy(networkservice="Wi-Fi", runs=args.runs))
+        results.update(bench_listnetworkserviceorder(runs=args.runs))
+        results.update(bench_monitoring_iteration(networkservices=networkservices, runs=max(args.runs // 10, 1)))
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"] if args.baseline else {}
+    for name, result in results.items():
+        line = f"{name:<32} {format_result(result)}"
+        if name in baseline:
+            line += f" vs_baseline={result['mean_ms'] / baseline[name]['mean_ms']:.2f}x"
+        print(line)
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "latency": args.latency,
+                "networkservices": args.networkservices,
+            },
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Parser throughput over a corpus of recorded networksetup output.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_parsers --corpus corpus.jsonl
+    python -m benchmarks.bench_parsers --networkservices 20 --output results.json
+
+A corpus is recorded with NETWORKSETUP_RECORD_PATH set, see macos_proxy_settings.corpus.
+Without --corpus one is recorded from the stand-in networksetup serving --networkservices services.
+"""
+import argparse
+import json
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.corpus import CorpusRecorder, load_corpus
+from macos_proxy_settings.networksetup import ProxyInfo, parse_listnetworkserviceorder, parse_proxy_info
+from .utils import install_stand_ins
+
+GET_COMMANDS = ["-getwebproxy", "-getsecurewebproxy", "-getsocksfirewallproxy"]
+# one pattern per ProxyInfo field, as parse_proxy_info used them
+PROXY_ENABLED_PATTERN = re.compile(r"^Enabled: (.*)$", re.MULTILINE)
+PROXY_SERVER_PATTERN = re.compile(r"^Server: (.*)$", re.MULTILINE)
+PROXY_PORT_PATTERN = re.compile(r"^Port: (.*)$", re.MULTILINE)
+PROXY_AUTHENTICATED_PATTERN = re.compile(r"^Authenticated Proxy Enabled: (.*)$", re.MULTILINE)
+
+
+def parse_proxy_info_multi_pass(stdout: str) -> ProxyInfo:
+    """
+    parse_proxy_info before the single-pass parser: one scan of stdout per field.
+    """
+    authenticated = PROXY_AUTHENTICATED_PATTERN.findall(stdout)
+    return ProxyInfo(
+        enabled=PROXY_ENABLED_PATTERN.findall(stdout)[0] == "Yes",
+        server=PROXY_SERVER_PATTERN.findall(stdout)[0],
+        port=PROXY_PORT_PATTERN.findall(stdout)[0],
+        authenticated=authenticated[0] == "1" if authenticated else None,
+    )
+
+
+def record_corpus(path: Path, networkservices: List[str]) -> None:
+    networksetup.set_recorder(CorpusRecorder(path=path))
+    try:
+        networksetup.listnetworkserviceorder()
+        for networkservice in networkservices:
+            networksetup.getwebproxy(networkservice=networkservice)
+            networksetup.getsecurewebproxy(networkservice=networkservice)
+            networksetup.getsocksfirewallproxy(networkservice=networkservice)
+    finally:
+        networksetup.set_recorder(None)
+
+
+def throughput(parse: Callable[[str], object], outputs: List[str], min_time: float) -> Dict[str, float]:
+    """
+    :return: outputs parsed per second, repeating the outputs for at least min_time seconds
+    """
+    parsed = 0
+    start = time.perf_counter()
+    while True:
+        for stdout in outputs:
+            parse(stdout)
+        parsed += len(outputs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+    return {
+        "outputs": len(outputs),
+        "per_second": parsed / elapsed,
+        "mean_us": elapsed / parsed * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path)
+    parser.add_argument("--networkservices", type=int, default=20)
+    parser.add_argument("--min-time", type=float, default=1, help="seconds each parser runs for")
+    parser.add_argument("--output", type=Path, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_path = args.corpus
+        if corpus_path is None:
+            networkservices = ["Wi-Fi"] + [f"Service {index}" for index in range(1, args.networkservices)]
+            install_stand_ins(tmp_path=Path(tmp_dir), latency=0, networkservices=networkservices)
+            corpus_path = Path(tmp_dir) / "corpus.jsonl"
+            record_corpus(path=corpus_path, networkservices=networkservices)
+        corpus = [run for run in load_corpus(corpus_path) if run["returncode"] == 0]
+
+    get_outputs = [run["stdout"] for run in corpus if run["argv"][1] in GET_COMMANDS]
+    list_outputs = [run["stdout"] for run in corpus if run["argv"][1] == "-listnetworkserviceorder"]
+    for stdout in get_outputs:
+        assert parse_proxy_info(stdout) == parse_proxy_info_multi_pass(stdout), stdout
+
+    results = {}
+    if get_outputs:
+        results["parse_proxy_info"] = throughput(parse_proxy_info, get_outputs, min_time=args.min_time)
+        results["parse_proxy_info[multi_pass]"] = throughput(
+            parse_proxy_info_multi_pass, get_outputs, min_time=args.min_time,
+        )
+    if list_outputs:
+        results["parse_listnetworkserviceorder"] = throughput(
+            parse_listnetworkserviceorder, list_outputs, min_time=args.min_time,
+        )
+
+    for name, result in results.items():
+        print(f"{name:<32} outputs={result['outputs']} per_second={result['per_second']:.0f} "
+              f"mean_us={result['mean_us']:.2f}")
+    if args.output:
+        args.output.write_text(json.dumps({"corpus": str(args.corpus), "results": results}, indent=2),
+                               encoding="utf-8")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Per-read latency of get_proxy: networksetup (a process per read) against a persistent scutil session.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_read_backends --reads 200
+    python -m benchmarks.bench_read_backends --stand-ins --latency 0.005
+
+--stand-ins puts stand-in networksetup and scutil on PATH, so the benchmark runs off a Mac.
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.scutil import ScutilReader, ScutilSession
+from .utils import format_result, install_stand_ins, measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=100)
+    parser.add_argument("--networkservice", default="Wi-Fi")
+    parser.add_argument("--stand-ins", action="store_true")
+    parser.add_argument("--latency", type=float, default=0, help="stand-in latency per command, seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.stand_ins:
+            install_stand_ins(tmp_path=Path(tmp_dir), latency=args.latency)
+
+        session = ScutilSession()
+        scutil_reader = ScutilReader(session=session)
+        results = {
+            "networksetup": measure(
+                lambda: networksetup.get_proxy(command="getsocksfirewallproxy", networkservice=args.networkservice),
+                runs=args.reads,
+            ),
+            "scutil_session": measure(
+                lambda: scutil_reader.get_proxy(command="getsocksfirewallproxy", networkservice=args.networkservice),
+                runs=args.reads,
+            ),
+        }
+        session.close()
+
+    for name, result in results.items():
+        print(f"{name:<16} {format_result(result)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Throughput and connection setup time of LocalRelay in front of a stand-in SOCKS5 proxy on localhost.
+
+Run from the code directory:
+
+    python -m benchmarks.bench_relay --megabytes 256 --connections 200
+"""
+import argparse
+import asyncio
+import time
+
+from relay import LocalRelay, Upstream, UpstreamKinds
+from test_relay import StandInUpstream, echo, echo_server, socks5_client
+
+
+async def discard_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while await reader.read(256 * 1024):
+        pass
+    writer.write(b"done")
+    await writer.drain()
+    writer.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    sink = await asyncio.start_server(discard_server, host="127.0.0.1", port=0)
+    sink_port = sink.sockets[0].getsockname()[1]
+    stand_in = StandInUpstream(kind=UpstreamKinds.SOCKS5)
+    upstream = Upstream(kind=UpstreamKinds.SOCKS5, domain="127.0.0.1", port=await stand_in.start())
+    relay = LocalRelay(port=0, buffer_size=args.buffer_size, pool_size=args.pool_size)
+    await relay.start()
+    relay.set_upstream(upstream)
+    await asyncio.sleep(0.1)
+
+    chunk = b"x" * (1024 * 1024)
+    reader, writer = await socks5_client(relay.port, "127.0.0.1", sink_port)
+    started_at = time.perf_counter()
+    for _ in range(args.megabytes):
+        writer.write(chunk)
+        await writer.drain()
+    writer.write_eof()
+    await reader.read()
+    elapsed = time.perf_counter() - started_at
+    writer.close()
+    print(f"throughput  {args.megabytes / elapsed:.0f} MB/s")
+
+    echo_ = await asyncio.start_server(echo_server, host="127.0.0.1", port=0)
+    echo_port = echo_.sockets[0].getsockname()[1]
+    latencies = []
+    for _ in range(args.connections):
+        started_at = time.perf_counter()
+        reader, writer = await socks5_client(relay.port, "127.0.0.1", echo_port)
+        await echo(reader, writer, b"ping")
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        writer.close()
+    latencies.sort()
+    print(f"connection  p50 {latencies[len(latencies) // 2]:.2f}ms "
+          f"p95 {latencies[max(int(len(latencies) * 0.95) - 1, 0)]:.2f}ms {relay.stats()}")
+
+    await relay.close()
+    await asyncio.sleep(0.1)  # let the stand-ins see the relay connections closed
+    await stand_in.close()
+    for server in (sink, echo_):
+        server.close()
+        await server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=256)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--buffer-size", type=int, default=256 * 1024)
+    parser.add_argument("--pool-size", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from macos_proxy_settings.testing import (
+    FAKE_NETWORKSETUP,
+    FAKE_SCUTIL,
+    install_stand_in,
+    make_store,
+    stand_in_environ,
+    write_store,
+)
+
+
+def measure(run: Callable[[], object], runs: int) -> Dict[str, float]:
+    """
+    Call run once to warm up, then runs times.
+
+    :return: latency statistics in milliseconds
+    """
+    run()
+    latencies: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "runs": runs,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+    }
+
+
+def install_stand_ins(
+        tmp_path: Path,
+        latency: float,
+        networkservices: Optional[List[str]] = None,
+        proxies: Optional[dict] = None,
+) -> None:
+    """
+    Put stand-in networksetup and scutil first on PATH of this process, serving a store in tmp_path.
+    """
+    install_stand_in(bin_dir=tmp_path / "bin", name="networksetup", source=FAKE_NETWORKSETUP)
+    install_stand_in(bin_dir=tmp_path / "bin", name="scutil", source=FAKE_SCUTIL)
+    store = make_store(
+        networkservices=networkservices or ["Wi-Fi"],
+        proxies={"SOCKSEnable": 1, "SOCKSProxy": "127.0.0.1", "SOCKSPort": 1080} if proxies is None else proxies,
+    )
+    write_store(path=tmp_path / "store.json", store=store)
+    environ = stand_in_environ(bin_dir=tmp_path / "bin")
+    environ["FAKE_PROXY_STORE"] = str(tmp_path / "store.json")
+    environ["FAKE_LATENCY"] = str(latency)
+    os.environ.update(environ)
+
+
+def format_result(result: Dict[str, float]) -> str:
+    return " ".join(
+        f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in result.items()
+    )
@@ -0,0 +1,94 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from macos_proxy_settings.simple_settings import ProxyTypes
+
+if TYPE_CHECKING:
+    from pac import PacRule
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class KeyCommand:
+    enabled: bool
+    networkservice: str
+    proxy_type: ProxyTypes
+    domain: str
+    port: str
+    username: str = ""
+    password: str = ""
+    # (domain, port) of more proxies equivalent to domain and port, the fastest of them is applied
+    endpoints: Tuple[Tuple[str, str], ...] = ()
+    # split routing of the PAC script served with PAC_SERVER_ENABLED
+    pac_rules: Tuple["PacRule", ...] = ()
+    # file with the bypass domains of networkservice, written when the key enables the proxy
+    bypass_domains_file: str = ""
+
+
+class KeyCommandQueue:
+    """
+    Runs key commands on one worker thread per context, so a slow command only blocks its own key.
+    A command submitted while another one is pending replaces it: only the latest one runs.
+    A pending command equal to the one just applied is skipped.
+
+    execute(context, command) applies the command and returns True on success.
+    """
+
+    def __init__(self, execute: Callable[[str, KeyCommand], bool]):
+        self.execute = execute
+        self.executed_count = 0
+        self.coalesced_count = 0
+        self._lock = threading.Lock()
+        self._pending: Dict[str, KeyCommand] = {}
+        self._latest: Dict[str, KeyCommand] = {}
+        self._workers: Dict[str, threading.Thread] = {}
+
+    def submit(self, context: str, command: KeyCommand) -> None:
+        with self._lock:
+            if context in self._pending:
+                self.coalesced_count += 1
+            self._pending[context] = command
+            self._latest[context] = command
+            if context in self._workers:
+                return
+            worker = threading.Thread(target=self._run, args=(context,), daemon=True)
+            self._workers[context] = worker
+        worker.start()
+
+    def latest(self, context: str) -> Optional[KeyCommand]:
+        """
+        :return: the last command submitted for a context that is still busy, None if it is idle
+        """
+        with self._lock:
+            return self._latest.get(context)
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+    def _run(self, context: str) -> None:
+        applied: Optional[KeyCommand] = None
+        while True:
+            with self._lock:
+                command = self._pending.pop(context, None)
+                if command is None:
+                    del self._workers[context]
+                    del self._latest[context]
+                    return
+            if command == applied:
+                with self._lock:
+                    self.coalesced_count += 1
+                continue
+            try:
+                success = self.execute(context, command)
+            except Exception as err:
+                logger.exception(err)
+                success = False
+            with self._lock:
+                self.executed_count += 1
+            applied = command if success else None
@@ -0,0 +1,97 @@
+"""
+Selection of the fastest of several equivalent proxies by racing connect probes.
+"""
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from prober import DnsCache, ProbeError, ProbeHandshakes, ProbeTarget, probe
+
+logger = logging.getLogger(__name__)
+
+Endpoint = Tuple[str, str]  # (domain, port)
+
+# host:port or [ipv6]:port, separated by commas, semicolons or whitespace
+ENDPOINT_REGEX = re.compile(r"^(?:\[(?P<ipv6>[^\]]+)\]|(?P<host>[^:\[\]]+)):(?P<port>\d{1,5})$")
+ENDPOINTS_SEPARATOR_REGEX = re.compile(r"[\s,;]+")
+
+
+@dataclass(frozen=True)
+class EndpointSelection:
+    domain: str
+    port: str
+    latency_ms: float
+
+    @property
+    def endpoint(self) -> Endpoint:
+        return self.domain, self.port
+
+
+def parse_endpoints(text: str) -> List[Endpoint]:
+    """
+    :param text: endpoints like "10.0.0.1:1080, proxy.example.com:1080, [fd00::1]:1080"
+    :return: endpoints in the order of text, without duplicates
+    :raises ValueError: if an endpoint is not host:port
+    """
+    res: List[Endpoint] = []
+    for item in ENDPOINTS_SEPARATOR_REGEX.split(text.strip()):
+        if not item:
+            continue
+        match = ENDPOINT_REGEX.match(item)
+        if match is None or not 0 < int(match.group("port")) < 65536:
+            raise ValueError(f"Bad endpoint {item}, expected host:port")
+        endpoint = (match.group("ipv6") or match.group("host"), match.group("port"))
+        if endpoint not in res:
+            res.append(endpoint)
+    return res
+
+
+async def race_endpoints(
+        endpoints: List[Endpoint],
+        handshake: ProbeHandshakes,
+        deadline: float,
+) -> Optional[EndpointSelection]:
+    """
+    Probe all endpoints at once and return the first one to answer.
+    An endpoint that refuses the connection drops out right away, the others keep racing.
+
+    :param deadline: seconds to wait for an answer
+    :return: the fastest endpoint, None if none has answered before the deadline
+    """
+    dns_cache = DnsCache()
+
+    async def probe_endpoint(endpoint: Endpoint) -> Tuple[Endpoint, Optional[float]]:
+        domain, port = endpoint
+        target = ProbeTarget(domain=domain, port=int(port), handshake=handshake)
+        try:
+            return endpoint, await probe(target=target, dns_cache=dns_cache, timeout=deadline)
+        except (ProbeError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as err:
+            logger.debug(f"Endpoint {domain}:{port} is down: {str(err) or type(err).__name__}")
+            return endpoint, None
+
+    tasks = [asyncio.ensure_future(probe_endpoint(endpoint)) for endpoint in endpoints]
+    try:
+        for future in asyncio.as_completed(tasks, timeout=deadline):
+            (domain, port), latency_ms = await future
+            if latency_ms is not None:
+                return EndpointSelection(domain=domain, port=port, latency_ms=latency_ms)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return None
+
+
+def select_fastest(
+        endpoints: List[Endpoint],
+        handshake: ProbeHandshakes = ProbeHandshakes.TCP,
+        deadline: float = 1.5,
+) -> Optional[EndpointSelection]:
+    """
+    Blocking race_endpoints for the key command workers.
+    """
+    return asyncio.run(race_endpoints(endpoints=endpoints, handshake=handshake, deadline=deadline))
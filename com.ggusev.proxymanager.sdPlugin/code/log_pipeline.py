@@ -0,0 +1,160 @@
+"""
+Logging that never writes to disk on the threads doing the work.
+
+Records are put on a queue by QueueingHandler and written to the log file by the thread of a QueueListener.
+RateLimitFilter drops records repeating the same message from the same place, like a get_proxy failure
+logged on every monitoring iteration.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Callable, Hashable, Tuple, Union
+
+# the format of the streamdeck_sdk log file handler
+LOG_FORMAT = "%(asctime)s - [%(levelname)s] - %(name)s - (%(filename)s).%(funcName)s(%(lineno)d): %(message)s"
+
+
+def parse_log_level(level: Union[int, str]) -> int:
+    """
+    :param level: logging level or its name in any case, like "info"
+    """
+    if isinstance(level, int):
+        return level
+    res = logging.getLevelName(level.strip().upper())
+    if not isinstance(res, int):
+        raise ValueError(f"Bad log level {level}")
+    return res
+
+
+def set_log_level(level: Union[int, str]) -> int:
+    """
+    Change the level of the root logger at runtime.
+
+    :return: the new level
+    """
+    level = parse_log_level(level)
+    logging.getLogger().setLevel(level)
+    return level
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops a record if the same message has been logged from the same line less than interval seconds ago.
+    The next record that passes says how many have been dropped.
+
+    :param interval: seconds, 0 lets every record pass
+    :param max_keys: number of messages remembered, least recently logged are forgotten
+    """
+
+    def __init__(self, interval: float, max_keys: int = 1024, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.clock = clock
+        self.suppressed_count = 0
+        self._lock = threading.Lock()
+        # key -> (time the message passed, records dropped since)
+        self._passed: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+        message = record.getMessage()
+        key = (record.name, record.levelno, record.pathname, record.lineno, message)
+        now = self.clock()
+        with self._lock:
+            passed = self._passed.get(key)
+            if passed is not None and now - passed[0] < self.interval:
+                self._passed[key] = (passed[0], passed[1] + 1)
+                self.suppressed_count += 1
+                return False
+            self._passed[key] = (now, 0)
+            self._passed.move_to_end(key)
+            while len(self._passed) > self.max_keys:
+                self._passed.popitem(last=False)
+        if passed is not None and passed[1]:
+            record.msg = f"{message} ({passed[1]} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class QueueingHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting, tracebacks included, to the listener thread
+    and drops records instead of blocking when the queue is full.
+    """
+
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped_count = 0
+        self._unreported_dropped_count = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        with self._lock:
+            dropped_count, self._unreported_dropped_count = self._unreported_dropped_count, 0
+        if dropped_count:
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": logging.getLevelName(logging.WARNING),
+                    "msg": f"{dropped_count} log records dropped, the log file is written too slowly",
+                }))
+            except queue.Full:
+                with self._lock:
+                    self._unreported_dropped_count += dropped_count
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+                self._unreported_dropped_count += 1
+
+
+def configure_logging(
+        log_file: Path,
+        level: Union[int, str] = logging.DEBUG,
+        rate_limit_interval: float = 60,
+        queue_size: int = 10000,
+        max_bytes: int = 3 * 1024 * 1024,
+        backup_count: int = 1,
+) -> QueueListener:
+    """
+    Log to a rotating log_file through a queue, replacing the log file handler of streamdeck_sdk.
+    The listener is stopped at exit, after the queued records have been written.
+
+    :param rate_limit_interval: seconds a repeated message is dropped for, see RateLimitFilter
+    :param queue_size: records waiting to be written, more are dropped
+    :return: the started listener writing the log file
+    """
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_file,
+        mode="a",
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    queue_: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(queue_, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queueing_handler = QueueingHandler(queue_)
+    queueing_handler.addFilter(RateLimitFilter(interval=rate_limit_interval))
+    root_logger = logging.getLogger()
+    root_logger.addHandler(queueing_handler)
+    set_log_level(level)
+    return listener
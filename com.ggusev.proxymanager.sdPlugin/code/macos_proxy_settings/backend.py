@@ -0,0 +1,50 @@
+from typing import List, Protocol
+
+from .networksetup import Networkservice, ProxyInfo
+
+
+class ProxyBackend(Protocol):
+    """
+    Reads and writes the system proxy settings with networksetup commands.
+    The networksetup module is the implementation that runs the networksetup binary.
+
+    Set commands return the output of networksetup, which is empty on success.
+    """
+
+    def get_proxy(self, command: str, networkservice: str) -> ProxyInfo:
+        """
+        :param command: getwebproxy, getsecurewebproxy or getsocksfirewallproxy
+        """
+        ...
+
+    def set_proxy(
+            self,
+            command: str,
+            networkservice: str,
+            domain: str,
+            port: str,
+            username: str = "",
+            password: str = "",
+    ) -> str:
+        """
+        :param command: setwebproxy, setsecurewebproxy or setsocksfirewallproxy
+        """
+        ...
+
+    def set_proxy_state(self, command: str, networkservice: str, enabled: bool) -> str:
+        """
+        :param command: setwebproxystate, setsecurewebproxystate or setsocksfirewallproxystate
+        """
+        ...
+
+    def getproxybypassdomains(self, networkservice: str) -> List[str]:
+        ...
+
+    def setproxybypassdomains(self, networkservice: str, domains: List[str]) -> str:
+        """
+        :param domains: the whole list, an empty one clears it
+        """
+        ...
+
+    def listnetworkserviceorder(self) -> List[Networkservice]:
+        ...
@@ -0,0 +1,209 @@
+"""
+Proxy bypass domain lists of thousands of entries.
+
+Entries are normalised and deduplicated, and the ones covered by a wildcard entry are dropped
+with a trie of reversed labels. networksetup replaces the whole list on every write,
+so a list is written in one run and only if it differs from the current one.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import simple_settings
+
+WILDCARD = "*"
+# entries of a file are separated by newlines, commas or whitespace, "#" starts a comment
+BYPASS_FILE_SEPARATOR_REGEX = re.compile(r"[\s,]+")
+LABEL_PATTERN = r"[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9_])?"
+LABEL_REGEX = re.compile(f"^{LABEL_PATTERN}$")
+# a normalised ASCII domain or wildcard domain, in one match instead of one per label
+DOMAIN_REGEX = re.compile(rf"^(?:\*\.)?(?:{LABEL_PATTERN}\.)*{LABEL_PATTERN}$")
+# IPv4 and IPv6 addresses and networks, "169.254/16" included
+ADDRESS_REGEX = re.compile(r"^(?:[0-9.]+|[0-9a-f:.]*:[0-9a-f:.]*)(?:/\d{1,3})?$")
+
+
+@dataclass
+class BypassDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+def normalize_entry(entry: str) -> Optional[str]:
+    """
+    :param entry: "Example.COM.", ".example.com", "*.example.com", "bücher.example", "10.0.0.0/8"
+    :return: entry lowercased, without a trailing dot, with "*." instead of a leading dot and
+        internationalised labels in punycode, None if entry is empty
+    :raises ValueError: if entry is neither a domain, a wildcard domain nor an address
+    """
+    entry = entry.strip().lower().rstrip(".")
+    if not entry:
+        return None
+    if DOMAIN_REGEX.match(entry) or entry == WILDCARD or ADDRESS_REGEX.match(entry):
+        return entry
+    if entry.startswith("."):
+        entry = WILDCARD + entry
+    labels = entry.split(".")
+    start = 1 if labels[0] == WILDCARD else 0
+    for index in range(start, len(labels)):
+        label = labels[index]
+        if not label.isascii():
+            try:
+                label = labels[index] = label.encode("idna").decode("ascii")
+            except UnicodeError:
+                raise ValueError(f"Bad bypass domain {entry}") from None
+        if not LABEL_REGEX.match(label):
+            raise ValueError(f"Bad bypass domain {entry}")
+    if start == len(labels):
+        raise ValueError(f"Bad bypass domain {entry}")
+    return ".".join(labels)
+
+
+class DomainTrie:
+    """
+    Domains by their labels from the last one: "a.example.com" is com -> example -> a.
+    "*.example.com" marks the example node, covering every domain below it.
+    """
+
+    EXACT = ""  # marks a node as a domain of its own
+
+    def __init__(self):
+        self._root: Dict[str, dict] = {}
+
+    def add(self, entry: str) -> bool:
+        """
+        :param entry: normalised domain or wildcard domain
+        :return: False if entry is covered already
+        """
+        if self.covers(entry):
+            return False
+        labels = entry.split(".")
+        node = self._root
+        wildcard = labels[0] == WILDCARD
+        for label in reversed(labels[1:] if wildcard else labels):
+            node = node.setdefault(label, {})
+        node[WILDCARD if wildcard else self.EXACT] = {}
+        return True
+
+    def covers(self, entry: str) -> bool:
+        """
+        :return: whether entry has been added or is below a wildcard domain
+        """
+        labels = entry.split(".")
+        wildcard = labels[0] == WILDCARD
+        if wildcard:
+            labels = labels[1:]
+        node = self._root
+        for label in reversed(labels):
+            if WILDCARD in node:
+                return True
+            node = node.get(label)
+            if node is None:
+                return False
+        return (WILDCARD if wildcard else self.EXACT) in node
+
+
+def collapse(entries: Iterable[str]) -> List[str]:
+    """
+    Normalise entries, drop duplicates and the domains covered by a wildcard domain.
+    "*.example.com" covers "a.example.com" and "*.a.example.com", not "example.com".
+
+    :return: the remaining entries in the order of entries
+    :raises ValueError: if an entry is neither a domain, a wildcard domain nor an address
+    """
+    normalized: Dict[str, None] = {}
+    for entry in entries:
+        entry = normalize_entry(entry)
+        if entry is not None:
+            normalized[entry] = None
+    return _collapse_normalized(normalized=normalized)
+
+
+def _collapse_normalized(normalized: Dict[str, None]) -> List[str]:
+    trie = DomainTrie()
+    # shallow wildcards first, so the deeper ones they cover are dropped
+    wildcards = sorted((entry for entry in normalized if entry.startswith(WILDCARD)), key=lambda e: e.count("."))
+    kept = {entry for entry in wildcards if trie.add(entry)}
+    return [
+        entry for entry in normalized
+        if entry in kept or not entry.startswith(WILDCARD) and (ADDRESS_REGEX.match(entry) or not trie.covers(entry))
+    ]
+
+
+def diff(current: List[str], desired: List[str]) -> BypassDiff:
+    """
+    Compare as sets, the order of a bypass list does not matter.
+    """
+    current_set = set(_normalize_current(current))
+    desired_set = set(desired)
+    return BypassDiff(
+        added=[entry for entry in desired if entry not in current_set],
+        removed=sorted(current_set - desired_set),
+    )
+
+
+def _normalize_current(current: List[str]) -> List[str]:
+    res = []
+    for entry in current:
+        try:
+            entry = normalize_entry(entry)
+        except ValueError:
+            pass  # kept as it is, so it is removed
+        if entry is not None:
+            res.append(entry)
+    return res
+
+
+_load_lock = threading.Lock()
+# path -> ((st_mtime_ns, st_size), collapsed entries)
+_loaded: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+
+
+def load_file(path: Path) -> List[str]:
+    """
+    Read and collapse a bypass list file, once per change of the file.
+
+    :raises ValueError: with the line of a bad entry
+    :raises OSError: if the file cannot be read
+    """
+    path = path.expanduser()
+    stat = path.stat()
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _load_lock:
+        loaded = _loaded.get(str(path))
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    normalized: Dict[str, None] = {}
+    for line_number, line in enumerate(path.read_text(encoding="utf-8").splitlines(), start=1):
+        for entry in BYPASS_FILE_SEPARATOR_REGEX.split(line.split("#", 1)[0]):
+            try:
+                entry = normalize_entry(entry)
+            except ValueError as err:
+                raise ValueError(f"{path}:{line_number}: {err}") from None
+            if entry is not None:
+                normalized[entry] = None
+    res = _collapse_normalized(normalized=normalized)
+    with _load_lock:
+        _loaded[str(path)] = (version, res)
+    return res
+
+
+def apply_bypass_domains(networkservice: str, domains: List[str]) -> BypassDiff:
+    """
+    Write domains as the bypass list of networkservice through the proxy backend
+    if they differ from the current list.
+
+    :param domains: entries returned by collapse or load_file
+    :return: the difference written, nothing has been written if it has not changed
+    :raises ValueError: if domains do not fit in the arguments of networksetup or the backend fails to write them
+    """
+    current = simple_settings.get_bypass_domains(networkservice=networkservice)
+    res = diff(current=current, desired=domains)
+    if res.changed:
+        simple_settings.set_bypass_domains(networkservice=networkservice, domains=domains)
+    return res
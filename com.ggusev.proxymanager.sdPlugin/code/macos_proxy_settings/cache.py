@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .networksetup import ProxyInfo
+
+
+class ProxyInfoCache:
+    """
+    ProxyInfo cache with a TTL and LRU eviction once max_size entries are stored.
+    A ttl of 0 disables caching.
+
+    Every change of a key moves it to a new generation. A read put with the generation
+    taken before the read is dropped if the key changed meanwhile, so a slow read can not
+    overwrite a newer write.
+    """
+
+    def __init__(
+            self,
+            ttl: float = 1,
+            max_size: int = 256,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, ProxyInfo]]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._next_generation = 1
+
+    def get(self, key: Hashable) -> Optional[ProxyInfo]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, proxy_info = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return proxy_info
+
+    def generation(self, key: Hashable) -> int:
+        """
+        :return: current generation of key, to take before reading what is put
+        """
+        with self._lock:
+            return self._generations.setdefault(key, 0)
+
+    def put(self, key: Hashable, proxy_info: ProxyInfo, generation: Optional[int] = None) -> None:
+        """
+        :param generation: generation of key taken before proxy_info was read, None if proxy_info was just written
+        """
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key, 0):
+                return
+            self._entries[key] = (self.clock() + self.ttl, proxy_info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_enabled(self, key: Hashable, enabled: bool) -> None:
+        """
+        Update the enabled flag of a cached entry, keeping its expiry.
+        """
+        with self._lock:
+            self._bump([key])
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            expires_at, proxy_info = entry
+            self._entries[key] = (expires_at, replace(proxy_info, enabled=enabled))
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            keys = list(keys)
+            self._bump(keys)
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            self._bump([key for key in self._generations if predicate(key)])
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._bump(list(self._generations))
+            self._entries.clear()
+
+    def _bump(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            self._generations[key] = self._next_generation
+            self._next_generation += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,122 @@
+"""
+Record networksetup runs to a JSONL corpus and serve them back without networksetup.
+
+Every line of a corpus is one run:
+{"argv": [...], "stdout": "...", "returncode": 0, "latency": 0.03}
+Passwords are never written, see redact_argv.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .networksetup import (
+    Networkservice,
+    ProxyInfo,
+    parse_listnetworkserviceorder,
+    parse_proxy_info,
+    parse_proxybypassdomains,
+)
+
+REDACTED = "<redacted>"
+# networksetup -set*proxy <networkservice> <domain> <port> on <username> <password>
+PASSWORD_ARGV_INDEX = 7
+PASSWORD_COMMANDS = {"-setwebproxy", "-setsecurewebproxy", "-setsocksfirewallproxy"}
+
+
+def redact_argv(argv: List[str]) -> List[str]:
+    """
+    Replace the password of the set*proxy commands that turn authentication on, other runs are kept as they are.
+    """
+    if len(argv) > PASSWORD_ARGV_INDEX and argv[1] in PASSWORD_COMMANDS and argv[PASSWORD_ARGV_INDEX - 2] == "on":
+        return argv[:PASSWORD_ARGV_INDEX] + [REDACTED] + argv[PASSWORD_ARGV_INDEX + 1:]
+    return list(argv)
+
+
+def load_corpus(path: Path) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class CorpusRecorder:
+    """
+    Appends networksetup runs to a JSONL corpus, see networksetup.set_recorder.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(self, argv: List[str], stdout: str, returncode: int, latency: float) -> None:
+        line = json.dumps({
+            "argv": redact_argv(argv),
+            "stdout": stdout,
+            "returncode": returncode,
+            "latency": round(latency, 6),
+        })
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class ReplayBackend:
+    """
+    ProxyBackend that serves the runs of a corpus instead of running networksetup.
+
+    Runs are matched by argv. Runs with the same argv are served in the recorded order,
+    the last one is repeated once they are used up. Unrecorded commands raise KeyError.
+
+    :param path: JSONL corpus written by CorpusRecorder
+    :param timings: sleep for the recorded latency of every run
+    """
+
+    def __init__(self, path: Path, timings: bool = True):
+        self.timings = timings
+        self._lock = threading.Lock()
+        self._runs: Dict[Tuple[str, ...], List[dict]] = defaultdict(list)
+        self._positions: Dict[Tuple[str, ...], int] = defaultdict(int)
+        for run in load_corpus(path):
+            self._runs[tuple(run["argv"])].append(run)
+
+    def get_proxy(self, command: str, networkservice: str) -> ProxyInfo:
+        return parse_proxy_info(self._replay([f"-{command}", networkservice]))
+
+    def set_proxy(
+            self,
+            command: str,
+            networkservice: str,
+            domain: str,
+            port: str,
+            username: str = "",
+            password: str = "",
+    ) -> str:
+        if username and password:
+            return self._replay([f"-{command}", networkservice, domain, port, "on", username, password])
+        return self._replay([f"-{command}", networkservice, domain, port, "off"])
+
+    def set_proxy_state(self, command: str, networkservice: str, enabled: bool) -> str:
+        return self._replay([f"-{command}", networkservice, "on" if enabled else "off"])
+
+    def getproxybypassdomains(self, networkservice: str) -> List[str]:
+        return parse_proxybypassdomains(self._replay(["-getproxybypassdomains", networkservice]))
+
+    def setproxybypassdomains(self, networkservice: str, domains: List[str]) -> str:
+        return self._replay(["-setproxybypassdomains", networkservice, *(domains or ["Empty"])])
+
+    def listnetworkserviceorder(self) -> List[Networkservice]:
+        return parse_listnetworkserviceorder(self._replay(["-listnetworkserviceorder"]))
+
+    def _replay(self, args: List[str]) -> str:
+        key = tuple(redact_argv(["networksetup", *args]))
+        with self._lock:
+            runs = self._runs.get(key)
+            if not runs:
+                raise KeyError(f"{' '.join(key)} is not in the corpus")
+            position = self._positions[key]
+            self._positions[key] = min(position + 1, len(runs) - 1)
+        run = runs[position]
+        if self.timings:
+            time.sleep(run["latency"])
+        return run["stdout"]
@@ -0,0 +1,92 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Optional, Set, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_max_workers = 4
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure_executor(max_workers: int) -> None:
+    """
+    :param max_workers: size of the executor shared by all concurrent networksetup calls
+    """
+    global _executor, _max_workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+        _max_workers = max_workers
+
+
+def run_concurrently(*calls: Callable[[], T]) -> List[T]:
+    """
+    Run calls at the same time and return their results in order.
+    If calls fail, the error of the first failed call is raised once all of them have finished.
+    Calls made from a worker of the executor run one after the other, so nested calls can not deadlock.
+    """
+    if len(calls) < 2 or _in_worker():
+        return [call() for call in calls]
+    executor = _get_executor()
+    futures = [executor.submit(_run_in_worker, call) for call in calls]
+    wait(futures)
+    return [future.result() for future in futures]
+
+
+def map_concurrently(
+        func: Callable[[T], R],
+        items: Iterable[T],
+        max_concurrency: int,
+) -> List["Future[R]"]:
+    """
+    Call func for every item with at most max_concurrency calls running at a time.
+
+    :return: completed futures in the order of items
+    """
+    items = list(items)
+    if max_concurrency <= 1 or len(items) < 2 or _in_worker():
+        futures = []
+        for item in items:
+            future: Future = Future()
+            try:
+                future.set_result(func(item))
+            except Exception as err:
+                future.set_exception(err)
+            futures.append(future)
+        return futures
+
+    executor = _get_executor()
+    futures = []
+    running: Set[Future] = set()
+    for item in items:
+        if len(running) >= max_concurrency:
+            _, running = wait(running, return_when=FIRST_COMPLETED)
+        future = executor.submit(_run_in_worker, func, item)
+        futures.append(future)
+        running.add(future)
+    wait(running)
+    return futures
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="networksetup")
+        return _executor
+
+
+def _in_worker() -> bool:
+    return getattr(_local, "in_worker", False)
+
+
+def _run_in_worker(func: Callable, *args):
+    _local.in_worker = True
+    try:
+        return func(*args)
+    finally:
+        _local.in_worker = False
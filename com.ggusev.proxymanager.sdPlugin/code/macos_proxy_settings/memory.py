@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .networksetup import Networkservice, ProxyInfo
+
+INVALID_PARAMETERS_ERROR = "** Error: The parameters were not valid."
+INJECTED_ERROR = "** Error: Injected failure."
+
+# networksetup command -> proxy it works with
+COMMAND_TO_PROXY: Dict[str, str] = {
+    "getwebproxy": "webproxy",
+    "setwebproxy": "webproxy",
+    "setwebproxystate": "webproxy",
+    "getsecurewebproxy": "securewebproxy",
+    "setsecurewebproxy": "securewebproxy",
+    "setsecurewebproxystate": "securewebproxy",
+    "getsocksfirewallproxy": "socksfirewallproxy",
+    "setsocksfirewallproxy": "socksfirewallproxy",
+    "setsocksfirewallproxystate": "socksfirewallproxy",
+}
+
+
+class MemoryBackend:
+    """
+    ProxyBackend that keeps the proxy settings of simulated networkservices in memory.
+
+    :param networkservices: names of the simulated networkservices, all proxies start disabled
+    :param latency: seconds every call sleeps, like the time networksetup takes to run
+    :param failure_rate: probability of a call failing. Set commands return an error as networksetup does,
+        get_proxy and listnetworkserviceorder raise ValueError.
+    :param seed: seed of the failure injection
+    """
+
+    def __init__(
+            self,
+            networkservices: Iterable[str],
+            latency: float = 0,
+            failure_rate: float = 0,
+            seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.call_count: Counter = Counter()
+        self._random = random.Random(seed)
+        self._fail_next = 0
+        self._lock = threading.Lock()
+        self._networkservices: List[str] = list(networkservices)
+        self._proxies: Dict[Tuple[str, str], ProxyInfo] = {}
+        self._bypass_domains: Dict[str, List[str]] = {networkservice: [] for networkservice in self._networkservices}
+        for networkservice in self._networkservices:
+            for proxy in set(COMMAND_TO_PROXY.values()):
+                self._proxies[(proxy, networkservice)] = ProxyInfo(
+                    enabled=False,
+                    server="",
+                    port="0",
+                    authenticated=False,
+                )
+
+    def fail_next(self, count: int = 1) -> None:
+        """
+        Make the next count calls fail.
+        """
+        with self._lock:
+            self._fail_next = count
+
+    def get_proxy(self, command: str, networkservice: str) -> ProxyInfo:
+        error = self._call(command)
+        if error:
+            raise ValueError(error)
+        with self._lock:
+            res = self._proxies.get(self._key(command, networkservice))
+        if res is None:
+            raise ValueError(INVALID_PARAMETERS_ERROR)
+        return ProxyInfo(enabled=res.enabled, server=res.server, port=res.port, authenticated=res.authenticated)
+
+    def set_proxy(
+            self,
+            command: str,
+            networkservice: str,
+            domain: str,
+            port: str,
+            username: str = "",
+            password: str = "",
+    ) -> str:
+        error = self._call(command)
+        if error:
+            return error
+        key = self._key(command, networkservice)
+        with self._lock:
+            if key not in self._proxies:
+                return INVALID_PARAMETERS_ERROR
+            self._proxies[key] = ProxyInfo(
+                enabled=True,
+                server=domain,
+                port=port,
+                authenticated=bool(username and password),
+            )
+        return ""
+
+    def set_proxy_state(self, command: str, networkservice: str, enabled: bool) -> str:
+        error = self._call(command)
+        if error:
+            return error
+        key = self._key(command, networkservice)
+        with self._lock:
+            if key not in self._proxies:
+                return INVALID_PARAMETERS_ERROR
+            self._proxies[key].enabled = enabled
+        return ""
+
+    def getproxybypassdomains(self, networkservice: str) -> List[str]:
+        error = self._call("getproxybypassdomains")
+        if error:
+            raise ValueError(error)
+        with self._lock:
+            res = self._bypass_domains.get(networkservice)
+        if res is None:
+            raise ValueError(INVALID_PARAMETERS_ERROR)
+        return list(res)
+
+    def setproxybypassdomains(self, networkservice: str, domains: List[str]) -> str:
+        error = self._call("setproxybypassdomains")
+        if error:
+            return error
+        with self._lock:
+            if networkservice not in self._bypass_domains:
+                return INVALID_PARAMETERS_ERROR
+            self._bypass_domains[networkservice] = list(domains)
+        return ""
+
+    def listnetworkserviceorder(self) -> List[Networkservice]:
+        error = self._call("listnetworkserviceorder")
+        if error:
+            raise ValueError(error)
+        return [
+            Networkservice(index=index, networkservice=networkservice, hardware_port=networkservice, device=f"en{index}")
+            for index, networkservice in enumerate(self._networkservices, start=1)
+        ]
+
+    def _call(self, command: str) -> str:
+        """
+        Count the call, wait for the latency and return an error if the call has to fail.
+        """
+        with self._lock:
+            self.call_count[command] += 1
+            fail = self._fail_next > 0 or self._random.random() < self.failure_rate
+            self._fail_next = max(self._fail_next - 1, 0)
+        if self.latency:
+            time.sleep(self.latency)
+        return INJECTED_ERROR if fail else ""
+
+    @staticmethod
+    def _key(command: str, networkservice: str) -> Tuple[str, str]:
+        try:
+            return COMMAND_TO_PROXY[command], networkservice
+        except KeyError:
+            raise ValueError(f"Bad command {command}") from None
@@ -0,0 +1,128 @@
+import bisect
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+# upper bounds of the latency buckets, in milliseconds. The last bucket has no bound.
+BUCKET_BOUNDS_MS: List[float] = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def add(self, duration_ms: float, error: bool) -> None:
+        self.count += 1
+        self.error_count += error
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, duration_ms)] += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        :return: upper bound of the bucket holding the percentile, max_ms for the last bucket
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.error_count,
+            "total_ms": round(self.total_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": {
+                f"le_{bound:g}" if index < len(BUCKET_BOUNDS_MS) else "inf": count
+                for index, (bound, count) in enumerate(zip(BUCKET_BOUNDS_MS + [float("inf")], self.buckets))
+                if count
+            },
+        }
+
+
+class Metrics:
+    """
+    Counts and latency histograms by name. While disabled nothing is recorded,
+    and the instrumented code only pays for checking enabled.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._since = time.time()
+
+    def record(self, name: str, duration: float, error: bool = False) -> None:
+        """
+        :param duration: seconds
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(duration_ms=duration * 1000, error=error)
+
+    def summary(self, reset: bool = False) -> dict:
+        """
+        :param reset: start a new interval, so every summary covers the time since the previous one
+        """
+        now = time.time()
+        with self._lock:
+            histograms, since = self._histograms, self._since
+            if reset:
+                self._histograms, self._since = {}, now
+            else:
+                histograms = dict(histograms)
+        return {
+            "since": since,
+            "until": now,
+            "spawns": sum(histogram.count for name, histogram in histograms.items()
+                          if name.startswith("networksetup.")),
+            "metrics": {name: histograms[name].to_dict() for name in sorted(histograms)},
+        }
+
+
+METRICS = Metrics()
+
+
+def configure_metrics(enabled: bool) -> None:
+    METRICS.enabled = enabled
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Record the duration of every call of the decorated function under name, raising calls as errors.
+    """
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            error = True
+            try:
+                result = func(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                METRICS.record(name, time.perf_counter() - start, error=error)
+
+        return wrapper
+
+    return decorator
@@ -1,20 +1,33 @@
+import os
 import re
 import subprocess
+import time
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-PROXY_ENABLED_PATTERN = re.compile(r"^Enabled: (.*)$", re.MULTILINE)
-PROXY_SERVER_PATTERN = re.compile(r"^Server: (.*)$", re.MULTILINE)
-PROXY_PORT_PATTERN = re.compile(r"^Port: (.*)$", re.MULTILINE)
-LISTNETWORKSERVICEORDER_PATTERN = re.compile(r"\((\d)\) (.*)\n\(Hardware Port: (.*), Device: (.*)\)", re.MULTILINE)
+from .metrics import METRICS
+
+if TYPE_CHECKING:
+    from .corpus import CorpusRecorder
+
+# all ProxyInfo fields in one scan, used by parse_proxy_info
+PROXY_INFO_PATTERN = re.compile(r"^(Enabled|Server|Port|Authenticated Proxy Enabled): (.*)$", re.MULTILINE)
+AUTOPROXY_INFO_PATTERN = re.compile(r"^(URL|Enabled): (.*)$", re.MULTILINE)
+NO_PROXYBYPASSDOMAINS_PREFIX = "There aren't any bypass domains set on"
+NETWORKSETUP_ERROR_PATTERN = re.compile(r"^\*\* Error|is not a recognized network service", re.MULTILINE)
+# left to the environment and the pointers of argv, like xargs does
+ARGV_HEADROOM = 2048
+# a disabled networkservice is listed with (*) instead of its place in the service order
+LISTNETWORKSERVICEORDER_PATTERN = re.compile(r"\((\d+|\*)\) (.*)\n\(Hardware Port: (.*), Device: (.*)\)", re.MULTILINE)
 
 
 @dataclass
 class Networkservice:
-    index: int
+    index: Optional[int]  # None if the networkservice is disabled
     networkservice: str
     hardware_port: str
     device: str
+    enabled: bool = True
 
 
 @dataclass
@@ -22,6 +35,72 @@ class ProxyInfo:
     enabled: bool
     server: str
     port: str
+    authenticated: Optional[bool] = None  # None if the backend does not report it
+
+
+@dataclass
+class AutoProxyInfo:
+    url: str  # empty if not set
+    enabled: bool
+
+
+_recorder: Optional["CorpusRecorder"] = None
+
+
+def set_recorder(recorder: Optional["CorpusRecorder"]) -> None:
+    """
+    :param recorder: records every networksetup run to a corpus, None stops recording
+    """
+    global _recorder
+    _recorder = recorder
+
+
+def run_networksetup(
+        command: str,
+        *args: str,
+) -> str:
+    """
+    Run networksetup -<command> <args>, recorded as networksetup.<command> in METRICS.
+    A non-zero exit code counts as an error.
+
+    :return: stdout
+    """
+    argv = ["networksetup", f"-{command}", *args]
+    recorder = _recorder
+    if not METRICS.enabled and recorder is None:
+        p = subprocess.run(argv, stdout=subprocess.PIPE)
+        return p.stdout.decode('utf-8')
+    start = time.perf_counter()
+    p = None
+    try:
+        p = subprocess.run(argv, stdout=subprocess.PIPE)
+    finally:
+        latency = time.perf_counter() - start
+        if METRICS.enabled:
+            METRICS.record(f"networksetup.{command}", latency, error=p is None or p.returncode != 0)
+    stdout = p.stdout.decode('utf-8')
+    if recorder is not None:
+        recorder.record(argv=argv, stdout=stdout, returncode=p.returncode, latency=latency)
+    return stdout
+
+
+def argv_size(argv: List[str]) -> int:
+    """
+    :return: bytes argv takes in the argument space of a new process, the terminating nulls and pointers included
+    """
+    return sum(len(os.fsencode(arg)) + 1 + 8 for arg in argv)
+
+
+def max_argv_size() -> int:
+    """
+    :return: bytes argv can take, ARG_MAX less the environment and ARGV_HEADROOM
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        arg_max = 256 * 1024
+    environ_size = sum(len(os.fsencode(key)) + len(os.fsencode(value)) + 2 + 8 for key, value in os.environ.items())
+    return arg_max - environ_size - ARGV_HEADROOM
 
 
 # base
@@ -29,17 +108,29 @@ def get_proxy(
         command: str,
         networkservice: str
 ) -> ProxyInfo:
-    p = subprocess.run(["networksetup", f"-{command}", networkservice], stdout=subprocess.PIPE)
-    stdout = p.stdout.decode('utf-8')
+    stdout = run_networksetup(command, networkservice)
+    return parse_proxy_info(stdout)
+
 
-    enabled = PROXY_ENABLED_PATTERN.findall(stdout)[0]
-    enabled = True if enabled == "Yes" else False
-    server = PROXY_SERVER_PATTERN.findall(stdout)[0]
-    port = PROXY_PORT_PATTERN.findall(stdout)[0]
+def parse_proxy_info(
+        stdout: str,
+) -> ProxyInfo:
+    fields: Dict[str, str] = {}
+    for name, value in PROXY_INFO_PATTERN.findall(stdout):
+        fields.setdefault(name, value)
+    try:
+        enabled = fields["Enabled"] == "Yes"
+        server = fields["Server"]
+        port = fields["Port"]
+    except KeyError as err:
+        raise ValueError(f"No {err} in networksetup output: {stdout!r}") from None
+    authenticated = fields.get("Authenticated Proxy Enabled")
+    authenticated = authenticated == "1" if authenticated is not None else None
     result = ProxyInfo(
         enabled=enabled,
         server=server,
         port=port,
+        authenticated=authenticated,
     )
     return result
 
@@ -54,15 +145,10 @@ def set_proxy(
 ) -> str:
     if username and password:
         authenticated = "on"
-        p = subprocess.run(
-            ["networksetup", f"-{command}", networkservice, domain, port, authenticated, username, password, ],
-            stdout=subprocess.PIPE)
+        stdout = run_networksetup(command, networkservice, domain, port, authenticated, username, password)
     else:
         authenticated = "off"
-        p = subprocess.run(
-            ["networksetup", f"-{command}", networkservice, domain, port, authenticated, ],
-            stdout=subprocess.PIPE)
-    stdout = p.stdout.decode('utf-8')
+        stdout = run_networksetup(command, networkservice, domain, port, authenticated)
     return stdout
 
 
@@ -72,8 +158,7 @@ def set_proxy_state(
         enabled: bool,
 ) -> str:
     state = "on" if enabled else "off"
-    p = subprocess.run(["networksetup", f"-{command}", networkservice, state], stdout=subprocess.PIPE)
-    stdout = p.stdout.decode('utf-8')
+    stdout = run_networksetup(command, networkservice, state)
     return stdout
 
 
@@ -250,20 +335,133 @@ def setsocksfirewallproxystate(
 
 # endregion socks proxy
 
+# region auto proxy
+def getautoproxyurl(
+        networkservice: str
+) -> AutoProxyInfo:
+    """
+    Display proxy auto-config (url, enabled value) info for <networkservice>.
+
+    :param networkservice: networkservice
+    :return:
+    """
+    stdout = run_networksetup("getautoproxyurl", networkservice)
+    return parse_autoproxy_info(stdout)
+
+
+def parse_autoproxy_info(
+        stdout: str,
+) -> AutoProxyInfo:
+    fields: Dict[str, str] = {}
+    for name, value in AUTOPROXY_INFO_PATTERN.findall(stdout):
+        fields.setdefault(name, value)
+    try:
+        url = fields["URL"]
+        enabled = fields["Enabled"] == "Yes"
+    except KeyError as err:
+        raise ValueError(f"No {err} in networksetup output: {stdout!r}") from None
+    return AutoProxyInfo(url="" if url == "(null)" else url, enabled=enabled)
+
+
+def setautoproxyurl(
+        networkservice: str,
+        url: str,
+) -> str:
+    """
+    Set proxy auto-config to <url> for <networkservice> and turn it on.
+
+    :param networkservice: networkservice, example "Wi-Fi"
+    :param url: url of the PAC file
+    :return: stdout
+    """
+    return run_networksetup("setautoproxyurl", networkservice, url)
+
+
+def setautoproxystate(
+        networkservice: str,
+        enabled: bool,
+) -> str:
+    """
+    Set proxy auto-config to either <on> or <off>.
+
+    :param networkservice: networkservice, example "Wi-Fi"
+    :param enabled:
+    :return:
+    """
+    return set_proxy_state(command="setautoproxystate", networkservice=networkservice, enabled=enabled)
+
+
+# endregion auto proxy
+
+# region bypass domains
+def getproxybypassdomains(
+        networkservice: str
+) -> List[str]:
+    """
+    Display Bypass Domain Names for <networkservice>.
+
+    :param networkservice: networkservice
+    :return: domains, empty if none are set
+    """
+    stdout = run_networksetup("getproxybypassdomains", networkservice)
+    return parse_proxybypassdomains(stdout)
+
+
+def parse_proxybypassdomains(
+        stdout: str,
+) -> List[str]:
+    if stdout.startswith(NO_PROXYBYPASSDOMAINS_PREFIX):
+        return []
+    if NETWORKSETUP_ERROR_PATTERN.search(stdout):
+        raise ValueError(f"networksetup error: {stdout!r}")
+    return [line.strip() for line in stdout.splitlines() if line.strip()]
+
+
+def setproxybypassdomains(
+        networkservice: str,
+        domains: List[str],
+) -> str:
+    """
+    Set the Bypass Domain Name Servers for <networkservice> to <domain1> [domain2] [...],
+    replacing the whole list. An empty domains clears the list.
+
+    :param networkservice: networkservice, example "Wi-Fi"
+    :param domains: domains
+    :return: stdout
+    :raises ValueError: if domains do not fit in the arguments of one networksetup run,
+        the list cannot be written in parts since every run replaces it
+    """
+    args = [networkservice, *domains] if domains else [networkservice, "Empty"]
+    size = argv_size(["networksetup", "-setproxybypassdomains", *args])
+    limit = max_argv_size()
+    if size > limit:
+        raise ValueError(f"{len(domains)} bypass domains take {size} bytes of arguments, "
+                         f"networksetup can be run with {limit}")
+    return run_networksetup("setproxybypassdomains", *args)
+
+
+# endregion bypass domains
+
 
 def listnetworkserviceorder(
 ) -> List[Networkservice]:
-    p = subprocess.run(["networksetup", f"-listnetworkserviceorder", ], stdout=subprocess.PIPE)
-    stdout = p.stdout.decode('utf-8')
+    stdout = run_networksetup("listnetworkserviceorder")
+    return parse_listnetworkserviceorder(stdout)
+
+
+def parse_listnetworkserviceorder(
+        stdout: str,
+) -> List[Networkservice]:
     findall_res = LISTNETWORKSERVICEORDER_PATTERN.findall(stdout)
     result = []
     for index, networkservice, hardware_port, device in findall_res:
-        index = int(index)
+        enabled = index != "*"
         result_item = Networkservice(
-            index=index,
+            index=int(index) if enabled else None,
             networkservice=networkservice,
             hardware_port=hardware_port,
             device=device,
+            enabled=enabled,
         )
         result.append(result_item)
     return result
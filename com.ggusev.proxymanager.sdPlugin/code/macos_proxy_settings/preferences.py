@@ -0,0 +1,115 @@
+import os
+import plistlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .networksetup import ProxyInfo
+
+PREFERENCES_PLIST_PATH = Path("/Library/Preferences/SystemConfiguration/preferences.plist")
+
+# networksetup get command -> (enabled key, server key, port key) in the Proxies dictionary
+COMMAND_TO_PROXY_KEYS: Dict[str, Tuple[str, str, str]] = {
+    "getwebproxy": ("HTTPEnable", "HTTPProxy", "HTTPPort"),
+    "getsecurewebproxy": ("HTTPSEnable", "HTTPSProxy", "HTTPSPort"),
+    "getsocksfirewallproxy": ("SOCKSEnable", "SOCKSProxy", "SOCKSPort"),
+}
+
+
+class PreferencesReader:
+    """
+    Reads proxy settings from the SystemConfiguration preferences.plist.
+    The file is parsed once and parsed again only when its mtime or size changes.
+    """
+
+    def __init__(self, path: Path = PREFERENCES_PLIST_PATH):
+        self.path = Path(path)
+        self.parse_count = 0
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._networkservice_to_proxies: Dict[str, dict] = {}
+        self._service_id_to_networkservice: Dict[str, str] = {}
+
+    def get_proxy(
+            self,
+            command: str,
+            networkservice: str,
+    ) -> ProxyInfo:
+        """
+        Same contract as networksetup.get_proxy, answered from the parsed plist.
+
+        :param command: getwebproxy, getsecurewebproxy or getsocksfirewallproxy
+        :param networkservice: networkservice, example "Wi-Fi"
+        :return:
+        """
+        try:
+            enabled_key, server_key, port_key = COMMAND_TO_PROXY_KEYS[command]
+        except KeyError:
+            raise ValueError(f"Unsupported command: {command}")
+        proxies = self.get_proxies(networkservice=networkservice)
+        return ProxyInfo(
+            enabled=bool(proxies.get(enabled_key, 0)),
+            server=str(proxies.get(server_key, "")),
+            port=str(proxies.get(port_key, 0)),
+        )
+
+    def get_proxies(self, networkservice: str) -> dict:
+        self._load()
+        try:
+            return self._networkservice_to_proxies[networkservice]
+        except KeyError:
+            raise ValueError(f'Networkservice "{networkservice}" not found in {self.path}')
+
+    def get_networkservice(self, service_id: str) -> Optional[str]:
+        """
+        :param service_id: service ID, as in Setup:/Network/Service/<service_id>
+        :return: networkservice name or None if there is no such service in the current set
+        """
+        self._load()
+        return self._service_id_to_networkservice.get(service_id)
+
+    def get_service_ids(self) -> Dict[str, str]:
+        """
+        :return: service ID -> networkservice name of every service in the current set
+        """
+        self._load()
+        return dict(self._service_id_to_networkservice)
+
+    def _load(self) -> None:
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            with open(self.path, "rb") as f:
+                preferences = plistlib.load(f)
+            self._service_id_to_networkservice = parse_service_id_to_networkservice(preferences)
+            network_services = preferences.get("NetworkServices", {})
+            self._networkservice_to_proxies = {
+                networkservice: network_services[service_id].get("Proxies", {})
+                for service_id, networkservice in self._service_id_to_networkservice.items()
+            }
+            self._stamp = stamp
+            self.parse_count += 1
+
+
+def parse_service_id_to_networkservice(preferences: dict) -> Dict[str, str]:
+    """
+    Map the service IDs of the current set to their user defined networkservice names.
+    """
+    network_services: dict = preferences.get("NetworkServices", {})
+    service_ids = list(network_services)
+
+    current_set = preferences.get("CurrentSet", "")
+    set_id = current_set.rsplit("/", 1)[-1]
+    set_services = preferences.get("Sets", {}).get(set_id, {}).get("Network", {}).get("Service")
+    if set_services is not None:
+        service_ids = [service_id for service_id in set_services if service_id in network_services]
+
+    result = {}
+    for service_id in service_ids:
+        name = network_services[service_id].get("UserDefinedName")
+        if name is None:
+            continue
+        result[service_id] = name
+    return result
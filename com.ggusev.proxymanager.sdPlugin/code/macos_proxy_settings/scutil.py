@@ -0,0 +1,369 @@
+import logging
+import os
+import pty
+import re
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from .networksetup import ProxyInfo
+from .preferences import COMMAND_TO_PROXY_KEYS
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_PROXIES_KEY = "State:/Network/Global/Proxies"
+SERVICE_PROXIES_KEY_PATTERN = "Setup:/Network/Service/[^/]+/Proxies"
+
+SERVICE_PROXIES_KEY_REGEX = re.compile(r"^Setup:/Network/Service/([^/]+)/Proxies$")
+CHANGED_KEY_REGEX = re.compile(r"^\s*changed key \[\d+\] = (.+?)\s*$")
+VALUE_LINE_REGEX = re.compile(r"^\s*(.+?) : (.*?)\s*$")
+NO_SUCH_KEY = "No such key"
+
+
+class ProxiesWatcher:
+    """
+    Keeps one scutil session subscribed to the proxy keys of SCDynamicStore
+    and reports the networkservices whose proxies have changed.
+
+    on_change receives the set of changed networkservices, or None if the change
+    can not be attributed to known networkservices and everything has to be refreshed.
+    on_close is called when the scutil session ends without stop().
+    """
+
+    def __init__(
+            self,
+            on_change: Callable[[Optional[Set[str]]], None],
+            resolve_networkservice: Callable[[str], Optional[str]],
+            on_close: Optional[Callable[[], None]] = None,
+            scutil_command: str = "scutil",
+    ):
+        self.on_change = on_change
+        self.resolve_networkservice = resolve_networkservice
+        self.on_close = on_close
+        self.scutil_command = scutil_command
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self) -> bool:
+        """
+        :return: True if the scutil session has been started, False if notifications are unavailable
+        """
+        # scutil writes through stdio, so it gets a pty to flush every line
+        master_fd, slave_fd = pty.openpty()
+        try:
+            self._process = subprocess.Popen(
+                [self.scutil_command],
+                stdin=subprocess.PIPE,
+                stdout=slave_fd,
+                stderr=subprocess.DEVNULL,
+                encoding="utf-8",
+            )
+        except OSError as err:
+            os.close(master_fd)
+            logger.warning(f"scutil is unavailable: {err}")
+            return False
+        finally:
+            os.close(slave_fd)
+
+        self._process.stdin.write(
+            f"n.add {GLOBAL_PROXIES_KEY}\n"
+            f"n.add {SERVICE_PROXIES_KEY_PATTERN} pattern\n"
+            "n.watch\n"
+        )
+        self._process.stdin.flush()
+        self._thread = threading.Thread(target=self._read_loop, args=(master_fd,), daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._terminate()
+
+    def _terminate(self) -> None:
+        process = self._process
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def _read_loop(self, master_fd: int) -> None:
+        with open(master_fd, "r", encoding="utf-8", errors="replace") as stdout:
+            while True:
+                try:
+                    line = stdout.readline()
+                except OSError:  # EIO when the pty is closed by the exited scutil
+                    break
+                if not line:
+                    break
+                match = CHANGED_KEY_REGEX.match(line)
+                if match is None:
+                    continue
+                try:
+                    self.on_change(self._changed_networkservices(changed_key=match.group(1)))
+                except Exception as err:
+                    logger.exception(err)
+        self._terminate()
+        if self._stopped:
+            return
+        logger.warning("scutil session closed")
+        if self.on_close is not None:
+            self.on_close()
+
+    def _changed_networkservices(self, changed_key: str) -> Optional[Set[str]]:
+        match = SERVICE_PROXIES_KEY_REGEX.match(changed_key)
+        if match is None:
+            return None
+        try:
+            networkservice = self.resolve_networkservice(match.group(1))
+        except Exception as err:
+            logger.warning(f"Unable to resolve networkservice for {changed_key}: {err}")
+            return None
+        if networkservice is None:
+            return None
+        return {networkservice}
+
+
+class ScutilOutputParser:
+    """
+    Incremental parser of "show" replies: feed it lines and it returns the parsed
+    value once a reply is complete. Dictionaries become dicts, arrays become lists,
+    scalars stay strings, a missing key becomes None.
+    """
+
+    def __init__(self):
+        self._stack: List[Any] = []
+        self._stack_keys: List[Optional[str]] = []
+
+    def feed(self, line: str) -> Optional[tuple]:
+        """
+        :return: (value,) when a reply is complete, None while it is not
+        """
+        line = line.strip()
+        if not line:
+            return None
+        if not self._stack:
+            if line == NO_SUCH_KEY:
+                return (None,)
+            if line.endswith("{"):
+                self._push(key=None, line=line)
+            return None
+
+        if line == "}":
+            value = self._stack.pop()
+            key = self._stack_keys.pop()
+            if isinstance(value, dict) and value.pop("__array__", False):
+                value = [value[index] for index in sorted(value, key=int)]
+            if not self._stack:
+                return (value,)
+            self._stack[-1][key] = value
+            return None
+
+        match = VALUE_LINE_REGEX.match(line)
+        if match is None:
+            return None
+        key, value = match.groups()
+        if value.endswith("{"):
+            self._push(key=key, line=value)
+            return None
+        self._stack[-1][key] = value
+        return None
+
+    def _push(self, key: Optional[str], line: str) -> None:
+        value = {"__array__": True} if line.startswith("<array>") else {}
+        self._stack.append(value)
+        self._stack_keys.append(key)
+
+
+class _Connection:
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.pending: Deque[Future] = deque()
+        self.closed = False
+
+
+class ScutilSession:
+    """
+    One long-lived scutil process shared by all callers.
+    Requests are pipelined over its stdin and replies are matched to callers in order.
+    The process is restarted after it exits or a request times out.
+    """
+
+    def __init__(self, timeout: float = 2, scutil_command: str = "scutil"):
+        self.timeout = timeout
+        self.scutil_command = scutil_command
+        self.restart_count = 0
+        self._lock = threading.Lock()
+        self._connection: Optional[_Connection] = None
+
+    def show(self, key: str) -> Any:
+        """
+        :param key: SCDynamicStore key, example "Setup:/Network/Service/<id>/Proxies"
+        :return: parsed value, None if there is no such key
+        """
+        future: Future = Future()
+        write_error: Optional[OSError] = None
+        with self._lock:
+            connection = self._get_connection()
+            connection.pending.append(future)
+            try:
+                connection.process.stdin.write(f"show {key}\n")
+                connection.process.stdin.flush()
+            except OSError as err:
+                write_error = err
+        if write_error is not None:
+            self._close(connection=connection, err=ConnectionError(f"scutil write failed: {write_error}"))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            logger.warning(f"scutil did not reply in {self.timeout}s to show {key}, restarting")
+            self._close(connection=connection, err=TimeoutError(f"scutil timeout: show {key}"))
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            connection = self._connection
+        if connection is not None:
+            self._close(connection=connection, err=ConnectionError("scutil session closed"))
+
+    def _get_connection(self) -> _Connection:
+        connection = self._connection
+        if connection is not None and not connection.closed:
+            return connection
+        if connection is not None:
+            self.restart_count += 1
+        # scutil writes through stdio, so it gets a pty to flush every reply
+        master_fd, slave_fd = pty.openpty()
+        try:
+            process = subprocess.Popen(
+                [self.scutil_command],
+                stdin=subprocess.PIPE,
+                stdout=slave_fd,
+                stderr=subprocess.DEVNULL,
+                encoding="utf-8",
+            )
+        except OSError:
+            os.close(master_fd)
+            raise
+        finally:
+            os.close(slave_fd)
+        connection = _Connection(process=process)
+        threading.Thread(target=self._read_loop, args=(connection, master_fd), daemon=True).start()
+        self._connection = connection
+        return connection
+
+    def _read_loop(self, connection: _Connection, master_fd: int) -> None:
+        parser = ScutilOutputParser()
+        with open(master_fd, "r", encoding="utf-8", errors="replace") as stdout:
+            while True:
+                try:
+                    line = stdout.readline()
+                except OSError:  # EIO when the pty is closed by the exited scutil
+                    break
+                if not line:
+                    break
+                try:
+                    reply = parser.feed(line)
+                except Exception as err:
+                    logger.exception(err)
+                    break
+                if reply is None:
+                    continue
+                with self._lock:
+                    future = connection.pending.popleft() if connection.pending else None
+                if future is not None and not future.done():
+                    future.set_result(reply[0])
+        self._close(connection=connection, err=ConnectionError("scutil exited"))
+
+    def _close(self, connection: _Connection, err: Exception) -> None:
+        with self._lock:
+            if connection.closed:
+                return
+            connection.closed = True
+            pending = list(connection.pending)
+            connection.pending.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(err)
+        try:
+            connection.process.stdin.close()
+        except OSError:
+            pass
+        if connection.process.poll() is None:
+            connection.process.kill()
+
+
+class ScutilReader:
+    """
+    Answers get_proxy from SCDynamicStore through a ScutilSession,
+    without starting a process per read.
+    """
+
+    def __init__(self, session: Optional[ScutilSession] = None):
+        self.session = ScutilSession() if session is None else session
+        self._networkservice_to_service_id: Dict[str, str] = {}
+
+    def get_proxy(
+            self,
+            command: str,
+            networkservice: str,
+    ) -> ProxyInfo:
+        """
+        Same contract as networksetup.get_proxy.
+
+        :param command: getwebproxy, getsecurewebproxy or getsocksfirewallproxy
+        :param networkservice: networkservice, example "Wi-Fi"
+        :return:
+        """
+        try:
+            enabled_key, server_key, port_key = COMMAND_TO_PROXY_KEYS[command]
+        except KeyError:
+            raise ValueError(f"Unsupported command: {command}")
+        service_id = self.get_service_id(networkservice=networkservice)
+        proxies = self.session.show(f"Setup:/Network/Service/{service_id}/Proxies") or {}
+        return ProxyInfo(
+            enabled=proxies.get(enabled_key, "0") != "0",
+            server=proxies.get(server_key, ""),
+            port=proxies.get(port_key, "0"),
+        )
+
+    def get_service_id(self, networkservice: str) -> str:
+        service_id = self._networkservice_to_service_id.get(networkservice)
+        if service_id is not None:
+            return service_id
+        self._networkservice_to_service_id = self._resolve_service_ids()
+        try:
+            return self._networkservice_to_service_id[networkservice]
+        except KeyError:
+            raise ValueError(f'Networkservice "{networkservice}" not found')
+
+    def get_networkservice(self, service_id: str) -> Optional[str]:
+        for networkservice, _service_id in self._networkservice_to_service_id.items():
+            if _service_id == service_id:
+                return networkservice
+        service = self.session.show(f"Setup:/Network/Service/{service_id}")
+        if service is None:
+            return None
+        return service.get("UserDefinedName")
+
+    def _resolve_service_ids(self) -> Dict[str, str]:
+        ipv4 = self.session.show("Setup:/Network/Global/IPv4") or {}
+        result = {}
+        for service_id in ipv4.get("ServiceOrder", []):
+            service = self.session.show(f"Setup:/Network/Service/{service_id}")
+            if service is None or "UserDefinedName" not in service:
+                continue
+            result[service["UserDefinedName"]] = service_id
+        return result
@@ -0,0 +1,111 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .networksetup import Networkservice
+from .preferences import PreferencesReader
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NetworkserviceInfo:
+    networkservice: str
+    index: Optional[int]  # None if the networkservice is disabled
+    hardware_port: str
+    device: str
+    service_id: Optional[str] = None  # None if preferences.plist is not available
+    enabled: bool = True
+
+
+class NetworkserviceIndex:
+    """
+    networkservice name -> NetworkserviceInfo, built from listnetworkserviceorder.
+    Disabled networkservices are known too, their proxies can be set like the ones of the enabled.
+
+    listnetworkserviceorder runs again only when the set of services in preferences.plist changes,
+    which costs a stat call per lookup. Without preferences.plist the index is rebuilt after invalidate().
+    A listing that fails is retried on the next lookup.
+
+    :param list_networkservices: listnetworkserviceorder of the proxy backend
+    :param preferences: reader of preferences.plist, None to not use it
+    """
+
+    def __init__(
+            self,
+            list_networkservices: Callable[[], List[Networkservice]],
+            preferences: Optional[PreferencesReader] = None,
+    ):
+        self.list_networkservices = list_networkservices
+        self.preferences = preferences
+        self.list_count = 0
+        self._lock = threading.Lock()
+        self._services: Optional[Dict[str, NetworkserviceInfo]] = None
+        self._fingerprint: Optional[FrozenSet[Tuple[str, str]]] = None
+
+    def get(self, networkservice: str) -> Optional[NetworkserviceInfo]:
+        services = self._refresh()
+        return services.get(networkservice) if services is not None else None
+
+    def names(self) -> List[str]:
+        """
+        :return: networkservice names in service order, empty if they can not be listed
+        """
+        services = self._refresh()
+        return list(services) if services is not None else []
+
+    def is_known(self, networkservice: str) -> bool:
+        """
+        :return: False only if the networkservice is missing from a successful listing
+        """
+        services = self._refresh()
+        return services is None or networkservice in services
+
+    def is_known_warm(self, networkservice: str) -> bool:
+        """
+        is_known from the last listing, never listing nor reading preferences.plist,
+        for the threads that must not wait for networksetup.
+
+        :return: False only if the networkservice is missing from the last listing
+        """
+        services = self._services
+        return services is None or networkservice in services
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._services = None
+
+    def _refresh(self) -> Optional[Dict[str, NetworkserviceInfo]]:
+        fingerprint = self._read_fingerprint()
+        with self._lock:
+            if self._services is not None and fingerprint == self._fingerprint:
+                return self._services
+            try:
+                listed = self.list_networkservices()
+            except Exception as err:
+                logger.warning(f"Networkservices can not be listed: {err}")
+                return None
+            self.list_count += 1
+            name_to_service_id = {name: service_id for service_id, name in (fingerprint or ())}
+            self._services = {
+                item.networkservice: NetworkserviceInfo(
+                    networkservice=item.networkservice,
+                    index=item.index,
+                    hardware_port=item.hardware_port,
+                    device=item.device,
+                    service_id=name_to_service_id.get(item.networkservice),
+                    enabled=item.enabled,
+                )
+                for item in listed
+            }
+            self._fingerprint = fingerprint
+            return self._services
+
+    def _read_fingerprint(self) -> Optional[FrozenSet[Tuple[str, str]]]:
+        if self.preferences is None:
+            return None
+        try:
+            return frozenset(self.preferences.get_service_ids().items())
+        except (OSError, ValueError):
+            return None
@@ -1,6 +1,14 @@
+from dataclasses import dataclass
 from enum import Enum
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
 
+from . import networksetup
+from .backend import ProxyBackend
+from .cache import ProxyInfoCache
+from .executor import run_concurrently
 from .networksetup import *
+from .preferences import PreferencesReader
 
 
 class ProxyTypes(Enum):
@@ -10,6 +18,114 @@ class ProxyTypes(Enum):
     HTTP_HTTPS = "http(s)"
 
 
+class ApplyActions(Enum):
+    SET_STATE = "set_state"
+    SET_PROXY = "set_proxy"
+
+
+@dataclass(frozen=True)
+class ApplyCommand:
+    proxy_type: ProxyTypes  # HTTP, HTTPS or SOCKS
+    action: ApplyActions
+
+
+class ReadBackends(Enum):
+    NETWORKSETUP = "networksetup"
+    PREFERENCES = "preferences"
+    SCUTIL = "scutil"
+
+
+PROXY_TYPE_TO_GET_COMMAND: Dict[ProxyTypes, str] = {
+    ProxyTypes.HTTP: "getwebproxy",
+    ProxyTypes.HTTPS: "getsecurewebproxy",
+    ProxyTypes.SOCKS: "getsocksfirewallproxy",
+}
+
+_proxy_backend: ProxyBackend = networksetup
+_proxy_reader = networksetup
+_proxy_info_cache = ProxyInfoCache()
+
+
+def set_read_backend(backend: ReadBackends) -> None:
+    """
+    Select where get_proxy reads proxy settings from.
+
+    :param backend: NETWORKSETUP runs networksetup for every read,
+        PREFERENCES parses preferences.plist and only re-parses it when the file changes,
+        SCUTIL queries SCDynamicStore through one long-lived scutil process.
+    """
+    global _proxy_reader
+    if backend is ReadBackends.NETWORKSETUP:
+        _proxy_reader = _proxy_backend
+    elif backend is ReadBackends.PREFERENCES:
+        _proxy_reader = PreferencesReader()
+    elif backend is ReadBackends.SCUTIL:
+        from .scutil import ScutilReader  # not imported at startup, it is only needed for this backend
+        _proxy_reader = ScutilReader()
+    else:
+        raise ValueError("Bad backend")
+    _proxy_info_cache.clear()
+
+
+def set_proxy_backend(backend: ProxyBackend) -> None:
+    """
+    Select what runs the networksetup commands, reads included.
+
+    :param backend: the networksetup module to change the system settings or a MemoryBackend to simulate them
+    """
+    global _proxy_backend, _proxy_reader
+    _proxy_backend = backend
+    _proxy_reader = backend
+    _proxy_info_cache.clear()
+
+
+def configure_cache(ttl: float, max_size: int) -> None:
+    """
+    :param ttl: seconds a read is reused by get_proxy, 0 disables the cache
+    :param max_size: number of (proxy_type, networkservice) entries kept, least recently used are evicted
+    """
+    global _proxy_info_cache
+    _proxy_info_cache = ProxyInfoCache(ttl=ttl, max_size=max_size)
+
+
+def cache_stats() -> Dict[str, int]:
+    return _proxy_info_cache.stats()
+
+
+def invalidate_cache(networkservices: Optional[Set[str]] = None) -> None:
+    """
+    Drop cached reads of networkservices, of all networkservices if None.
+    """
+    if networkservices is None:
+        _proxy_info_cache.clear()
+        return
+    _proxy_info_cache.invalidate_where(lambda key: key[1] in networkservices)
+
+
+def _cache_keys(proxy_type: ProxyTypes, networkservice: str) -> List[Tuple[ProxyTypes, str]]:
+    if proxy_type is ProxyTypes.HTTP_HTTPS:
+        return [(ProxyTypes.HTTP, networkservice), (ProxyTypes.HTTPS, networkservice)]
+    return [(proxy_type, networkservice)]
+
+
+def _get_base_proxy(
+        proxy_type: ProxyTypes,
+        networkservice: str,
+        fresh: bool = False,
+) -> ProxyInfo:
+    key = (proxy_type, networkservice)
+    res = None if fresh else _proxy_info_cache.get(key)
+    if res is None:
+        # a write that lands during the read drops this put
+        generation = _proxy_info_cache.generation(key)
+        res = _proxy_reader.get_proxy(
+            command=PROXY_TYPE_TO_GET_COMMAND[proxy_type],
+            networkservice=networkservice,
+        )
+        _proxy_info_cache.put(key, res, generation=generation)
+    return res
+
+
 def set_proxy(
         proxy_type: ProxyTypes,
         networkservice: str,
@@ -18,8 +134,11 @@ def set_proxy(
         username: str = "",
         password: str = "",
 ) -> None:
+    cache_keys = _cache_keys(proxy_type=proxy_type, networkservice=networkservice)
+    _proxy_info_cache.invalidate(cache_keys)
     if proxy_type is ProxyTypes.HTTP:
-        res = setwebproxy(
+        res = _proxy_backend.set_proxy(
+            command="setwebproxy",
             networkservice=networkservice,
             domain=domain,
             port=port,
@@ -27,7 +146,8 @@ def set_proxy(
             password=password,
         )
     elif proxy_type is ProxyTypes.HTTPS:
-        res = setsecurewebproxy(
+        res = _proxy_backend.set_proxy(
+            command="setsecurewebproxy",
             networkservice=networkservice,
             domain=domain,
             port=port,
@@ -35,7 +155,8 @@ def set_proxy(
             password=password,
         )
     elif proxy_type is ProxyTypes.SOCKS:
-        res = setsocksfirewallproxy(
+        res = _proxy_backend.set_proxy(
+            command="setsocksfirewallproxy",
             networkservice=networkservice,
             domain=domain,
             port=port,
@@ -43,25 +164,36 @@ def set_proxy(
             password=password,
         )
     elif proxy_type is ProxyTypes.HTTP_HTTPS:
-        res1 = setwebproxy(
-            networkservice=networkservice,
-            domain=domain,
-            port=port,
-            username=username,
-            password=password,
-        )
-        res2 = setsecurewebproxy(
-            networkservice=networkservice,
-            domain=domain,
-            port=port,
-            username=username,
-            password=password,
+        res1, res2 = run_concurrently(
+            partial(
+                _proxy_backend.set_proxy,
+                command="setwebproxy",
+                networkservice=networkservice,
+                domain=domain,
+                port=port,
+                username=username,
+                password=password,
+            ),
+            partial(
+                _proxy_backend.set_proxy,
+                command="setsecurewebproxy",
+                networkservice=networkservice,
+                domain=domain,
+                port=port,
+                username=username,
+                password=password,
+            ),
         )
         res = "\n".join([res1, res2]) if res1 or res2 else ""
     else:
         raise ValueError("Bad proxy_type")
     if res:
         raise ValueError(res)
+    for cache_key in cache_keys:
+        _proxy_info_cache.put(
+            cache_key,
+            ProxyInfo(enabled=True, server=domain, port=port, authenticated=bool(username and password)),
+        )
 
 
 def set_proxy_state(
@@ -70,34 +202,47 @@ def set_proxy_state(
         enabled: bool,
 ) -> None:
     if proxy_type is ProxyTypes.HTTP:
-        res = setwebproxystate(
+        res = _proxy_backend.set_proxy_state(
+            command="setwebproxystate",
             networkservice=networkservice,
             enabled=enabled,
         )
     elif proxy_type is ProxyTypes.HTTPS:
-        res = setsecurewebproxystate(
+        res = _proxy_backend.set_proxy_state(
+            command="setsecurewebproxystate",
             networkservice=networkservice,
             enabled=enabled,
         )
     elif proxy_type is ProxyTypes.SOCKS:
-        res = setsocksfirewallproxystate(
+        res = _proxy_backend.set_proxy_state(
+            command="setsocksfirewallproxystate",
             networkservice=networkservice,
             enabled=enabled,
         )
     elif proxy_type is ProxyTypes.HTTP_HTTPS:
-        res1 = setwebproxystate(
-            networkservice=networkservice,
-            enabled=enabled,
-        )
-        res2 = setsecurewebproxystate(
-            networkservice=networkservice,
-            enabled=enabled,
+        res1, res2 = run_concurrently(
+            partial(
+                _proxy_backend.set_proxy_state,
+                command="setwebproxystate",
+                networkservice=networkservice,
+                enabled=enabled,
+            ),
+            partial(
+                _proxy_backend.set_proxy_state,
+                command="setsecurewebproxystate",
+                networkservice=networkservice,
+                enabled=enabled,
+            ),
         )
         res = "\n".join([res1, res2]) if res1 or res2 else ""
     else:
         raise ValueError("Bad proxy_type")
+    cache_keys = _cache_keys(proxy_type=proxy_type, networkservice=networkservice)
     if res:
+        _proxy_info_cache.invalidate(cache_keys)
         raise ValueError(res)
+    for cache_key in cache_keys:
+        _proxy_info_cache.set_enabled(cache_key, enabled=enabled)
 
 
 def get_proxy(
@@ -105,28 +250,150 @@ def get_proxy(
         networkservice: str,
 ) -> ProxyInfo:
     if proxy_type is ProxyTypes.HTTP:
-        res = getwebproxy(
+        res = _get_base_proxy(
+            proxy_type=ProxyTypes.HTTP,
             networkservice=networkservice,
         )
     elif proxy_type is ProxyTypes.HTTPS:
-        res = getsecurewebproxy(
+        res = _get_base_proxy(
+            proxy_type=ProxyTypes.HTTPS,
             networkservice=networkservice,
         )
     elif proxy_type is ProxyTypes.SOCKS:
-        res = getsocksfirewallproxy(
+        res = _get_base_proxy(
+            proxy_type=ProxyTypes.SOCKS,
             networkservice=networkservice,
         )
     elif proxy_type is ProxyTypes.HTTP_HTTPS:
-        res1 = getwebproxy(
-            networkservice=networkservice,
+        res1, res2 = run_concurrently(
+            partial(
+                _get_base_proxy,
+                proxy_type=ProxyTypes.HTTP,
+                networkservice=networkservice,
+            ),
+            partial(
+                _get_base_proxy,
+                proxy_type=ProxyTypes.HTTPS,
+                networkservice=networkservice,
+            ),
         )
-        res2 = getsecurewebproxy(
-            networkservice=networkservice,
-        )
-        if res1.enabled and res2.enabled and res1.server == res2.server and res1.port == res2.port:
-            res = res1
-        else:
-            res = ProxyInfo(enabled=False, server="Unknown", port="Unknown")
+        res = merge_http_https(http_proxy_info=res1, https_proxy_info=res2)
     else:
         raise ValueError("Bad proxy_type")
     return res
+
+
+def list_networkservices() -> List[Networkservice]:
+    return _proxy_backend.listnetworkserviceorder()
+
+
+def get_bypass_domains(networkservice: str) -> List[str]:
+    return _proxy_backend.getproxybypassdomains(networkservice=networkservice)
+
+
+def set_bypass_domains(networkservice: str, domains: List[str]) -> None:
+    """
+    :raises ValueError: if the backend fails to write domains
+    """
+    res = _proxy_backend.setproxybypassdomains(networkservice=networkservice, domains=domains)
+    if res:
+        raise ValueError(res)
+
+
+def merge_http_https(
+        http_proxy_info: ProxyInfo,
+        https_proxy_info: ProxyInfo,
+) -> ProxyInfo:
+    """
+    Combine the http and https proxies into one http(s) ProxyInfo.
+    It is enabled only if both are enabled with the same server and port.
+    """
+    if (http_proxy_info.enabled and https_proxy_info.enabled
+            and http_proxy_info.server == https_proxy_info.server
+            and http_proxy_info.port == https_proxy_info.port):
+        return http_proxy_info
+    return ProxyInfo(enabled=False, server="Unknown", port="Unknown")
+
+
+def plan_apply(
+        current: Dict[ProxyTypes, ProxyInfo],
+        enabled: bool,
+        domain: str = "",
+        port: str = "",
+        username: str = "",
+        password: str = "",
+) -> List[ApplyCommand]:
+    """
+    Minimal commands that bring the current proxies to the desired state.
+
+    :param current: current ProxyInfo of every HTTP, HTTPS or SOCKS proxy to apply,
+        read from networksetup to only set the state of a proxy that matches
+    :param enabled: desired state. domain, port, username and password are only used to enable.
+    :return: one command per proxy that has to change, nothing if everything already matches
+    """
+    result = []
+    for proxy_type, proxy_info in current.items():
+        if not enabled:
+            if proxy_info.enabled:
+                result.append(ApplyCommand(proxy_type=proxy_type, action=ApplyActions.SET_STATE))
+            continue
+        # a password can not be read back, so credentials are always written, and so is a proxy
+        # whose reader does not report authentication, old credentials of which would be kept otherwise
+        server_matches = (proxy_info.server == domain and proxy_info.port == port
+                          and not (username and password) and proxy_info.authenticated is False)
+        if not server_matches:
+            result.append(ApplyCommand(proxy_type=proxy_type, action=ApplyActions.SET_PROXY))
+        elif not proxy_info.enabled:
+            result.append(ApplyCommand(proxy_type=proxy_type, action=ApplyActions.SET_STATE))
+    return result
+
+
+def apply_proxy(
+        proxy_type: ProxyTypes,
+        networkservice: str,
+        enabled: bool,
+        domain: str = "",
+        port: str = "",
+        username: str = "",
+        password: str = "",
+) -> List[ApplyCommand]:
+    """
+    Enable proxy_type with domain and port, or disable it, running only the networksetup
+    commands that change something. The current state is read bypassing the cache.
+
+    :return: executed commands
+    """
+    base_proxy_types = [cache_key[0] for cache_key in _cache_keys(proxy_type=proxy_type, networkservice=networkservice)]
+    current_infos = run_concurrently(*[
+        partial(_get_base_proxy, proxy_type=base_proxy_type, networkservice=networkservice, fresh=True)
+        for base_proxy_type in base_proxy_types
+    ])
+    commands = plan_apply(
+        current=dict(zip(base_proxy_types, current_infos)),
+        enabled=enabled,
+        domain=domain,
+        port=port,
+        username=username,
+        password=password,
+    )
+    calls = []
+    for command in commands:
+        if command.action is ApplyActions.SET_PROXY:
+            calls.append(partial(
+                set_proxy,
+                proxy_type=command.proxy_type,
+                networkservice=networkservice,
+                domain=domain,
+                port=port,
+                username=username,
+                password=password,
+            ))
+        else:
+            calls.append(partial(
+                set_proxy_state,
+                proxy_type=command.proxy_type,
+                networkservice=networkservice,
+                enabled=enabled,
+            ))
+    run_concurrently(*calls)
+    return commands
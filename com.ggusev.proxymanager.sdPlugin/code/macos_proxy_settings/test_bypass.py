@@ -0,0 +1,102 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from macos_proxy_settings import networksetup, simple_settings
+from macos_proxy_settings.bypass import (
+    BypassDiff,
+    DomainTrie,
+    apply_bypass_domains,
+    collapse,
+    diff,
+    load_file,
+    normalize_entry,
+)
+from macos_proxy_settings.memory import MemoryBackend
+from macos_proxy_settings.testing import use_stand_in
+
+
+class TestsBypassDomains(TestCase):
+    def test_normalize_entry(self):
+        self.assertEqual(normalize_entry(" Example.COM. "), "example.com")
+        self.assertEqual(normalize_entry(".example.com"), "*.example.com")
+        self.assertEqual(normalize_entry("*.bücher.example"), "*.xn--bcher-kva.example")
+        self.assertEqual(normalize_entry("169.254/16"), "169.254/16")
+        self.assertEqual(normalize_entry("FE80::1"), "fe80::1")
+        self.assertIsNone(normalize_entry("  "))
+        for entry in ["a..example.com", "-a.example.com", "*example.com", "a.*.example.com", "a b"]:
+            with self.assertRaises(ValueError, msg=entry):
+                normalize_entry(entry)
+
+    def test_trie(self):
+        trie = DomainTrie()
+        self.assertTrue(trie.add("*.example.com"))
+        self.assertTrue(trie.add("example.com"))
+        self.assertFalse(trie.add("a.b.example.com"))
+        self.assertFalse(trie.add("*.b.example.com"))
+        self.assertTrue(trie.covers("example.com"))
+        self.assertFalse(trie.covers("example.org"))
+        self.assertFalse(trie.covers("com"))
+
+    def test_collapse(self):
+        entries = [
+            "a.example.com", "Example.com", "intranet.corp", "*.b.example.com", "x.b.example.com",
+            ".example.com", "10.0.0.0/8", "example.com.", "*.example.com", "intranet.corp",
+        ]
+        self.assertEqual(collapse(entries), ["example.com", "intranet.corp", "*.example.com", "10.0.0.0/8"])
+        self.assertEqual(collapse(["a.example.com", "*"]), ["*"])
+        self.assertEqual(collapse([]), [])
+
+    def test_diff(self):
+        self.assertFalse(diff(current=["B.example.com", "a.example.com"],
+                              desired=["a.example.com", "b.example.com"]).changed)
+        self.assertEqual(
+            diff(current=["a.example.com", "*.local", "bad entry"], desired=["*.local", "c.example.com"]),
+            BypassDiff(added=["c.example.com"], removed=["a.example.com", "bad entry"]),
+        )
+
+    def test_load_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "bypass.txt"
+            path.write_text("# internal\n*.corp.example.com, a.corp.example.com\n\nlocalhost 127.0.0.1 # loopback\n",
+                            encoding="utf-8")
+            self.assertEqual(load_file(path), ["*.corp.example.com", "localhost", "127.0.0.1"])
+            path.write_text("localhost\nbad..domain\n", encoding="utf-8")
+            with self.assertRaisesRegex(ValueError, "bypass.txt:2"):
+                load_file(path)
+
+
+class TestsApplyBypassDomains(TestCase):
+    def setUp(self):
+        use_stand_in(self, networkservices=["Wi-Fi"])
+
+    def test_apply(self):
+        domains = collapse([f"host{index}.corp.example.com" for index in range(1000)] + ["*.local"])
+        res = apply_bypass_domains(networkservice="Wi-Fi", domains=domains)
+        self.assertEqual(len(res.added), 1001)
+        self.assertEqual(networksetup.getproxybypassdomains(networkservice="Wi-Fi"), domains)
+
+        with mock.patch.object(networksetup, "setproxybypassdomains") as setproxybypassdomains:
+            self.assertFalse(apply_bypass_domains(networkservice="Wi-Fi", domains=domains[::-1]).changed)
+            setproxybypassdomains.assert_not_called()
+
+        self.assertEqual(apply_bypass_domains(networkservice="Wi-Fi", domains=[]).removed, sorted(domains))
+        self.assertEqual(networksetup.getproxybypassdomains(networkservice="Wi-Fi"), [])
+
+    def test_apply_through_backend(self):
+        backend = MemoryBackend(networkservices=["Wi-Fi"])
+        with mock.patch.object(simple_settings, "_proxy_backend", backend):
+            self.assertTrue(apply_bypass_domains(networkservice="Wi-Fi", domains=["*.local"]).changed)
+            self.assertFalse(apply_bypass_domains(networkservice="Wi-Fi", domains=["*.local"]).changed)
+            backend.fail_next()
+            with self.assertRaises(ValueError):
+                apply_bypass_domains(networkservice="Wi-Fi", domains=[])
+        self.assertEqual(backend.getproxybypassdomains(networkservice="Wi-Fi"), ["*.local"])
+        self.assertEqual(networksetup.getproxybypassdomains(networkservice="Wi-Fi"), [])
+        self.assertEqual(backend.call_count["setproxybypassdomains"], 1)
+
+    def test_argument_length(self):
+        with mock.patch.object(networksetup, "max_argv_size", return_value=1000):
+            with self.assertRaisesRegex(ValueError, "bytes of arguments"):
+                networksetup.setproxybypassdomains(networkservice="Wi-Fi",
+                                                   domains=[f"host{index}.example.com" for index in range(100)])
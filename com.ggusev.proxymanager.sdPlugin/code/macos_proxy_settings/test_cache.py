@@ -0,0 +1,137 @@
+from unittest import TestCase, mock
+
+from macos_proxy_settings import simple_settings
+from macos_proxy_settings.cache import ProxyInfoCache
+from macos_proxy_settings.networksetup import ProxyInfo
+from macos_proxy_settings.simple_settings import ProxyTypes
+
+PROXY_INFO = ProxyInfo(enabled=True, server="127.0.0.1", port="1080", authenticated=False)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestsProxyInfoCache(TestCase):
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = ProxyInfoCache(ttl=1, clock=clock)
+        cache.put("a", PROXY_INFO)
+        self.assertEqual(cache.get("a"), PROXY_INFO)
+        clock.now = 1.5
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0, "size": 0})
+
+    def test_lru_eviction(self):
+        cache = ProxyInfoCache(ttl=10, max_size=2)
+        cache.put("a", PROXY_INFO)
+        cache.put("b", PROXY_INFO)
+        cache.get("a")
+        cache.put("c", PROXY_INFO)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), PROXY_INFO)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disabled(self):
+        cache = ProxyInfoCache(ttl=0)
+        cache.put("a", PROXY_INFO)
+        self.assertIsNone(cache.get("a"))
+
+    def test_set_enabled(self):
+        cache = ProxyInfoCache(ttl=10)
+        cache.put("a", PROXY_INFO)
+        cache.set_enabled("a", enabled=False)
+        cache.set_enabled("b", enabled=False)
+        self.assertEqual(cache.get("a"), ProxyInfo(enabled=False, server="127.0.0.1", port="1080", authenticated=False))
+        self.assertIsNone(cache.get("b"))
+
+    def test_stale_put_dropped(self):
+        cache = ProxyInfoCache(ttl=10)
+        generation = cache.generation("a")
+        cache.invalidate(["a"])
+        cache.put("a", PROXY_INFO)
+        cache.put("a", ProxyInfo(enabled=False, server="", port="0"), generation=generation)
+        self.assertEqual(cache.get("a"), PROXY_INFO)
+
+        generation = cache.generation("b")
+        cache.clear()
+        cache.put("b", PROXY_INFO, generation=generation)
+        self.assertIsNone(cache.get("b"))
+        cache.put("b", PROXY_INFO, generation=cache.generation("b"))
+        self.assertEqual(cache.get("b"), PROXY_INFO)
+
+
+class TestsSimpleSettingsCache(TestCase):
+    def setUp(self):
+        self.reader = mock.Mock()
+        self.reader.get_proxy.return_value = ProxyInfo(enabled=False, server="", port="0")
+        self.backend = mock.Mock()
+        self.backend.set_proxy.return_value = ""
+        self.backend.set_proxy_state.return_value = ""
+        patches = [
+            mock.patch.object(simple_settings, "_proxy_reader", self.reader),
+            mock.patch.object(simple_settings, "_proxy_backend", self.backend),
+            mock.patch.object(simple_settings, "_proxy_info_cache", ProxyInfoCache(ttl=60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_reads_are_cached(self):
+        for _ in range(3):
+            simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice="Wi-Fi")
+            simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi")
+        self.assertEqual(self.reader.get_proxy.call_count, 2)
+
+    def test_set_proxy_writes_through(self):
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice="Wi-Fi")
+        simple_settings.set_proxy(
+            proxy_type=ProxyTypes.HTTP_HTTPS,
+            networkservice="Wi-Fi",
+            domain="127.0.0.1",
+            port="1080",
+        )
+        res = simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice="Wi-Fi")
+        self.assertEqual(res, PROXY_INFO)
+
+        simple_settings.set_proxy_state(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi", enabled=False)
+        res = simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice="Wi-Fi")
+        self.assertFalse(res.enabled)
+        self.assertEqual(self.reader.get_proxy.call_count, 2)
+
+    def test_read_during_write_not_cached(self):
+        def read_then_write(command: str, networkservice: str) -> ProxyInfo:
+            simple_settings.set_proxy(
+                proxy_type=ProxyTypes.SOCKS,
+                networkservice=networkservice,
+                domain="127.0.0.1",
+                port="1080",
+            )
+            return ProxyInfo(enabled=False, server="", port="0")
+
+        self.reader.get_proxy.side_effect = read_then_write
+        simple_settings.get_proxy(proxy_type=ProxyTypes.SOCKS, networkservice="Wi-Fi")
+        self.reader.get_proxy.side_effect = None
+        res = simple_settings.get_proxy(proxy_type=ProxyTypes.SOCKS, networkservice="Wi-Fi")
+        self.assertEqual(res, PROXY_INFO)
+        self.assertEqual(self.reader.get_proxy.call_count, 1)
+
+    def test_failed_write_invalidates(self):
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi")
+        self.backend.set_proxy_state.return_value = "** Error"
+        with self.assertRaises(ValueError):
+            simple_settings.set_proxy_state(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi", enabled=True)
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi")
+        self.assertEqual(self.reader.get_proxy.call_count, 2)
+
+    def test_invalidate_cache(self):
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi")
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Ethernet")
+        simple_settings.invalidate_cache(networkservices={"Wi-Fi"})
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Wi-Fi")
+        simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP, networkservice="Ethernet")
+        self.assertEqual(self.reader.get_proxy.call_count, 3)
@@ -0,0 +1,69 @@
+import time
+from unittest import TestCase, mock
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.corpus import REDACTED, CorpusRecorder, ReplayBackend, load_corpus
+from macos_proxy_settings.networksetup import ProxyInfo
+from macos_proxy_settings.testing import use_stand_in
+
+
+class TestsCorpus(TestCase):
+    def setUp(self):
+        tmp_path = use_stand_in(self, networkservices=["Wi-Fi", "Ethernet"], FAKE_LATENCY="0.05")
+        self.corpus_path = tmp_path / "corpus.jsonl"
+        patch = mock.patch.object(networksetup, "_recorder", CorpusRecorder(path=self.corpus_path))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def record(self):
+        networksetup.getwebproxy(networkservice="Wi-Fi")
+        networksetup.setwebproxy(networkservice="Wi-Fi", domain="127.0.0.1", port="8080",
+                                 username="user", password="secret")
+        networksetup.getwebproxy(networkservice="Wi-Fi")
+        networksetup.setwebproxystate(networkservice="Bluetooth", enabled=True)
+        networksetup.listnetworkserviceorder()
+        networksetup.set_recorder(None)
+
+    def test_record(self):
+        self.record()
+        corpus = load_corpus(self.corpus_path)
+        self.assertEqual(len(corpus), 5)
+        self.assertEqual(corpus[1]["argv"][-1], REDACTED)
+        self.assertNotIn("secret", self.corpus_path.read_text(encoding="utf-8"))
+        self.assertNotEqual(corpus[3]["returncode"], 0)
+        self.assertGreaterEqual(corpus[0]["latency"], 0.05)
+
+    def test_redact_only_passwords(self):
+        domains = [f"host{index}.example.com" for index in range(8)]
+        networksetup.setproxybypassdomains(networkservice="Wi-Fi", domains=domains)
+        networksetup.setwebproxy(networkservice="Wi-Fi", domain="127.0.0.1", port="8080")
+        networksetup.getproxybypassdomains(networkservice="Wi-Fi")
+        networksetup.set_recorder(None)
+        corpus = load_corpus(self.corpus_path)
+        self.assertEqual(corpus[0]["argv"], ["networksetup", "-setproxybypassdomains", "Wi-Fi", *domains])
+        self.assertEqual(corpus[1]["argv"][-1], "off")
+        backend = ReplayBackend(path=self.corpus_path, timings=False)
+        self.assertEqual(backend.setproxybypassdomains(networkservice="Wi-Fi", domains=domains), "")
+        self.assertEqual(backend.getproxybypassdomains(networkservice="Wi-Fi"), domains)
+
+    def test_replay(self):
+        self.record()
+        backend = ReplayBackend(path=self.corpus_path, timings=False)
+        self.assertFalse(backend.get_proxy(command="getwebproxy", networkservice="Wi-Fi").enabled)
+        self.assertEqual(backend.set_proxy(command="setwebproxy", networkservice="Wi-Fi", domain="127.0.0.1",
+                                           port="8080", username="user", password="other"), "")
+        expected = ProxyInfo(enabled=True, server="127.0.0.1", port="8080", authenticated=True)
+        self.assertEqual(backend.get_proxy(command="getwebproxy", networkservice="Wi-Fi"), expected)
+        self.assertEqual(backend.get_proxy(command="getwebproxy", networkservice="Wi-Fi"), expected)
+        self.assertIn("** Error", backend.set_proxy_state(command="setwebproxystate", networkservice="Bluetooth",
+                                                          enabled=True))
+        self.assertEqual([item.networkservice for item in backend.listnetworkserviceorder()], ["Wi-Fi", "Ethernet"])
+        with self.assertRaises(KeyError):
+            backend.get_proxy(command="getwebproxy", networkservice="Ethernet")
+
+    def test_replay_timings(self):
+        self.record()
+        backend = ReplayBackend(path=self.corpus_path)
+        start = time.perf_counter()
+        backend.listnetworkserviceorder()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
@@ -0,0 +1,69 @@
+import threading
+import time
+from unittest import TestCase
+
+from macos_proxy_settings.executor import (
+    configure_executor,
+    map_concurrently,
+    run_concurrently,
+)
+
+
+class TestsExecutor(TestCase):
+    def setUp(self):
+        configure_executor(max_workers=4)
+
+    def test_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def call(value):
+            barrier.wait()  # both calls have to run at the same time to get past it
+            return value
+
+        self.assertEqual(run_concurrently(lambda: call(1), lambda: call(2)), [1, 2])
+
+    def test_run_concurrently_error(self):
+        finished = []
+
+        def fail():
+            raise ValueError("first")
+
+        def slow():
+            time.sleep(0.05)
+            finished.append(True)
+            return "ok"
+
+        with self.assertRaisesRegex(ValueError, "first"):
+            run_concurrently(fail, slow)
+        self.assertEqual(finished, [True])
+
+    def test_nested_calls_do_not_deadlock(self):
+        configure_executor(max_workers=2)
+
+        def outer():
+            return run_concurrently(lambda: 1, lambda: 2)
+
+        self.assertEqual(run_concurrently(outer, outer), [[1, 2], [1, 2]])
+
+    def test_map_concurrently_cap(self):
+        lock = threading.Lock()
+        running = 0
+        max_running = 0
+
+        def func(item):
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+            if item == 3:
+                raise ValueError(item)
+            return item * 10
+
+        futures = map_concurrently(func, range(10), max_concurrency=2)
+        self.assertLessEqual(max_running, 2)
+        self.assertEqual([future.result() for future in futures if future.exception() is None],
+                         [0, 10, 20, 40, 50, 60, 70, 80, 90])
+        self.assertIsInstance(futures[3].exception(), ValueError)
@@ -0,0 +1,87 @@
+from unittest import TestCase, mock
+
+from macos_proxy_settings import simple_settings
+from macos_proxy_settings.cache import ProxyInfoCache
+from macos_proxy_settings.memory import INJECTED_ERROR, INVALID_PARAMETERS_ERROR, MemoryBackend
+from macos_proxy_settings.networksetup import ProxyInfo
+from macos_proxy_settings.simple_settings import ProxyTypes
+
+
+class TestsMemoryBackend(TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend(networkservices=["Wi-Fi", "Ethernet"])
+
+    def test_set_proxy(self):
+        res = self.backend.set_proxy(command="setsocksfirewallproxy", networkservice="Wi-Fi",
+                                     domain="127.0.0.1", port="1080", username="user", password="password")
+        self.assertEqual(res, "")
+        self.assertEqual(
+            self.backend.get_proxy(command="getsocksfirewallproxy", networkservice="Wi-Fi"),
+            ProxyInfo(enabled=True, server="127.0.0.1", port="1080", authenticated=True),
+        )
+        self.assertFalse(self.backend.get_proxy(command="getsocksfirewallproxy", networkservice="Ethernet").enabled)
+        self.assertFalse(self.backend.get_proxy(command="getwebproxy", networkservice="Wi-Fi").enabled)
+
+        self.backend.set_proxy_state(command="setsocksfirewallproxystate", networkservice="Wi-Fi", enabled=False)
+        self.assertFalse(self.backend.get_proxy(command="getsocksfirewallproxy", networkservice="Wi-Fi").enabled)
+        self.assertEqual(self.backend.call_count["getsocksfirewallproxy"], 3)
+
+    def test_unknown_networkservice(self):
+        res = self.backend.set_proxy_state(command="setwebproxystate", networkservice="Bluetooth", enabled=True)
+        self.assertEqual(res, INVALID_PARAMETERS_ERROR)
+        with self.assertRaises(ValueError):
+            self.backend.get_proxy(command="getwebproxy", networkservice="Bluetooth")
+
+    def test_fail_next(self):
+        self.backend.fail_next(count=2)
+        self.assertEqual(self.backend.set_proxy_state(command="setwebproxystate", networkservice="Wi-Fi",
+                                                      enabled=True), INJECTED_ERROR)
+        with self.assertRaises(ValueError):
+            self.backend.listnetworkserviceorder()
+        self.assertEqual([item.networkservice for item in self.backend.listnetworkserviceorder()],
+                         ["Wi-Fi", "Ethernet"])
+
+    def test_bypass_domains(self):
+        self.assertEqual(self.backend.getproxybypassdomains(networkservice="Wi-Fi"), [])
+        self.assertEqual(self.backend.setproxybypassdomains(networkservice="Wi-Fi", domains=["*.local"]), "")
+        self.assertEqual(self.backend.getproxybypassdomains(networkservice="Wi-Fi"), ["*.local"])
+        self.assertEqual(self.backend.getproxybypassdomains(networkservice="Ethernet"), [])
+        self.assertEqual(self.backend.setproxybypassdomains(networkservice="Bluetooth", domains=[]),
+                         INVALID_PARAMETERS_ERROR)
+
+    def test_failure_rate(self):
+        backend = MemoryBackend(networkservices=["Wi-Fi"], failure_rate=0.5, seed=1)
+        results = [backend.set_proxy_state(command="setwebproxystate", networkservice="Wi-Fi", enabled=True)
+                   for _ in range(200)]
+        self.assertTrue(50 < results.count(INJECTED_ERROR) < 150)
+
+
+class TestsSimpleSettingsMemoryBackend(TestCase):
+    def setUp(self):
+        self.networkservices = [f"Service {index}" for index in range(2000)]
+        self.backend = MemoryBackend(networkservices=self.networkservices)
+        patches = [
+            mock.patch.object(simple_settings, "_proxy_backend"),
+            mock.patch.object(simple_settings, "_proxy_reader"),
+            mock.patch.object(simple_settings, "_proxy_info_cache", ProxyInfoCache(ttl=0)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        simple_settings.set_proxy_backend(self.backend)
+
+    def test_apply_to_many_networkservices(self):
+        for networkservice in self.networkservices:
+            simple_settings.apply_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice=networkservice,
+                                        enabled=True, domain="127.0.0.1", port="8080")
+        for networkservice in self.networkservices:
+            res = simple_settings.get_proxy(proxy_type=ProxyTypes.HTTP_HTTPS, networkservice=networkservice)
+            self.assertEqual(res, ProxyInfo(enabled=True, server="127.0.0.1", port="8080", authenticated=False))
+        self.assertEqual(self.backend.call_count["setwebproxy"], 2000)
+        self.assertEqual(len(simple_settings.list_networkservices()), 2000)
+
+    def test_injected_failure(self):
+        self.backend.fail_next()
+        with self.assertRaisesRegex(ValueError, "Injected failure"):
+            simple_settings.apply_proxy(proxy_type=ProxyTypes.SOCKS, networkservice="Service 0",
+                                        enabled=True, domain="127.0.0.1", port="1080")
@@ -0,0 +1,62 @@
+from unittest import TestCase, mock
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.metrics import METRICS, Histogram, Metrics, configure_metrics, timed
+from macos_proxy_settings.testing import use_stand_in
+
+
+class TestsMetrics(TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for duration_ms in [0.5, 3, 3, 4, 7000]:
+            histogram.add(duration_ms=duration_ms, error=duration_ms > 5000)
+        res = histogram.to_dict()
+        self.assertEqual(res["count"], 5)
+        self.assertEqual(res["errors"], 1)
+        self.assertEqual(res["buckets"], {"le_1": 1, "le_5": 3, "inf": 1})
+        self.assertEqual(res["p50_ms"], 5)
+        self.assertEqual(res["p95_ms"], 7000)
+
+    def test_summary_reset(self):
+        metrics = Metrics(enabled=True)
+        metrics.record("networksetup.getwebproxy", 0.01)
+        metrics.record("monitoring_iteration", 0.01)
+        summary = metrics.summary(reset=True)
+        self.assertEqual(summary["spawns"], 1)
+        self.assertEqual(set(summary["metrics"]), {"networksetup.getwebproxy", "monitoring_iteration"})
+        self.assertEqual(metrics.summary()["metrics"], {})
+
+    def test_timed(self):
+        self.addCleanup(configure_metrics, METRICS.enabled)
+        self.addCleanup(METRICS.summary, reset=True)
+
+        @timed("test.fail")
+        def fail():
+            raise ValueError()
+
+        configure_metrics(enabled=False)
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertNotIn("test.fail", METRICS.summary()["metrics"])
+
+        configure_metrics(enabled=True)
+        with self.assertRaises(ValueError):
+            fail()
+        self.assertEqual(METRICS.summary()["metrics"]["test.fail"]["errors"], 1)
+
+
+class TestsNetworksetupMetrics(TestCase):
+    def setUp(self):
+        use_stand_in(self, networkservices=["Wi-Fi"])
+        patch = mock.patch.object(METRICS, "enabled", True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        METRICS.summary(reset=True)
+
+    def test_commands_are_recorded(self):
+        networksetup.getwebproxy(networkservice="Wi-Fi")
+        networksetup.setwebproxystate(networkservice="Bluetooth", enabled=True)
+        summary = METRICS.summary(reset=True)
+        self.assertEqual(summary["spawns"], 2)
+        self.assertEqual(summary["metrics"]["networksetup.getwebproxy"]["errors"], 0)
+        self.assertEqual(summary["metrics"]["networksetup.setwebproxystate"]["errors"], 1)
@@ -1,6 +1,8 @@
 from unittest import TestCase
 
 from macos_proxy_settings.networksetup import *
+from macos_proxy_settings.services import NetworkserviceIndex
+from macos_proxy_settings.testing import make_store, use_stand_in, write_store
 
 
 class TestsNetworkSetup(TestCase):
@@ -69,3 +71,80 @@ class TestsNetworkSetup(TestCase):
     def test_listnetworkserviceorder(self):
         res = listnetworkserviceorder()
         print(res)
+
+
+class TestsParseNetworksetup(TestCase):
+    def test_parse_proxy_info(self):
+        stdout = "Enabled: Yes\nServer: 127.0.0.1\nPort: 1080\nAuthenticated Proxy Enabled: 1\n"
+        self.assertEqual(
+            parse_proxy_info(stdout),
+            ProxyInfo(enabled=True, server="127.0.0.1", port="1080", authenticated=True),
+        )
+        self.assertEqual(
+            parse_proxy_info("Enabled: No\nServer: \nPort: 0\n"),
+            ProxyInfo(enabled=False, server="", port="0", authenticated=None),
+        )
+
+    def test_parse_proxy_info_error(self):
+        with self.assertRaises(ValueError):
+            parse_proxy_info("Wi-Fi is not a recognized network service.\n** Error: The parameters were not valid.\n")
+
+    def test_parse_autoproxy_info(self):
+        self.assertEqual(
+            parse_autoproxy_info("URL: http://127.0.0.1:18081/Wi-Fi.pac\nEnabled: Yes\n"),
+            AutoProxyInfo(url="http://127.0.0.1:18081/Wi-Fi.pac", enabled=True),
+        )
+        self.assertEqual(parse_autoproxy_info("URL: (null)\nEnabled: No\n"), AutoProxyInfo(url="", enabled=False))
+        with self.assertRaises(ValueError):
+            parse_autoproxy_info("** Error: The parameters were not valid.\n")
+
+    def test_parse_proxybypassdomains(self):
+        self.assertEqual(parse_proxybypassdomains("*.local\n169.254/16\n"), ["*.local", "169.254/16"])
+        self.assertEqual(parse_proxybypassdomains("There aren't any bypass domains set on Wi-Fi.\n"), [])
+        with self.assertRaises(ValueError):
+            parse_proxybypassdomains("Bluetooth is not a recognized network service.\n"
+                                     "** Error: The parameters were not valid.\n")
+
+    def test_parse_listnetworkserviceorder(self):
+        lines = ["An asterisk (*) denotes that a network service is disabled."]
+        for index in range(1, 13):
+            lines += [f"({index}) Service {index}", f"(Hardware Port: Port {index}, Device: en{index})", ""]
+        res = parse_listnetworkserviceorder("\n".join(lines))
+        self.assertEqual([item.index for item in res], list(range(1, 13)))
+        self.assertEqual(res[11], Networkservice(index=12, networkservice="Service 12",
+                                                 hardware_port="Port 12", device="en12"))
+
+    def test_parse_listnetworkserviceorder_disabled(self):
+        res = parse_listnetworkserviceorder(
+            "An asterisk (*) denotes that a network service is disabled.\n"
+            "(1) Wi-Fi\n(Hardware Port: Wi-Fi, Device: en0)\n\n"
+            "(*) Bluetooth PAN\n(Hardware Port: Bluetooth PAN, Device: en6)\n"
+        )
+        self.assertEqual(res[1], Networkservice(index=None, networkservice="Bluetooth PAN",
+                                                hardware_port="Bluetooth PAN", device="en6", enabled=False))
+        self.assertTrue(res[0].enabled)
+
+
+class TestsNetworkSetupStandIn(TestCase):
+    def setUp(self):
+        self.tmp_path = use_stand_in(self, networkservices=["Wi-Fi"])
+
+    def test_listnetworkserviceorder_disabled(self):
+        store = make_store(networkservices=["Wi-Fi", "Bluetooth PAN"])
+        store["services"][1]["enabled"] = False
+        write_store(path=self.tmp_path / "store.json", store=store)
+        res = listnetworkserviceorder()
+        self.assertEqual([(item.networkservice, item.enabled) for item in res],
+                         [("Wi-Fi", True), ("Bluetooth PAN", False)])
+        index = NetworkserviceIndex(list_networkservices=listnetworkserviceorder)
+        self.assertTrue(index.is_known("Bluetooth PAN"))
+        self.assertFalse(index.get("Bluetooth PAN").enabled)
+        self.assertFalse(index.is_known("Bluetooth"))
+
+    def test_autoproxy(self):
+        self.assertEqual(getautoproxyurl(networkservice="Wi-Fi"), AutoProxyInfo(url="", enabled=False))
+        setautoproxyurl(networkservice="Wi-Fi", url="http://127.0.0.1:18081/Wi-Fi.pac")
+        self.assertEqual(getautoproxyurl(networkservice="Wi-Fi"),
+                         AutoProxyInfo(url="http://127.0.0.1:18081/Wi-Fi.pac", enabled=True))
+        setautoproxystate(networkservice="Wi-Fi", enabled=False)
+        self.assertFalse(getautoproxyurl(networkservice="Wi-Fi").enabled)
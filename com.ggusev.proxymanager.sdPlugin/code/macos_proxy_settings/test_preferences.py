@@ -0,0 +1,128 @@
+import os
+import plistlib
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from macos_proxy_settings import simple_settings
+from macos_proxy_settings.cache import ProxyInfoCache
+from macos_proxy_settings.networksetup import ProxyInfo
+from macos_proxy_settings.preferences import PreferencesReader
+from macos_proxy_settings.simple_settings import ApplyActions, ApplyCommand, ProxyTypes, apply_proxy
+
+WIFI_ID = "8A6B4F4C-1B5E-4C1F-9F53-0C2B8A1D5E01"
+ETHERNET_ID = "1F2E3D4C-5B6A-4978-8695-A4B3C2D1E0F9"
+REMOVED_ID = "00000000-0000-0000-0000-000000000000"
+
+FIXTURE_PREFERENCES = {
+    "CurrentSet": "/Sets/SET-1",
+    "NetworkServices": {
+        WIFI_ID: {
+            "UserDefinedName": "Wi-Fi",
+            "Interface": {"DeviceName": "en0", "Hardware": "AirPort"},
+            "Proxies": {
+                "HTTPEnable": 1,
+                "HTTPProxy": "192.168.158.9",
+                "HTTPPort": 3128,
+                "HTTPSEnable": 0,
+                "HTTPSProxy": "192.168.158.9",
+                "HTTPSPort": 3129,
+                "SOCKSEnable": 1,
+                "SOCKSProxy": "127.0.0.1",
+                "SOCKSPort": 1080,
+            },
+        },
+        ETHERNET_ID: {
+            "UserDefinedName": "Ethernet",
+            "Interface": {"DeviceName": "en1", "Hardware": "Ethernet"},
+            "Proxies": {
+                "ExceptionsList": ["*.local", "169.254/16"],
+            },
+        },
+        REMOVED_ID: {
+            "UserDefinedName": "Old VPN",
+            "Proxies": {"SOCKSEnable": 1, "SOCKSProxy": "10.0.0.1", "SOCKSPort": 1080},
+        },
+    },
+    "Sets": {
+        "SET-1": {
+            "Network": {
+                "Service": {
+                    WIFI_ID: {"__LINK__": f"/NetworkServices/{WIFI_ID}"},
+                    ETHERNET_ID: {"__LINK__": f"/NetworkServices/{ETHERNET_ID}"},
+                },
+            },
+        },
+    },
+}
+
+
+class TestsPreferencesReader(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "preferences.plist"
+        self.write_preferences(FIXTURE_PREFERENCES)
+        self.reader = PreferencesReader(path=self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_preferences(self, preferences: dict, mtime_ns: int = 1_000_000_000):
+        with open(self.path, "wb") as f:
+            plistlib.dump(preferences, f, fmt=plistlib.FMT_BINARY)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_get_proxy(self):
+        self.assertEqual(
+            self.reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi"),
+            ProxyInfo(enabled=True, server="192.168.158.9", port="3128"),
+        )
+        self.assertEqual(
+            self.reader.get_proxy(command="getsecurewebproxy", networkservice="Wi-Fi"),
+            ProxyInfo(enabled=False, server="192.168.158.9", port="3129"),
+        )
+        self.assertEqual(
+            self.reader.get_proxy(command="getsocksfirewallproxy", networkservice="Wi-Fi"),
+            ProxyInfo(enabled=True, server="127.0.0.1", port="1080"),
+        )
+
+    def test_get_proxy_not_configured(self):
+        res = self.reader.get_proxy(command="getwebproxy", networkservice="Ethernet")
+        self.assertEqual(res, ProxyInfo(enabled=False, server="", port="0"))
+
+    def test_get_proxy_service_not_in_current_set(self):
+        with self.assertRaises(ValueError):
+            self.reader.get_proxy(command="getsocksfirewallproxy", networkservice="Old VPN")
+
+    def test_get_proxy_unknown_networkservice(self):
+        with self.assertRaises(ValueError):
+            self.reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi 2")
+
+    def test_parse_once(self):
+        for _ in range(10):
+            self.reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi")
+            self.reader.get_proxy(command="getsecurewebproxy", networkservice="Ethernet")
+        self.assertEqual(self.reader.parse_count, 1)
+
+    def test_reparse_on_change(self):
+        self.reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi")
+        preferences = plistlib.loads(plistlib.dumps(FIXTURE_PREFERENCES))
+        preferences["NetworkServices"][WIFI_ID]["Proxies"]["HTTPEnable"] = 0
+        self.write_preferences(preferences, mtime_ns=2_000_000_000)
+
+        res = self.reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi")
+        self.assertFalse(res.enabled)
+        self.assertEqual(self.reader.parse_count, 2)
+
+    def test_get_networkservice(self):
+        self.assertEqual(self.reader.get_networkservice(service_id=WIFI_ID), "Wi-Fi")
+        self.assertIsNone(self.reader.get_networkservice(service_id=REMOVED_ID))
+
+    def test_apply_proxy_of_unknown_authentication(self):
+        set_proxy = mock.Mock(return_value="")
+        with mock.patch.object(simple_settings, "_proxy_reader", self.reader), \
+                mock.patch.object(simple_settings, "_proxy_info_cache", ProxyInfoCache(ttl=0)), \
+                mock.patch.object(simple_settings, "set_proxy", set_proxy):
+            res = apply_proxy(ProxyTypes.SOCKS, networkservice="Wi-Fi", enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(res, [ApplyCommand(proxy_type=ProxyTypes.SOCKS, action=ApplyActions.SET_PROXY)])
+        set_proxy.assert_called_once()
@@ -0,0 +1,171 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import List, Optional, Set
+from unittest import TestCase, mock
+
+from macos_proxy_settings import simple_settings
+from macos_proxy_settings.cache import ProxyInfoCache
+from macos_proxy_settings.networksetup import ProxyInfo
+from macos_proxy_settings.scutil import ProxiesWatcher, ScutilOutputParser, ScutilReader, ScutilSession
+from macos_proxy_settings.simple_settings import ApplyActions, ApplyCommand, ProxyTypes, apply_proxy
+from macos_proxy_settings.testing import use_stand_in
+
+WIFI_ID = "8A6B4F4C-1B5E-4C1F-9F53-0C2B8A1D5E01"
+UNKNOWN_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class TestsProxiesWatcher(TestCase):
+    def setUp(self):
+        tmp_path = use_stand_in(self, names=("scutil",))
+        self.notifications_path = tmp_path / "notifications.txt"
+        os.environ["FAKE_SCUTIL_NOTIFICATIONS"] = str(self.notifications_path)
+
+        self.changes: List[Optional[Set[str]]] = []
+        self.changed = threading.Event()
+        self.closed = threading.Event()
+
+    def on_change(self, networkservices: Optional[Set[str]]):
+        self.changes.append(networkservices)
+        if len(self.changes) == 3:
+            self.changed.set()
+
+    def make_watcher(self, scutil_command: str = "scutil") -> ProxiesWatcher:
+        return ProxiesWatcher(
+            on_change=self.on_change,
+            resolve_networkservice={WIFI_ID: "Wi-Fi"}.get,
+            on_close=self.closed.set,
+            scutil_command=scutil_command,
+        )
+
+    def test_changes(self):
+        self.notifications_path.write_text("\n".join([
+            f"Setup:/Network/Service/{WIFI_ID}/Proxies",
+            f"Setup:/Network/Service/{WIFI_ID}/IPv4",
+            f"Setup:/Network/Service/{UNKNOWN_ID}/Proxies",
+            "State:/Network/Global/Proxies",
+        ]))
+        watcher = self.make_watcher()
+        self.assertTrue(watcher.start())
+        try:
+            self.assertTrue(self.changed.wait(timeout=5))
+            self.assertEqual(self.changes, [{"Wi-Fi"}, None, None])
+            self.assertTrue(watcher.running)
+        finally:
+            watcher.stop()
+        self.assertFalse(watcher.running)
+        self.assertFalse(self.closed.wait(timeout=0.2))
+
+    def test_unavailable(self):
+        watcher = self.make_watcher(scutil_command="scutil-does-not-exist")
+        with self.assertLogs("macos_proxy_settings.scutil", level="WARNING"):
+            self.assertFalse(watcher.start())
+
+    def test_on_close_when_scutil_exits(self):
+        self.notifications_path.write_text("")
+        watcher = self.make_watcher()
+        watcher.start()
+        watcher._process.kill()
+        self.assertTrue(self.closed.wait(timeout=5))
+
+
+class TestsScutilOutputParser(TestCase):
+    def feed_all(self, text: str) -> list:
+        parser = ScutilOutputParser()
+        replies = []
+        for line in text.splitlines(keepends=True):
+            reply = parser.feed(line)
+            if reply is not None:
+                replies.append(reply[0])
+        return replies
+
+    def test_dictionary(self):
+        text = (
+            "<dictionary> {\n"
+            "  ExceptionsList : <array> {\n"
+            "    0 : *.local\n"
+            "    1 : 169.254/16\n"
+            "  }\n"
+            "  HTTPEnable : 1\n"
+            "  HTTPPort : 3128\n"
+            "  HTTPProxy : 192.168.158.9\n"
+            "}\n"
+            "  No such key\n"
+        )
+        self.assertEqual(self.feed_all(text), [
+            {
+                "ExceptionsList": ["*.local", "169.254/16"],
+                "HTTPEnable": "1",
+                "HTTPPort": "3128",
+                "HTTPProxy": "192.168.158.9",
+            },
+            None,
+        ])
+
+
+class TestsScutilSession(TestCase):
+    def setUp(self):
+        use_stand_in(
+            self,
+            networkservices=["Wi-Fi", "Ethernet"],
+            proxies={"SOCKSEnable": 1, "SOCKSProxy": "127.0.0.1", "SOCKSPort": 1080},
+            names=("scutil",),
+        )
+        self.session = ScutilSession(timeout=5)
+        self.addCleanup(self.session.close)
+
+    def test_reader_get_proxy(self):
+        reader = ScutilReader(session=self.session)
+        self.assertEqual(
+            reader.get_proxy(command="getsocksfirewallproxy", networkservice="Ethernet"),
+            ProxyInfo(enabled=True, server="127.0.0.1", port="1080"),
+        )
+        self.assertEqual(
+            reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi"),
+            ProxyInfo(enabled=False, server="", port="0"),
+        )
+        with self.assertRaises(ValueError):
+            reader.get_proxy(command="getwebproxy", networkservice="Wi-Fi 2")
+
+    def test_apply_proxy_of_unknown_authentication(self):
+        set_proxy = mock.Mock(return_value="")
+        with mock.patch.object(simple_settings, "_proxy_reader", ScutilReader(session=self.session)), \
+                mock.patch.object(simple_settings, "_proxy_info_cache", ProxyInfoCache(ttl=0)), \
+                mock.patch.object(simple_settings, "set_proxy", set_proxy):
+            res = apply_proxy(ProxyTypes.SOCKS, networkservice="Wi-Fi", enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(res, [ApplyCommand(proxy_type=ProxyTypes.SOCKS, action=ApplyActions.SET_PROXY)])
+        set_proxy.assert_called_once()
+
+    def test_concurrent_callers_share_one_process(self):
+        reader = ScutilReader(session=self.session)
+        networkservices = ["Wi-Fi", "Ethernet"] * 50
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(
+                lambda networkservice: reader.get_proxy(command="getsocksfirewallproxy", networkservice=networkservice),
+                networkservices,
+            ))
+        self.assertTrue(all(result.server == "127.0.0.1" for result in results))
+        self.assertEqual(self.session.restart_count, 0)
+
+    def test_restart_on_crash(self):
+        self.assertIsNone(self.session.show("State:/Missing"))
+        self.session._connection.process.kill()
+        self.session._connection.process.wait()
+        for _ in range(3):
+            try:
+                self.assertIsNone(self.session.show("State:/Missing"))
+                break
+            except ConnectionError:
+                continue
+        self.assertEqual(self.session.restart_count, 1)
+
+    def test_timeout(self):
+        os.environ["FAKE_LATENCY"] = "1"
+        session = ScutilSession(timeout=0.1)
+        try:
+            with self.assertLogs("macos_proxy_settings.scutil", level="WARNING"):
+                with self.assertRaises(TimeoutError):
+                    session.show("State:/Missing")
+            self.assertTrue(session._connection.closed)
+        finally:
+            session.close()
@@ -0,0 +1,94 @@
+import copy
+import os
+import plistlib
+import tempfile
+from pathlib import Path
+from typing import List
+from unittest import TestCase
+
+from macos_proxy_settings.networksetup import Networkservice
+from macos_proxy_settings.preferences import PreferencesReader
+from macos_proxy_settings.services import NetworkserviceIndex, NetworkserviceInfo
+from macos_proxy_settings.test_preferences import ETHERNET_ID, FIXTURE_PREFERENCES, WIFI_ID
+
+
+class TestsNetworkserviceIndex(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = Path(self.tmp_dir.name) / "preferences.plist"
+        self.preferences = copy.deepcopy(FIXTURE_PREFERENCES)
+        self.write_preferences(mtime_ns=1_000_000_000)
+        self.listed = [
+            Networkservice(index=1, networkservice="Wi-Fi", hardware_port="Wi-Fi", device="en0"),
+            Networkservice(index=2, networkservice="Ethernet", hardware_port="Ethernet", device="en1"),
+        ]
+        self.fail = False
+        self.index = NetworkserviceIndex(
+            list_networkservices=self.list_networkservices,
+            preferences=PreferencesReader(path=self.path),
+        )
+
+    def list_networkservices(self) -> List[Networkservice]:
+        if self.fail:
+            raise ValueError("networksetup failed")
+        return list(self.listed)
+
+    def write_preferences(self, mtime_ns: int):
+        with open(self.path, "wb") as f:
+            plistlib.dump(self.preferences, f, fmt=plistlib.FMT_BINARY)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_get(self):
+        self.assertEqual(
+            self.index.get("Wi-Fi"),
+            NetworkserviceInfo(networkservice="Wi-Fi", index=1, hardware_port="Wi-Fi", device="en0",
+                               service_id=WIFI_ID),
+        )
+        self.assertEqual(self.index.get("Ethernet").service_id, ETHERNET_ID)
+        self.assertIsNone(self.index.get("Wi-Fi 2"))
+        self.assertEqual(self.index.names(), ["Wi-Fi", "Ethernet"])
+        self.assertEqual(self.index.list_count, 1)
+
+    def test_is_known_warm(self):
+        self.assertTrue(self.index.is_known_warm("USB LAN"))  # nothing listed yet
+        self.assertEqual(self.index.list_count, 0)
+        self.index.names()
+        self.assertTrue(self.index.is_known_warm("Wi-Fi"))
+        self.assertFalse(self.index.is_known_warm("USB LAN"))
+
+        self.preferences["NetworkServices"][ETHERNET_ID]["UserDefinedName"] = "USB LAN"
+        self.write_preferences(mtime_ns=2_000_000_000)
+        self.assertFalse(self.index.is_known_warm("USB LAN"))  # until the next listing
+        self.assertEqual(self.index.list_count, 1)
+
+    def test_listed_again_only_when_services_change(self):
+        self.assertFalse(self.index.is_known("USB LAN"))
+        self.write_preferences(mtime_ns=2_000_000_000)  # proxies changed, services did not
+        self.assertFalse(self.index.is_known("USB LAN"))
+        self.assertEqual(self.index.list_count, 1)
+
+        self.preferences["NetworkServices"][ETHERNET_ID]["UserDefinedName"] = "USB LAN"
+        self.listed[1] = Networkservice(index=2, networkservice="USB LAN", hardware_port="Ethernet", device="en1")
+        self.write_preferences(mtime_ns=3_000_000_000)
+        self.assertTrue(self.index.is_known("USB LAN"))
+        self.assertFalse(self.index.is_known("Ethernet"))
+        self.assertEqual(self.index.list_count, 2)
+
+    def test_without_preferences(self):
+        index = NetworkserviceIndex(list_networkservices=self.list_networkservices,
+                                    preferences=PreferencesReader(path=self.path.with_name("missing.plist")))
+        self.assertEqual(index.names(), ["Wi-Fi", "Ethernet"])
+        self.assertIsNone(index.get("Wi-Fi").service_id)
+        index.names()
+        self.assertEqual(index.list_count, 1)
+        index.invalidate()
+        index.names()
+        self.assertEqual(index.list_count, 2)
+
+    def test_listing_fails(self):
+        self.fail = True
+        self.assertTrue(self.index.is_known("Anything"))
+        self.assertEqual(self.index.names(), [])
+        self.fail = False
+        self.assertFalse(self.index.is_known("Anything"))
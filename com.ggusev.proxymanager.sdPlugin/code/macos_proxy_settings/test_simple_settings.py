@@ -1,12 +1,22 @@
-from unittest import TestCase
+from typing import List
+from unittest import TestCase, mock
 
+from macos_proxy_settings import simple_settings
+from macos_proxy_settings.cache import ProxyInfoCache
+from macos_proxy_settings.networksetup import ProxyInfo
 from macos_proxy_settings.simple_settings import (
+    PROXY_TYPE_TO_GET_COMMAND,
+    ApplyActions,
+    ApplyCommand,
     ProxyTypes,
+    apply_proxy,
     set_proxy,
     set_proxy_state,
     get_proxy,
 )
 
+GET_COMMAND_TO_PROXY_TYPE = {command: proxy_type for proxy_type, command in PROXY_TYPE_TO_GET_COMMAND.items()}
+
 
 class TestsSimpleSettings(TestCase):
     def test_set_proxy(self):
@@ -70,3 +80,87 @@ class TestsSimpleSettings(TestCase):
             networkservice="Wi-Fi"
         )
         print(res)
+
+
+class TestsApplyProxy(TestCase):
+    def setUp(self):
+        self.current = {
+            ProxyTypes.HTTP: ProxyInfo(enabled=False, server="127.0.0.1", port="1080", authenticated=False),
+            ProxyTypes.HTTPS: ProxyInfo(enabled=True, server="127.0.0.1", port="1080", authenticated=False),
+            ProxyTypes.SOCKS: ProxyInfo(enabled=False, server="10.0.0.1", port="1080", authenticated=False),
+        }
+        self.reader = mock.Mock()
+        self.reader.get_proxy.side_effect = lambda command, networkservice: self.current[
+            GET_COMMAND_TO_PROXY_TYPE[command]
+        ]
+        self.set_proxy = mock.Mock()
+        self.set_proxy_state = mock.Mock()
+        patches = [
+            mock.patch.object(simple_settings, "_proxy_reader", self.reader),
+            mock.patch.object(simple_settings, "_proxy_info_cache", ProxyInfoCache(ttl=60)),
+            mock.patch.object(simple_settings, "set_proxy", self.set_proxy),
+            mock.patch.object(simple_settings, "set_proxy_state", self.set_proxy_state),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def apply(self, proxy_type: ProxyTypes, enabled: bool, **kwargs) -> List[ApplyCommand]:
+        return apply_proxy(proxy_type=proxy_type, networkservice="Wi-Fi", enabled=enabled, **kwargs)
+
+    def test_matching_server_only_sets_state(self):
+        commands = self.apply(ProxyTypes.HTTP_HTTPS, enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.HTTP, action=ApplyActions.SET_STATE)])
+        self.set_proxy.assert_not_called()
+        self.set_proxy_state.assert_called_once_with(
+            proxy_type=ProxyTypes.HTTP,
+            networkservice="Wi-Fi",
+            enabled=True,
+        )
+
+    def test_already_applied(self):
+        self.assertEqual(self.apply(ProxyTypes.HTTPS, enabled=True, domain="127.0.0.1", port="1080"), [])
+        self.assertEqual(self.apply(ProxyTypes.SOCKS, enabled=False), [])
+        self.set_proxy.assert_not_called()
+        self.set_proxy_state.assert_not_called()
+
+    def test_other_server_is_written(self):
+        commands = self.apply(ProxyTypes.SOCKS, enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.SOCKS, action=ApplyActions.SET_PROXY)])
+        self.set_proxy.assert_called_once_with(
+            proxy_type=ProxyTypes.SOCKS,
+            networkservice="Wi-Fi",
+            domain="127.0.0.1",
+            port="1080",
+            username="",
+            password="",
+        )
+
+    def test_credentials_are_always_written(self):
+        commands = self.apply(ProxyTypes.HTTPS, enabled=True, domain="127.0.0.1", port="1080",
+                              username="user", password="password")
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.HTTPS, action=ApplyActions.SET_PROXY)])
+
+        self.current[ProxyTypes.HTTPS] = ProxyInfo(enabled=True, server="127.0.0.1", port="1080", authenticated=True)
+        commands = self.apply(ProxyTypes.HTTPS, enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.HTTPS, action=ApplyActions.SET_PROXY)])
+
+    def test_unknown_authentication_is_written(self):
+        self.current[ProxyTypes.HTTPS] = ProxyInfo(enabled=True, server="127.0.0.1", port="1080")
+        commands = self.apply(ProxyTypes.HTTPS, enabled=True, domain="127.0.0.1", port="1080")
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.HTTPS, action=ApplyActions.SET_PROXY)])
+
+    def test_disable_only_enabled_halves(self):
+        commands = self.apply(ProxyTypes.HTTP_HTTPS, enabled=False)
+        self.assertEqual(commands, [ApplyCommand(proxy_type=ProxyTypes.HTTPS, action=ApplyActions.SET_STATE)])
+        self.set_proxy_state.assert_called_once_with(
+            proxy_type=ProxyTypes.HTTPS,
+            networkservice="Wi-Fi",
+            enabled=False,
+        )
+
+    def test_reads_bypass_cache(self):
+        simple_settings.get_proxy(proxy_type=ProxyTypes.SOCKS, networkservice="Wi-Fi")
+        self.current[ProxyTypes.SOCKS] = ProxyInfo(enabled=True, server="10.0.0.1", port="1080", authenticated=False)
+        self.assertEqual(self.apply(ProxyTypes.SOCKS, enabled=True, domain="10.0.0.1", port="1080"), [])
+        self.assertEqual(self.reader.get_proxy.call_count, 2)
@@ -0,0 +1,267 @@
+"""
+Stand-in executables for the macOS tools used by this package.
+They let the package run off a Mac: put them in a directory and prepend it to PATH.
+
+Both stand-ins serve the JSON store at $FAKE_PROXY_STORE, see make_store.
+$FAKE_LATENCY delays every networksetup run and every scutil command, in seconds.
+"""
+import json
+import os
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from unittest import TestCase, mock
+
+# Understands "show <key>", "n.add <key> [pattern]" and "n.watch".
+# After n.watch it prints a notification for every line of $FAKE_SCUTIL_NOTIFICATIONS
+# that matches an added key, then keeps running until stdin is closed.
+FAKE_SCUTIL = r'''
+import json
+import os
+import re
+import sys
+import time
+
+
+def load_store():
+    store_path = os.environ.get("FAKE_PROXY_STORE")
+    if not store_path:
+        return {"services": []}
+    with open(store_path) as f:
+        return json.load(f)
+
+
+def store_value(key):
+    services = load_store()["services"]
+    if key == "Setup:/Network/Global/IPv4":
+        return {"ServiceOrder": [service["id"] for service in services]}
+    for service in services:
+        service_key = f"Setup:/Network/Service/{service['id']}"
+        if key == service_key:
+            return {"UserDefinedName": service["name"]}
+        if key == f"{service_key}/Proxies":
+            return service["proxies"]
+    return None
+
+
+def format_value(value, indent):
+    if isinstance(value, dict):
+        items = value.items()
+        kind = "dictionary"
+    elif isinstance(value, list):
+        items = enumerate(value)
+        kind = "array"
+    else:
+        return str(value)
+    lines = [f"<{kind}> {{"]
+    for key, item in items:
+        lines.append(f"{indent}  {key} : {format_value(item, indent + '  ')}")
+    lines.append(f"{indent}}}")
+    return "\n".join(lines)
+
+
+def main():
+    latency = float(os.environ.get("FAKE_LATENCY", "0"))
+    watched = []
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+        command, args = parts[0], parts[1:]
+        time.sleep(latency)
+        if command == "show":
+            value = store_value(args[0])
+            if value is None:
+                sys.stdout.write("  No such key\n")
+            else:
+                sys.stdout.write(format_value(value, "") + "\n")
+            sys.stdout.flush()
+        elif command == "n.add":
+            if len(args) > 1 and args[1] == "pattern":
+                watched.append(re.compile(args[0]))
+            else:
+                watched.append(re.compile(re.escape(args[0])))
+        elif command == "n.watch":
+            notifications_path = os.environ.get("FAKE_SCUTIL_NOTIFICATIONS")
+            if not notifications_path:
+                continue
+            with open(notifications_path) as f:
+                changed_keys = [key.strip() for key in f if key.strip()]
+            for changed_key in changed_keys:
+                if not any(pattern.fullmatch(changed_key) for pattern in watched):
+                    continue
+                sys.stdout.write("notification callback (store address = 0x600000c00000).\n")
+                sys.stdout.write(f"  changed key [0] = {changed_key}\n")
+                sys.stdout.flush()
+        elif command in ("q", "quit"):
+            return
+
+
+main()
+'''
+
+
+# Understands the networksetup commands wrapped by networksetup.py.
+# set commands are written back to the store, under a lock and atomically, so they can run concurrently.
+FAKE_NETWORKSETUP = r'''
+import fcntl
+import json
+import os
+import sys
+import time
+
+COMMAND_TO_PREFIX = {
+    "webproxy": "HTTP",
+    "securewebproxy": "HTTPS",
+    "socksfirewallproxy": "SOCKS",
+}
+
+
+def main():
+    time.sleep(float(os.environ.get("FAKE_LATENCY", "0")))
+    store_path = os.environ["FAKE_PROXY_STORE"]
+    command, args = sys.argv[1].lstrip("-"), sys.argv[2:]
+    if command.startswith("set"):
+        lock = open(store_path + ".lock", "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    with open(store_path) as f:
+        store = json.load(f)
+
+    if command == "listnetworkserviceorder":
+        print("An asterisk (*) denotes that a network service is disabled.")
+        for index, service in enumerate(store["services"], start=1):
+            print(f"({index if service.get('enabled', True) else '*'}) {service['name']}")
+            print(f"(Hardware Port: {service['hardware_port']}, Device: {service['device']})")
+            print()
+        return
+
+    services = {service["name"]: service for service in store["services"]}
+    service = services.get(args[0]) if args else None
+    if service is None:
+        print(f"{args[0] if args else ''} is not a recognized network service.")
+        print("** Error: The parameters were not valid.")
+        sys.exit(4)
+    proxies = service["proxies"]
+
+    if command == "getproxybypassdomains":
+        domains = proxies.get("ExceptionsList", [])
+        print("\n".join(domains) if domains else f"There aren't any bypass domains set on {args[0]}.")
+        return
+    if command == "getautoproxyurl":
+        print(f"URL: {proxies.get('ProxyAutoConfigURLString') or '(null)'}")
+        print(f"Enabled: {'Yes' if proxies.get('ProxyAutoConfigEnable') else 'No'}")
+        return
+    if command.startswith("get"):
+        prefix = COMMAND_TO_PREFIX[command[3:]]
+        print(f"Enabled: {'Yes' if proxies.get(prefix + 'Enable') else 'No'}")
+        print(f"Server: {proxies.get(prefix + 'Proxy', '')}")
+        print(f"Port: {proxies.get(prefix + 'Port', 0)}")
+        print(f"Authenticated Proxy Enabled: {proxies.get(prefix + 'ProxyAuthenticated', 0)}")
+        return
+    if command == "setproxybypassdomains":
+        proxies["ExceptionsList"] = [] if args[1:] == ["Empty"] else args[1:]
+    elif command == "setautoproxyurl":
+        proxies["ProxyAutoConfigURLString"] = args[1]
+        proxies["ProxyAutoConfigEnable"] = 1
+    elif command == "setautoproxystate":
+        proxies["ProxyAutoConfigEnable"] = 1 if args[1] == "on" else 0
+    elif command.endswith("state"):
+        prefix = COMMAND_TO_PREFIX[command[3:-5]]
+        proxies[prefix + "Enable"] = 1 if args[1] == "on" else 0
+    else:
+        prefix = COMMAND_TO_PREFIX[command[3:]]
+        proxies[prefix + "Enable"] = 1
+        proxies[prefix + "Proxy"] = args[1]
+        proxies[prefix + "Port"] = int(args[2])
+        proxies[prefix + "ProxyAuthenticated"] = 1 if len(args) > 3 and args[3] == "on" else 0
+    with open(store_path + ".tmp", "w") as f:
+        json.dump(store, f)
+    os.replace(store_path + ".tmp", store_path)
+
+
+main()
+'''
+
+
+def make_store(networkservices: List[str], proxies: Optional[dict] = None) -> dict:
+    """
+    Store served by the stand-ins: one service per name, each with a copy of proxies.
+    Set "enabled" of a service to False to disable it.
+    """
+    services = []
+    for index, networkservice in enumerate(networkservices):
+        services.append({
+            "id": f"00000000-0000-0000-0000-{index:012d}",
+            "name": networkservice,
+            "hardware_port": networkservice,
+            "device": f"en{index}",
+            "proxies": dict(proxies or {}),
+        })
+    return {"services": services}
+
+
+def write_store(path: Path, store: dict) -> None:
+    path.write_text(json.dumps(store), encoding="utf-8")
+
+
+def install_stand_in(bin_dir: Path, name: str, source: str) -> Path:
+    """
+    Write an executable Python script called <name> into bin_dir.
+
+    :return: path to the executable
+    """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    path = bin_dir / name
+    path.write_text(f"#!{sys.executable}\n{source}", encoding="utf-8")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def stand_in_environ(bin_dir: Path, environ: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Copy of environ with bin_dir prepended to PATH.
+    """
+    result = dict(os.environ if environ is None else environ)
+    result["PATH"] = os.pathsep.join([str(bin_dir), result.get("PATH", "")])
+    return result
+
+
+STAND_IN_SOURCES = {
+    "networksetup": FAKE_NETWORKSETUP,
+    "scutil": FAKE_SCUTIL,
+}
+
+
+def use_stand_in(
+        test_case: TestCase,
+        networkservices: Optional[List[str]] = None,
+        proxies: Optional[dict] = None,
+        names: Iterable[str] = ("networksetup",),
+        **environ: str,
+) -> Path:
+    """
+    Run the stand-ins for the rest of test_case: install them into a temporary directory,
+    serve make_store(networkservices, proxies) from store.json in it and patch os.environ.
+    Everything is undone on cleanup of test_case.
+
+    :param networkservices: services of the store, None to not write a store
+    :param names: stand-ins to install, keys of STAND_IN_SOURCES
+    :param environ: extra environment variables, like FAKE_LATENCY
+    :return: the temporary directory
+    """
+    tmp_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(tmp_dir.cleanup)
+    tmp_path = Path(tmp_dir.name)
+    for name in names:
+        install_stand_in(bin_dir=tmp_path / "bin", name=name, source=STAND_IN_SOURCES[name])
+    result_environ = stand_in_environ(bin_dir=tmp_path / "bin")
+    if networkservices is not None:
+        write_store(path=tmp_path / "store.json", store=make_store(networkservices=networkservices, proxies=proxies))
+        result_environ["FAKE_PROXY_STORE"] = str(tmp_path / "store.json")
+    result_environ.update(environ)
+    patch = mock.patch.dict(os.environ, result_environ)
+    patch.start()
+    test_case.addCleanup(patch.stop)
+    return tmp_path
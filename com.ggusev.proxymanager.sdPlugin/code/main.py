@@ -1,7 +1,11 @@
+import startup  # first, so it records when main.py started
+
+import dataclasses
+import json
 import time
-from dataclasses import dataclass
 from enum import IntEnum
-from typing import Dict, Union
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Union
 
 from streamdeck_sdk import (
     StreamDeck,
@@ -13,12 +17,46 @@ from streamdeck_sdk import (
 )
 
 import settings
+from commands import KeyCommand, KeyCommandQueue
+from log_pipeline import configure_logging, set_log_level
+from macos_proxy_settings import bypass, networksetup
+from macos_proxy_settings.executor import configure_executor
+from macos_proxy_settings.metrics import METRICS, configure_metrics, timed
+from macos_proxy_settings.preferences import PreferencesReader
+from macos_proxy_settings.services import NetworkserviceIndex
 from macos_proxy_settings.simple_settings import (
+    ApplyCommand,
+    ProxyInfo,
     ProxyTypes,
-    set_proxy,
-    get_proxy,
-    set_proxy_state,
+    apply_proxy,
+    set_proxy_backend,
+    set_read_backend,
+    ReadBackends,
+    cache_stats,
+    configure_cache,
+    invalidate_cache,
+    list_networkservices,
+)
+from monitoring import (
+    MonitoringKey,
+    MonitoringParams,
+    MonitoringRegistry,
+    StateCache,
+    read_autoproxy_infos,
+    read_proxy_infos,
 )
+from scheduler import MonitoringScheduler
+from snapshot import StateSnapshot
+
+if TYPE_CHECKING:
+    from endpoints import Endpoint, EndpointSelection
+    from pac import PacRule, PacServer
+    from prober import ProbeHandshakes, ProbeStats, ProbeTarget
+    from relay import LocalRelay
+
+# the scutil watcher, the memory, replay and recording backends, the relay, the PAC server, the prober
+# and the endpoints are imported when they are used, so the connection to the Stream Deck does not wait for them
+startup.mark("imports_done")
 
 
 class ConnectStates(IntEnum):
@@ -26,31 +64,61 @@ class ConnectStates(IntEnum):
     ENABLED = 1
 
 
-@dataclass
-class MonitoringParams:
-    networkservice: str
-    proxy_type: ProxyTypes
-    domain: str
-    port: str
-
-
-MONITORING_INTERVAL: float = 2
-DELAY_BETWEEN_KEY_DOWN: float = 2.4
-CONTEXT_TO_MONITORING_PARAMS: Dict[str, MonitoringParams] = {}
+MONITORING_REGISTRY: MonitoringRegistry = MonitoringRegistry()
+MONITORING_SCHEDULER: MonitoringScheduler = MonitoringScheduler(
+    fast_interval=settings.MONITORING_FAST_INTERVAL,
+    boost_window=settings.MONITORING_BOOST_WINDOW,
+    max_interval=settings.MONITORING_MAX_INTERVAL,
+)
+STATE_CACHE: StateCache = StateCache()
+STATE_SNAPSHOT: StateSnapshot = StateSnapshot(path=settings.STATE_SNAPSHOT_PATH)
+NETWORKSERVICE_INDEX: NetworkserviceIndex = NetworkserviceIndex(
+    list_networkservices=list_networkservices,
+    preferences=PreferencesReader() if settings.PROXY_BACKEND == "networksetup" else None,
+)
 PROXY_TYPES = ["http", "https", "http(s)", "socks", ]
+# values of relay.UpstreamKinds
+PROXY_TYPE_TO_UPSTREAM_KIND: Dict[ProxyTypes, str] = {
+    ProxyTypes.HTTP: "http",
+    ProxyTypes.HTTPS: "http",
+    ProxyTypes.HTTP_HTTPS: "http",
+    ProxyTypes.SOCKS: "socks5",
+}
+# set by configure_local_relay when LOCAL_RELAY_ENABLED
+LOCAL_RELAY: Optional["LocalRelay"] = None
+# values of pac.PacRouteKinds
+PROXY_TYPE_TO_PAC_ROUTE_KIND: Dict[ProxyTypes, str] = {
+    ProxyTypes.HTTP: "PROXY",
+    ProxyTypes.HTTPS: "PROXY",
+    ProxyTypes.HTTP_HTTPS: "PROXY",
+    ProxyTypes.SOCKS: "SOCKS5",
+}
+# set by configure_pac_server when PAC_SERVER_ENABLED
+PAC_SERVER: Optional["PacServer"] = None
+# networkservices whose auto-proxy URL is known to point at PAC_SERVER
+PAC_POINTED_NETWORKSERVICES: Set[str] = set()
+# values of prober.ProbeHandshakes
+PROXY_TYPE_TO_PROBE_HANDSHAKE: Dict[ProxyTypes, str] = {
+    ProxyTypes.HTTP: "http_connect",
+    ProxyTypes.HTTPS: "http_connect",
+    ProxyTypes.HTTP_HTTPS: "http_connect",
+    ProxyTypes.SOCKS: "socks5",
+}
 
 
 class ConnectDisconnectAction(Action):
     UUID = "com.ggusev.proxymanager.connectdisconnect"
-    LAST_KEY_DOWN_TIME = 0
 
-    def on_key_down(self, obj: events_received_objs.KeyDown) -> None:
-        now = time.time()
-        if now - self.LAST_KEY_DOWN_TIME < DELAY_BETWEEN_KEY_DOWN:
-            self.show_alert(context=obj.context)
-            return
-        self.LAST_KEY_DOWN_TIME = now
+    def __init__(self):
+        super().__init__()
+        self.key_command_queue = KeyCommandQueue(execute=self.execute_key_command)
+        self.global_settings_requested = False
+        self.context_to_probe_title: Dict[str, str] = {}
+        # endpoint applied by the last key press of every context with endpoints
+        self.context_to_endpoint_selection: Dict[str, "EndpointSelection"] = {}
 
+    @timed("on_key_down")
+    def on_key_down(self, obj: events_received_objs.KeyDown) -> None:
         networkservice = obj.payload.settings["networkservice"]
         proxy_types, proxy_type_selected = obj.payload.settings["proxy_type"]
         domain = obj.payload.settings["domain"]
@@ -61,54 +129,244 @@ class ConnectDisconnectAction(Action):
         if not (networkservice and proxy_type_selected and domain and port):
             self.show_alert(context=obj.context)
             return
+        # only the last listing, execute_key_command checks again on the worker
+        if not NETWORKSERVICE_INDEX.is_known_warm(networkservice):
+            logger.warning(f'Networkservice "{networkservice}" does not exist')
+            self.show_alert(context=obj.context)
+            return
+        try:
+            endpoints = get_endpoints(key_settings=obj.payload.settings)
+            pac_rules = get_pac_rules(key_settings=obj.payload.settings)
+        except ValueError as err:
+            logger.warning(err)
+            self.show_alert(context=obj.context)
+            return
         proxy_type = ProxyTypes(proxy_type_selected)
 
-        if obj.payload.state == ConnectStates.ENABLED:
-            try:
-                set_proxy_state(
-                    proxy_type=proxy_type,
-                    networkservice=networkservice,
-                    enabled=False,
-                )
-            except Exception as err:
-                logger.warning(err, exc_info=True)
-                self.show_alert(context=obj.context)
-                return
-            self.set_state(context=obj.context, state=ConnectStates.DISABLED)
-            self.show_ok(context=obj.context)
-            return
+        latest_command = self.key_command_queue.latest(context=obj.context)
+        if latest_command is not None:
+            enabled = not latest_command.enabled
+        elif obj.payload.state == ConnectStates.ENABLED:
+            enabled = False
         elif obj.payload.state == ConnectStates.DISABLED:
-            try:
-                set_proxy(
-                    proxy_type=proxy_type,
-                    networkservice=networkservice,
-                    domain=domain,
-                    port=port,
-                    username=username,
-                    password=password
+            enabled = True
+        else:
+            self.show_alert(context=obj.context)
+            return
+
+        if settings.OPTIMISTIC_KEY_STATE:
+            self._set_state(context=obj.context, state=ConnectStates(enabled))
+        self.key_command_queue.submit(
+            context=obj.context,
+            command=KeyCommand(
+                enabled=enabled,
+                networkservice=networkservice,
+                proxy_type=proxy_type,
+                domain=domain,
+                port=port,
+                username=username,
+                password=password,
+                endpoints=tuple(endpoints),
+                pac_rules=tuple(pac_rules),
+                bypass_domains_file=(obj.payload.settings.get("bypass_domains_file") or "").strip(),
+            ),
+        )
+
+    @timed("execute_key_command")
+    def execute_key_command(self, context: str, command: KeyCommand) -> bool:
+        """
+        Apply a key command, writing only what differs from the system settings.
+        Runs on the worker of the context in self.key_command_queue.
+        On failure the optimistic state is rolled back.
+        """
+        try:
+            if not NETWORKSERVICE_INDEX.is_known(command.networkservice):
+                raise ValueError(f'Networkservice "{command.networkservice}" does not exist')
+            if command.enabled and command.endpoints:
+                command = self._select_endpoint(context=context, command=command)
+            if PAC_SERVER is not None:
+                commands = self._apply_to_pac_server(command=command)
+            elif LOCAL_RELAY is not None:
+                commands = self._apply_to_relay(command=command)
+            else:
+                commands = apply_proxy(
+                    proxy_type=command.proxy_type,
+                    networkservice=command.networkservice,
+                    enabled=command.enabled,
+                    domain=command.domain,
+                    port=command.port,
+                    username=command.username,
+                    password=command.password,
                 )
-            except Exception as err:
-                logger.warning(err, exc_info=True)
-                self.show_alert(context=obj.context)
-                return
-            self.set_state(context=obj.context, state=ConnectStates.ENABLED)
-            self.show_ok(context=obj.context)
+            logger.debug(f"Applied {command.proxy_type.value} to {command.networkservice}: {commands}")
+            if command.enabled and command.bypass_domains_file:
+                self._apply_bypass_domains(command=command)
+        except Exception as err:
+            logger.warning(err, exc_info=True)
+            self._set_state(context=context, state=ConnectStates(not command.enabled))
+            self.show_alert(context=context)
+            self._boost_after_command(command=command)
+            return False
+        self._boost_after_command(command=command)
+        self._set_state(context=context, state=ConnectStates(command.enabled))
+        self.show_ok(context=context)
+        return True
+
+    @staticmethod
+    def _apply_to_relay(command: KeyCommand) -> List[ApplyCommand]:
+        """
+        Point the system proxy at LOCAL_RELAY, which writes nothing once it does, and switch the upstream
+        of the relay. Disabling makes the relay connect directly, if the relay still forwards to the command.
+
+        :return: the commands applied to the system proxy
+        """
+        from relay import Upstream, UpstreamKinds  # imported by configure_local_relay already
+
+        if not command.enabled:
+            upstream = LOCAL_RELAY.upstream
+            if upstream is not None and (upstream.domain, str(upstream.port)) == (command.domain, command.port):
+                LOCAL_RELAY.set_upstream(None)
+            return []
+        commands = apply_proxy(
+            proxy_type=command.proxy_type,
+            networkservice=command.networkservice,
+            enabled=True,
+            domain=LOCAL_RELAY.host,
+            port=str(LOCAL_RELAY.port),
+        )
+        LOCAL_RELAY.set_upstream(Upstream(
+            kind=UpstreamKinds(PROXY_TYPE_TO_UPSTREAM_KIND[command.proxy_type]),
+            domain=command.domain,
+            port=int(command.port),
+            username=command.username,
+            password=command.password,
+        ))
+        return commands
+
+    @staticmethod
+    def _apply_to_pac_server(command: KeyCommand) -> List[str]:
+        """
+        Point the auto-proxy URL of the networkservice at PAC_SERVER, which writes nothing once it does,
+        and swap the PAC script served for it. Disabling serves DIRECT, if the script still routes to the command.
+
+        :return: the networksetup commands written
+        """
+        from pac import PacProfile, PacRoute, PacRouteKinds  # imported by configure_pac_server already
+
+        route = PacRoute(
+            kind=PacRouteKinds(PROXY_TYPE_TO_PAC_ROUTE_KIND[command.proxy_type]),
+            domain=command.domain,
+            port=command.port,
+        )
+        if not command.enabled:
+            if PAC_SERVER.profile(name=command.networkservice).route == route:
+                PAC_SERVER.set_profile(name=command.networkservice, profile=None)
+            return []
+        if command.username:
+            logger.debug("PAC scripts have no credentials, the proxy asks for them itself")
+        commands = point_autoproxy_url(networkservice=command.networkservice)
+        PAC_SERVER.set_profile(name=command.networkservice, profile=PacProfile(route=route, rules=command.pac_rules))
+        return commands
+
+    @staticmethod
+    def _apply_bypass_domains(command: KeyCommand) -> None:
+        """
+        Write the bypass domains file of the command, if the list differs from the one of the networkservice.
+        """
+        domains = bypass.load_file(path=Path(command.bypass_domains_file))
+        res = bypass.apply_bypass_domains(networkservice=command.networkservice, domains=domains)
+        if res.changed:
+            logger.info(f"Bypass domains of {command.networkservice}: {len(domains)}, "
+                        f"{len(res.added)} added, {len(res.removed)} removed")
+
+    @staticmethod
+    def _boost_after_command(command: KeyCommand) -> None:
+        if LOCAL_RELAY is not None and PAC_SERVER is None:
+            # every key through the relay depends on its upstream
+            MONITORING_SCHEDULER.boost()
             return
-        self.show_alert(context=obj.context)
+        keys = {(command.networkservice, command.proxy_type)}
+        if PAC_SERVER is not None:
+            # every key of the networkservice depends on its PAC script
+            keys |= {key for key in MONITORING_REGISTRY.keys() if key[0] == command.networkservice}
+        MONITORING_SCHEDULER.boost(keys=keys)
+
+    def _select_endpoint(self, context: str, command: KeyCommand) -> KeyCommand:
+        """
+        Race the endpoints of the command and remember the fastest, so monitoring expects it to be applied.
+
+        :return: the command with the domain and port of the fastest endpoint
+        :raises ProbeError: if no endpoint has answered before ENDPOINT_SELECTION_DEADLINE
+        """
+        from endpoints import select_fastest
+        from prober import ProbeError
+
+        selection = select_fastest(
+            endpoints=[(command.domain, command.port), *command.endpoints],
+            handshake=get_probe_handshake(proxy_type=command.proxy_type),
+            deadline=settings.ENDPOINT_SELECTION_DEADLINE,
+        )
+        if selection is None:
+            raise ProbeError(
+                f"No endpoint of {command.networkservice} {command.proxy_type.value} "
+                f"has answered in {settings.ENDPOINT_SELECTION_DEADLINE}s"
+            )
+        logger.info(f"Selected {selection.domain}:{selection.port} ({selection.latency_ms:.0f}ms) "
+                    f"for {command.networkservice} {command.proxy_type.value}")
+        self.context_to_endpoint_selection[context] = selection
+        monitoring_params = MONITORING_REGISTRY.get(context=context)
+        if monitoring_params is not None:
+            MONITORING_REGISTRY.add(context=context, monitoring_params=MonitoringParams(
+                networkservice=monitoring_params.networkservice,
+                proxy_type=monitoring_params.proxy_type,
+                domain=selection.domain,
+                port=selection.port,
+            ))
+        return dataclasses.replace(command, domain=selection.domain, port=selection.port)
 
     def on_will_appear(self, obj: events_received_objs.WillAppear):
-        self.LAST_KEY_DOWN_TIME = time.time()
-        self._update_or_create_proxy_in_monitoring(obj=obj)
+        if startup.PROFILE_STARTUP:
+            startup.mark("first_will_appear")
+            self.write_startup_report()
+        if not self.global_settings_requested:
+            self.global_settings_requested = True
+            self.get_global_settings()
+        self.context_to_probe_title.pop(obj.context, None)
+        STATE_CACHE.force_refresh(context=obj.context)
+        monitoring_params = self._update_or_create_proxy_in_monitoring(obj=obj)
+        if monitoring_params is None:
+            return
+        enabled = STATE_SNAPSHOT.get(monitoring_params=monitoring_params)
+        if enabled is not None:
+            self._set_state(context=obj.context, state=ConnectStates(enabled))
+        self.refresh_context(context=obj.context)
 
     def on_will_disappear(self, obj: events_received_objs.WillDisappear) -> None:
-        CONTEXT_TO_MONITORING_PARAMS.pop(obj.context, None)
+        MONITORING_REGISTRY.remove(context=obj.context)
+        STATE_CACHE.forget(context=obj.context)
+        self.context_to_probe_title.pop(obj.context, None)
+        self.context_to_endpoint_selection.pop(obj.context, None)
 
     def on_did_receive_settings(self, obj: events_received_objs.DidReceiveSettings) -> None:
         self._update_proxy_types_in_pi(obj=obj)
-        self._update_or_create_proxy_in_monitoring(obj=obj)
+        STATE_CACHE.force_refresh(context=obj.context)
+        monitoring_params = self._update_or_create_proxy_in_monitoring(obj=obj)
+        if monitoring_params is not None:
+            self.refresh_context(context=obj.context)
+        elif self.context_to_probe_title.pop(obj.context, None) is not None:
+            self.set_title(context=obj.context, title="")
 
-    def on_property_inspector_did_appear(self, obj: events_received_objs.PropertyInspectorDidAppear) -> None:
-        self.get_settings(context=obj.context)
+    def on_did_receive_global_settings(self, obj: events_received_objs.DidReceiveGlobalSettings) -> None:
+        """
+        Apply the log_level global setting set by the property inspector, LOG_LEVEL if it is not set.
+        """
+        log_level = obj.payload.settings.get("log_level") or settings.LOG_LEVEL
+        try:
+            set_log_level(log_level)
+        except (ValueError, AttributeError):
+            logger.warning(f"Bad log_level global setting {log_level!r}")
+            return
+        logger.info(f"Log level set to {log_level}")
 
     def _update_proxy_types_in_pi(self, obj: events_received_objs.DidReceiveSettings):
         """
@@ -127,57 +385,448 @@ class ConnectDisconnectAction(Action):
                 events_received_objs.DidReceiveSettings,
                 events_received_objs.WillAppear,
             ],
-    ):
+    ) -> Optional[MonitoringParams]:
+        """
+        :return: the monitoring params of the context, None if it is not monitored
+        """
         networkservice = obj.payload.settings["networkservice"]
         proxy_types, proxy_type_selected = obj.payload.settings["proxy_type"]
         domain = obj.payload.settings["domain"]
         port = obj.payload.settings["port"]
 
         if not (networkservice and proxy_type_selected and domain and port):
+            MONITORING_REGISTRY.remove(context=obj.context)
             if obj.payload.state == ConnectStates.ENABLED:
-                self.set_state(context=obj.context, state=ConnectStates.DISABLED)
-            return
+                self._set_state(context=obj.context, state=ConnectStates.DISABLED)
+            return None
+        # only the last listing, refresh_context checks again off the event thread
+        if not NETWORKSERVICE_INDEX.is_known_warm(networkservice):
+            logger.warning(f'Networkservice "{networkservice}" does not exist, it is not monitored')
+            MONITORING_REGISTRY.remove(context=obj.context)
+            self._set_state(context=obj.context, state=ConnectStates.DISABLED)
+            return None
+        try:
+            endpoints = get_endpoints(key_settings=obj.payload.settings)
+        except ValueError as err:
+            logger.warning(err)
+            endpoints = []
         proxy_type = ProxyTypes(proxy_type_selected)
-        monitoring_params = MonitoringParams(
-            networkservice=networkservice,
-            proxy_type=proxy_type,
-            domain=domain,
-            port=port
+        selection = self.context_to_endpoint_selection.get(obj.context)
+        if selection is not None and selection.endpoint in [(domain, port), *endpoints]:
+            monitoring_params = MonitoringParams(
+                networkservice=networkservice,
+                proxy_type=proxy_type,
+                domain=selection.domain,
+                port=selection.port,
+            )
+        else:
+            # the endpoint applied before a restart is not known, any of them counts
+            monitoring_params = MonitoringParams(
+                networkservice=networkservice,
+                proxy_type=proxy_type,
+                domain=domain,
+                port=port,
+                alternatives=tuple(endpoints),
+            )
+        MONITORING_REGISTRY.add(context=obj.context, monitoring_params=monitoring_params)
+        MONITORING_SCHEDULER.boost(keys={monitoring_params.key})
+        return monitoring_params
+
+    @in_separate_thread(daemon=True)
+    @log_errors
+    def refresh_context(self, context: str) -> None:
+        """
+        Read the proxy of the context right away instead of waiting for it in the next monitoring iteration.
+        A context whose networkservice does not exist stops being monitored.
+        """
+        monitoring_params = MONITORING_REGISTRY.get(context=context)
+        if monitoring_params is None:
+            return
+        if not NETWORKSERVICE_INDEX.is_known(monitoring_params.networkservice):
+            logger.warning(f'Networkservice "{monitoring_params.networkservice}" does not exist, it is not monitored')
+            MONITORING_REGISTRY.remove(context=context)
+            self._set_state(context=context, state=ConnectStates.DISABLED)
+            return
+        self.monitoring_iteration(keys={monitoring_params.key})
+        try:
+            STATE_SNAPSHOT.save()
+        except OSError as err:
+            logger.warning(f"Could not save the state snapshot: {err}")
+
+    @in_separate_thread(daemon=True)
+    @log_errors
+    def on_property_inspector_did_appear(self, obj: events_received_objs.PropertyInspectorDidAppear) -> None:
+        """
+        Request the settings and send the networkservice names to the property inspector to choose from.
+        """
+        self.get_settings(context=obj.context)
+        self.send_to_property_inspector(
+            action=obj.action,
+            context=obj.context,
+            payload={"datalists": {"networkservice": NETWORKSERVICE_INDEX.names()}},
         )
-        CONTEXT_TO_MONITORING_PARAMS[obj.context] = monitoring_params
+
+    @in_separate_thread(daemon=True)
+    @log_errors
+    def write_startup_report(self):
+        report = startup.write_report(path=settings.STARTUP_REPORT_PATH)
+        if report is not None:
+            logger.info(f"Startup took {report['total_ms']:.0f}ms, report: {settings.STARTUP_REPORT_PATH}")
 
     @in_separate_thread(daemon=True)
     @log_errors
     def run_monitoring(self):
+        """
+        Poll every monitored (networkservice, proxy_type) pair when MONITORING_SCHEDULER says it is due.
+        """
         while True:
-            time.sleep(MONITORING_INTERVAL)
+            keys = set(MONITORING_SCHEDULER.wait_due())
+            monitored_keys = MONITORING_REGISTRY.keys()
+            for key in keys - monitored_keys:
+                MONITORING_SCHEDULER.remove(key=key)
+            keys &= monitored_keys
+            key_to_proxy_info = {}
             try:
-                self.monitoring_iteration()
+                key_to_proxy_info = self.monitoring_iteration(keys=keys)
             except Exception as err:
                 logger.exception(err)
+            try:
+                STATE_SNAPSHOT.save()
+            except OSError as err:
+                logger.warning(f"Could not save the state snapshot: {err}")
+            for key in keys:
+                if key in key_to_proxy_info:
+                    MONITORING_SCHEDULER.report(key=key, value=key_to_proxy_info[key])
+                else:
+                    MONITORING_SCHEDULER.report(key=key)
 
-    def monitoring_iteration(self):
-        context_to_monitoring_params = CONTEXT_TO_MONITORING_PARAMS.copy()
-        for context, monitoring_params in context_to_monitoring_params.items():
-            proxy_info = get_proxy(
-                proxy_type=monitoring_params.proxy_type,
-                networkservice=monitoring_params.networkservice,
-            )
-            if (proxy_info.enabled and proxy_info.server == monitoring_params.domain
-                    and proxy_info.port == monitoring_params.port):
-                self.set_state(context=context, state=ConnectStates.ENABLED)
-                continue
-            self.set_state(context=context, state=ConnectStates.DISABLED)
+    def run_watching(self):
+        """
+        Poll pairs right away when SCDynamicStore reports a proxy change.
+        While notifications work, polling backs off to MONITORING_WATCHED_MAX_INTERVAL.
+        """
+        from macos_proxy_settings.scutil import ProxiesWatcher
+
+        watcher = ProxiesWatcher(
+            on_change=self.on_proxies_change,
+            resolve_networkservice=PreferencesReader().get_networkservice,
+            on_close=self.on_watching_closed,
+        )
+        if watcher.start():
+            logger.info("Watching proxy changes")
+            MONITORING_SCHEDULER.max_interval = settings.MONITORING_WATCHED_MAX_INTERVAL
+
+    @log_errors
+    def on_proxies_change(self, networkservices: Optional[Set[str]]) -> None:
+        invalidate_cache(networkservices=networkservices)
+        if networkservices is None:
+            PAC_POINTED_NETWORKSERVICES.clear()
+            NETWORKSERVICE_INDEX.invalidate()
+            MONITORING_SCHEDULER.boost()
+            return
+        PAC_POINTED_NETWORKSERVICES.difference_update(networkservices)
+        keys = {key for key in MONITORING_REGISTRY.keys() if key[0] in networkservices}
+        MONITORING_SCHEDULER.boost(keys=keys)
+
+    @log_errors
+    def on_watching_closed(self) -> None:
+        MONITORING_SCHEDULER.max_interval = settings.MONITORING_MAX_INTERVAL
+        MONITORING_SCHEDULER.boost()
+
+    def run_probing(self) -> None:
+        """
+        Probe the proxies of the monitored keys and show their latency as the key titles.
+        """
+        from prober import ProxyProber
+
+        prober = ProxyProber(
+            get_targets=self.get_probe_targets,
+            on_stats=self.on_probe_stats,
+            interval=settings.PROXY_PROBE_INTERVAL,
+            timeout=settings.PROXY_PROBE_TIMEOUT,
+            window_size=settings.PROXY_PROBE_WINDOW,
+            dns_ttl=settings.PROXY_PROBE_DNS_TTL,
+        )
+        prober.start()
+
+    @staticmethod
+    def get_probe_targets() -> Dict["ProbeTarget", List[str]]:
+        """
+        :return: every (domain, port) of the monitored keys once, with the contexts showing it
+        """
+        from prober import ProbeTarget
+
+        target_to_contexts: Dict[ProbeTarget, List[str]] = {}
+        for contexts in MONITORING_REGISTRY.snapshot().values():
+            for context, monitoring_params in contexts.items():
+                if not monitoring_params.port.isdigit():
+                    continue
+                target = ProbeTarget(
+                    domain=monitoring_params.domain,
+                    port=int(monitoring_params.port),
+                    handshake=get_probe_handshake(proxy_type=monitoring_params.proxy_type),
+                )
+                target_to_contexts.setdefault(target, []).append(context)
+        return target_to_contexts
+
+    @log_errors
+    def on_probe_stats(
+            self,
+            target_to_stats: Dict["ProbeTarget", "ProbeStats"],
+            target_to_contexts: Dict["ProbeTarget", List[str]],
+    ) -> None:
+        """
+        Send setTitle to the keys whose title has changed.
+        """
+        from prober import format_title
+
+        for target, stats in target_to_stats.items():
+            title = format_title(stats=stats)
+            for context in target_to_contexts[target]:
+                if self.context_to_probe_title.get(context) == title or MONITORING_REGISTRY.get(context) is None:
+                    continue
+                self.context_to_probe_title[context] = title
+                self.set_title(context=context, title=title)
+
+    @timed("monitoring_iteration")
+    def monitoring_iteration(
+            self,
+            keys: Optional[Set[MonitoringKey]] = None,
+    ) -> Dict[MonitoringKey, Union[ProxyInfo, networksetup.AutoProxyInfo]]:
+        """
+        :param keys: (networkservice, proxy_type) pairs to refresh, all monitored pairs if None
+        :return: ProxyInfo of every pair that has been read, with PAC_SERVER the AutoProxyInfo of its networkservice
+        """
+        key_to_contexts = MONITORING_REGISTRY.snapshot()
+        if keys is not None:
+            key_to_contexts = {key: key_to_contexts[key] for key in keys if key in key_to_contexts}
+        if PAC_SERVER is not None:
+            # the manual proxies are not used with a PAC script
+            key_to_proxy_info = read_autoproxy_infos(keys=key_to_contexts,
+                                                     max_concurrency=settings.MONITORING_CONCURRENCY)
+            for (networkservice, _), autoproxy_info in key_to_proxy_info.items():
+                # pointed elsewhere, the next key press points it back
+                if autoproxy_info != networksetup.AutoProxyInfo(url=PAC_SERVER.url(name=networkservice), enabled=True):
+                    PAC_POINTED_NETWORKSERVICES.discard(networkservice)
+        else:
+            key_to_proxy_info = read_proxy_infos(keys=key_to_contexts,
+                                                 max_concurrency=settings.MONITORING_CONCURRENCY)
+        for key, proxy_info in key_to_proxy_info.items():
+            for context, monitoring_params in key_to_contexts[key].items():
+                applied = is_applied(monitoring_params=monitoring_params, proxy_info=proxy_info)
+                STATE_SNAPSHOT.update(monitoring_params=monitoring_params, enabled=applied)
+                self._set_state(context=context, state=ConnectStates(applied))
+        return key_to_proxy_info
+
+    @in_separate_thread(daemon=True)
+    @log_errors
+    def run_metrics_dump(self):
+        """
+        Append a METRICS summary of the last METRICS_DUMP_INTERVAL seconds to METRICS_FILE_PATH as a JSON line.
+        """
+        settings.METRICS_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        METRICS.summary(reset=True)
+        while True:
+            time.sleep(settings.METRICS_DUMP_INTERVAL)
+            summary = METRICS.summary(reset=True)
+            summary["cache"] = cache_stats()
+            summary["state_cache"] = STATE_CACHE.stats()
+            with open(settings.METRICS_FILE_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary) + "\n")
+
+    def _set_state(self, context: str, state: ConnectStates) -> None:
+        """
+        Send setState only if the state of the context has changed or a refresh is forced.
+        """
+        if STATE_CACHE.should_send(context=context, state=state):
+            self.set_state(context=context, state=state)
+
+
+def get_endpoints(key_settings: dict) -> List["Endpoint"]:
+    """
+    :param key_settings: settings of a key
+    :return: the endpoints setting without the domain and port of the key
+    :raises ValueError: if an endpoint is not host:port
+    """
+    text = key_settings.get("endpoints") or ""
+    if not text.strip():
+        return []
+    from endpoints import parse_endpoints
+
+    endpoints = parse_endpoints(text)
+    return [endpoint for endpoint in endpoints if endpoint != (key_settings["domain"], key_settings["port"])]
+
+
+def get_pac_rules(key_settings: dict) -> List["PacRule"]:
+    """
+    :param key_settings: settings of a key
+    :return: the pac_rules setting
+    :raises ValueError: if a rule is not "pattern route"
+    """
+    text = key_settings.get("pac_rules") or ""
+    if not text.strip():
+        return []
+    from pac import parse_rules
+
+    return parse_rules(text)
+
+
+def is_applied(
+        monitoring_params: MonitoringParams,
+        proxy_info: Union[ProxyInfo, networksetup.AutoProxyInfo],
+) -> bool:
+    """
+    With PAC_SERVER the auto-proxy URL of the networkservice has to be on and point at PAC_SERVER,
+    and the PAC script of the networkservice has to route to the proxy of the key.
+    With LOCAL_RELAY the system proxy has to point at the relay, and the relay at the proxy of the key.
+
+    :param proxy_info: AutoProxyInfo of the networkservice with PAC_SERVER, ProxyInfo of the key otherwise
+    """
+    if PAC_SERVER is not None:
+        pac_url = PAC_SERVER.url(name=monitoring_params.networkservice)
+        if proxy_info != networksetup.AutoProxyInfo(url=pac_url, enabled=True):
+            return False
+        route = PAC_SERVER.profile(name=monitoring_params.networkservice).route
+        if route.kind.value != PROXY_TYPE_TO_PAC_ROUTE_KIND[monitoring_params.proxy_type]:
+            return False
+        return monitoring_params.is_applied(proxy_info=ProxyInfo(enabled=True, server=route.domain, port=route.port))
+    if LOCAL_RELAY is None:
+        return monitoring_params.is_applied(proxy_info=proxy_info)
+    upstream = LOCAL_RELAY.upstream
+    if upstream is None or not (proxy_info.enabled and proxy_info.server == LOCAL_RELAY.host
+                                and proxy_info.port == str(LOCAL_RELAY.port)):
+        return False
+    return monitoring_params.is_applied(proxy_info=ProxyInfo(
+        enabled=True,
+        server=upstream.domain,
+        port=str(upstream.port),
+    ))
+
+
+def point_autoproxy_url(networkservice: str) -> List[str]:
+    """
+    Point the auto-proxy URL of networkservice at PAC_SERVER and turn it on, if it does not already.
+
+    :return: the networksetup commands written
+    :raises ValueError: if networksetup reports that the write failed
+    """
+    if networkservice in PAC_POINTED_NETWORKSERVICES:
+        return []
+    url = PAC_SERVER.url(name=networkservice)
+    commands = []
+    if networksetup.getautoproxyurl(networkservice=networkservice) != networksetup.AutoProxyInfo(url=url, enabled=True):
+        res = networksetup.setautoproxyurl(networkservice=networkservice, url=url)
+        if res:
+            raise ValueError(res)
+        commands.append("setautoproxyurl")
+    PAC_POINTED_NETWORKSERVICES.add(networkservice)
+    return commands
+
+
+def get_probe_handshake(proxy_type: ProxyTypes) -> "ProbeHandshakes":
+    from prober import ProbeHandshakes
+
+    if not settings.PROXY_PROBE_HANDSHAKE:
+        return ProbeHandshakes.TCP
+    return ProbeHandshakes(PROXY_TYPE_TO_PROBE_HANDSHAKE[proxy_type])
+
+
+def configure_proxy_backend() -> None:
+    if settings.PROXY_BACKEND == "memory":
+        from macos_proxy_settings.memory import MemoryBackend
+
+        # "Wi-Fi" first, so keys with the default settings work
+        networkservices = ["Wi-Fi"] + [f"Service {index}" for index in range(1, settings.MEMORY_BACKEND_NETWORKSERVICES)]
+        set_proxy_backend(MemoryBackend(
+            networkservices=networkservices,
+            latency=settings.MEMORY_BACKEND_LATENCY,
+            failure_rate=settings.MEMORY_BACKEND_FAILURE_RATE,
+        ))
+    elif settings.PROXY_BACKEND == "replay":
+        from macos_proxy_settings.corpus import ReplayBackend
+
+        set_proxy_backend(ReplayBackend(
+            path=settings.NETWORKSETUP_REPLAY_PATH,
+            timings=settings.NETWORKSETUP_REPLAY_TIMINGS,
+        ))
+    elif settings.PROXY_BACKEND == "networksetup":
+        set_read_backend(ReadBackends(settings.PROXY_READ_BACKEND))
+        if settings.NETWORKSETUP_RECORD_PATH:
+            from macos_proxy_settings.corpus import CorpusRecorder
+
+            networksetup.set_recorder(CorpusRecorder(path=settings.NETWORKSETUP_RECORD_PATH))
+    else:
+        raise ValueError(f"Bad PROXY_BACKEND {settings.PROXY_BACKEND}")
+
+
+def configure_local_relay() -> None:
+    global LOCAL_RELAY
+    if not settings.LOCAL_RELAY_ENABLED:
+        return
+    from relay import LocalRelay
+
+    relay = LocalRelay(
+        host=settings.LOCAL_RELAY_HOST,
+        port=settings.LOCAL_RELAY_PORT,
+        buffer_size=settings.LOCAL_RELAY_BUFFER_SIZE,
+        pool_size=settings.LOCAL_RELAY_POOL_SIZE,
+        pool_idle_timeout=settings.LOCAL_RELAY_POOL_IDLE_TIMEOUT,
+        drain_timeout=settings.LOCAL_RELAY_DRAIN_TIMEOUT,
+    )
+    try:
+        relay.start_in_thread()
+    except OSError as err:
+        # the port may be taken by another instance of the plugin, keys write the system proxy instead
+        logger.warning(f"Local relay not started on {settings.LOCAL_RELAY_HOST}:{settings.LOCAL_RELAY_PORT}: {err}")
+        return
+    LOCAL_RELAY = relay
+
+
+def configure_pac_server() -> None:
+    global PAC_SERVER
+    if not settings.PAC_SERVER_ENABLED:
+        return
+    if settings.PROXY_BACKEND != "networksetup":
+        logger.warning(f"PAC_SERVER_ENABLED needs the networksetup PROXY_BACKEND, not {settings.PROXY_BACKEND}")
+        return
+    from pac import PacServer
+
+    pac_server = PacServer(host=settings.PAC_SERVER_HOST, port=settings.PAC_SERVER_PORT)
+    try:
+        pac_server.start_in_thread()
+    except OSError as err:
+        # the port may be taken by another instance of the plugin, keys write the system proxy instead
+        logger.warning(f"PAC server not started on {settings.PAC_SERVER_HOST}:{settings.PAC_SERVER_PORT}: {err}")
+        return
+    PAC_SERVER = pac_server
 
 
 if __name__ == '__main__':
+    # instead of the log_file of StreamDeck, so that nothing waits for the log file to be written
+    configure_logging(
+        log_file=settings.LOG_FILE_PATH,
+        level=settings.LOG_LEVEL,
+        rate_limit_interval=settings.LOG_RATE_LIMIT_INTERVAL,
+        queue_size=settings.LOG_QUEUE_SIZE,
+    )
+    configure_proxy_backend()
+    configure_local_relay()
+    configure_pac_server()
+    configure_cache(ttl=settings.PROXY_CACHE_TTL, max_size=settings.PROXY_CACHE_MAX_SIZE)
+    configure_executor(max_workers=settings.PROXY_EXECUTOR_MAX_WORKERS)
+    configure_metrics(enabled=settings.METRICS_ENABLED)
+    STATE_SNAPSHOT.load()
     connect_disconnect_action = ConnectDisconnectAction()
+    if settings.METRICS_ENABLED:
+        connect_disconnect_action.run_metrics_dump()
     connect_disconnect_action.run_monitoring()
+    if settings.PROXY_PROBE_ENABLED:
+        connect_disconnect_action.run_probing()
+    if settings.WATCH_PROXY_CHANGES and settings.PROXY_BACKEND == "networksetup":
+        connect_disconnect_action.run_watching()
+    startup.mark("connecting")
     StreamDeck(
         actions=[
             connect_disconnect_action,
         ],
-        log_file=settings.LOG_FILE_PATH,
-        log_level=settings.LOG_LEVEL,
-        log_backup_count=1,
     ).run()
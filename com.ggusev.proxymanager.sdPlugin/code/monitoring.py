@@ -0,0 +1,207 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from macos_proxy_settings import networksetup
+from macos_proxy_settings.executor import map_concurrently
+from macos_proxy_settings.networksetup import AutoProxyInfo
+from macos_proxy_settings.simple_settings import (
+    ProxyInfo,
+    ProxyTypes,
+    get_proxy,
+    merge_http_https,
+)
+
+logger = logging.getLogger(__name__)
+
+MonitoringKey = Tuple[str, ProxyTypes]  # (networkservice, proxy_type)
+
+
+@dataclass
+class MonitoringParams:
+    networkservice: str
+    proxy_type: ProxyTypes
+    domain: str
+    port: str
+    # (domain, port) of equivalent proxies that count as applied too
+    alternatives: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def key(self) -> MonitoringKey:
+        return self.networkservice, self.proxy_type
+
+    def is_applied(self, proxy_info: ProxyInfo) -> bool:
+        if not proxy_info.enabled:
+            return False
+        endpoint = (proxy_info.server, proxy_info.port)
+        return endpoint == (self.domain, self.port) or endpoint in self.alternatives
+
+
+class MonitoringRegistry:
+    """
+    Monitored contexts grouped by (networkservice, proxy_type),
+    so that every pair is read once no matter how many keys show it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_to_contexts: Dict[MonitoringKey, Dict[str, MonitoringParams]] = {}
+        self._context_to_key: Dict[str, MonitoringKey] = {}
+
+    def add(self, context: str, monitoring_params: MonitoringParams) -> None:
+        with self._lock:
+            self._remove(context=context)
+            key = monitoring_params.key
+            self._key_to_contexts.setdefault(key, {})[context] = monitoring_params
+            self._context_to_key[context] = key
+
+    def remove(self, context: str) -> None:
+        with self._lock:
+            self._remove(context=context)
+
+    def get(self, context: str) -> Optional[MonitoringParams]:
+        with self._lock:
+            key = self._context_to_key.get(context)
+            if key is None:
+                return None
+            return self._key_to_contexts[key][context]
+
+    def keys(self) -> Set[MonitoringKey]:
+        with self._lock:
+            return set(self._key_to_contexts)
+
+    def snapshot(self) -> Dict[MonitoringKey, Dict[str, MonitoringParams]]:
+        with self._lock:
+            return {key: contexts.copy() for key, contexts in self._key_to_contexts.items()}
+
+    def __len__(self) -> int:
+        return len(self._context_to_key)
+
+    def _remove(self, context: str) -> None:
+        key = self._context_to_key.pop(context, None)
+        if key is None:
+            return
+        contexts = self._key_to_contexts[key]
+        del contexts[context]
+        if not contexts:
+            del self._key_to_contexts[key]
+
+
+class StateCache:
+    """
+    Last state sent for every context, so that setState is only sent on transitions.
+    A forced context gets its next state sent even if it is unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._context_to_state: Dict[str, int] = {}
+        self._forced_contexts: Set[str] = set()
+        self.sent_count = 0
+        self.suppressed_count = 0
+
+    def should_send(self, context: str, state: int) -> bool:
+        """
+        Remember the state and tell whether it has to be sent.
+        """
+        with self._lock:
+            if context not in self._forced_contexts and self._context_to_state.get(context) == state:
+                self.suppressed_count += 1
+                return False
+            self._forced_contexts.discard(context)
+            self._context_to_state[context] = state
+            self.sent_count += 1
+            return True
+
+    def force_refresh(self, context: str) -> None:
+        with self._lock:
+            self._forced_contexts.add(context)
+
+    def forget(self, context: str) -> None:
+        with self._lock:
+            self._context_to_state.pop(context, None)
+            self._forced_contexts.discard(context)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sent": self.sent_count, "suppressed": self.suppressed_count}
+
+
+def read_proxy_infos(
+        keys: Iterable[MonitoringKey],
+        max_concurrency: int = 1,
+) -> Dict[MonitoringKey, ProxyInfo]:
+    """
+    Read every key once. http(s) keys are built from the http and https reads of the same
+    networkservice, which are shared with plain http and https keys.
+    Keys that failed to read are logged and left out of the result.
+
+    :param max_concurrency: number of reads running at the same time
+    """
+    keys = set(keys)
+    base_keys: Set[MonitoringKey] = set()
+    for networkservice, proxy_type in keys:
+        if proxy_type is ProxyTypes.HTTP_HTTPS:
+            base_keys.add((networkservice, ProxyTypes.HTTP))
+            base_keys.add((networkservice, ProxyTypes.HTTPS))
+        else:
+            base_keys.add((networkservice, proxy_type))
+
+    base_keys = list(base_keys)
+    futures = map_concurrently(
+        lambda base_key: get_proxy(proxy_type=base_key[1], networkservice=base_key[0]),
+        base_keys,
+        max_concurrency=max_concurrency,
+    )
+    base_key_to_proxy_info: Dict[MonitoringKey, ProxyInfo] = {}
+    for (networkservice, proxy_type), future in zip(base_keys, futures):
+        err = future.exception()
+        if err is not None:
+            logger.warning(f"{networkservice=} {proxy_type=} {err}", exc_info=err)
+            continue
+        base_key_to_proxy_info[(networkservice, proxy_type)] = future.result()
+
+    result = {}
+    for key in keys:
+        networkservice, proxy_type = key
+        if proxy_type is not ProxyTypes.HTTP_HTTPS:
+            if key in base_key_to_proxy_info:
+                result[key] = base_key_to_proxy_info[key]
+            continue
+        http_proxy_info = base_key_to_proxy_info.get((networkservice, ProxyTypes.HTTP))
+        https_proxy_info = base_key_to_proxy_info.get((networkservice, ProxyTypes.HTTPS))
+        if http_proxy_info is None or https_proxy_info is None:
+            continue
+        result[key] = merge_http_https(http_proxy_info=http_proxy_info, https_proxy_info=https_proxy_info)
+    return result
+
+
+def read_autoproxy_infos(
+        keys: Iterable[MonitoringKey],
+        max_concurrency: int = 1,
+) -> Dict[MonitoringKey, AutoProxyInfo]:
+    """
+    Read the auto-proxy URL of every networkservice of keys once, for the keys served by a PAC script.
+    Networkservices that failed to read are logged and their keys left out of the result.
+
+    :param max_concurrency: number of reads running at the same time
+    """
+    keys = set(keys)
+    networkservices = list({networkservice for networkservice, _ in keys})
+    futures = map_concurrently(
+        lambda networkservice: networksetup.getautoproxyurl(networkservice=networkservice),
+        networkservices,
+        max_concurrency=max_concurrency,
+    )
+    networkservice_to_autoproxy_info: Dict[str, AutoProxyInfo] = {}
+    for networkservice, future in zip(networkservices, futures):
+        err = future.exception()
+        if err is not None:
+            logger.warning(f"{networkservice=} {err}", exc_info=err)
+            continue
+        networkservice_to_autoproxy_info[networkservice] = future.result()
+    return {
+        key: networkservice_to_autoproxy_info[key[0]]
+        for key in keys if key[0] in networkservice_to_autoproxy_info
+    }
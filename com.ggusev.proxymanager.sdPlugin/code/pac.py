@@ -0,0 +1,315 @@
+"""
+A local HTTP server for proxy auto-config (PAC) scripts.
+
+Every network service points its auto-proxy URL at its own path of the server once. After that, a key
+changes routing by swapping the PAC script served on that path, and nothing is written with networksetup.
+Scripts are rendered once per profile and served from memory with an ETag and Last-Modified,
+so clients revalidating an unchanged script get 304 Not Modified.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+PAC_CONTENT_TYPE = "application/x-ns-proxy-autoconfig"
+# pattern route, one rule per line or separated by semicolons
+PAC_RULE_REGEX = re.compile(
+    r"^(?P<pattern>\S+)\s+(?:(?P<direct>DIRECT)|(?P<kind>PROXY|SOCKS5)\s+(?P<domain>[^\s:]+):(?P<port>\d{1,5}))$",
+    re.IGNORECASE,
+)
+PAC_RULES_SEPARATOR_REGEX = re.compile(r"[\n;]+")
+PAC_DOMAIN_REGEX = re.compile(r"^[a-z0-9_-]+(?:\.[a-z0-9_-]+)*$")
+
+PAC_TEMPLATE = """\
+var DEFAULT = %(default)s;
+var HOSTS = %(hosts)s;
+var SUFFIXES = %(suffixes)s;
+
+function FindProxyForURL(url, host) {
+    host = host.toLowerCase();
+    if (HOSTS.hasOwnProperty(host)) {
+        return HOSTS[host];
+    }
+    var suffix = host;
+    while (true) {
+        if (SUFFIXES.hasOwnProperty(suffix)) {
+            return SUFFIXES[suffix];
+        }
+        var dot = suffix.indexOf(".");
+        if (dot < 0) {
+            return DEFAULT;
+        }
+        suffix = suffix.substring(dot + 1);
+    }
+}
+"""
+
+
+class PacRouteKinds(Enum):
+    DIRECT = "DIRECT"
+    PROXY = "PROXY"  # HTTP proxy
+    SOCKS5 = "SOCKS5"
+
+
+@dataclass(frozen=True)
+class PacRoute:
+    kind: PacRouteKinds
+    domain: str = ""
+    port: str = ""
+
+    def __str__(self) -> str:
+        if self.kind is PacRouteKinds.DIRECT:
+            return "DIRECT"
+        if self.kind is PacRouteKinds.SOCKS5:
+            # SOCKS for the clients that do not know SOCKS5
+            return f"SOCKS5 {self.domain}:{self.port}; SOCKS {self.domain}:{self.port}"
+        return f"{self.kind.value} {self.domain}:{self.port}"
+
+
+DIRECT_ROUTE = PacRoute(kind=PacRouteKinds.DIRECT)
+
+
+@dataclass(frozen=True)
+class PacRule:
+    """
+    :param pattern: "example.com" for the host only, "*.example.com" or ".example.com" for the host
+        and its subdomains
+    """
+    pattern: str
+    route: PacRoute
+
+
+@dataclass(frozen=True)
+class PacProfile:
+    route: PacRoute  # for the hosts no rule matches
+    rules: Tuple[PacRule, ...] = ()
+
+
+DIRECT_PROFILE = PacProfile(route=DIRECT_ROUTE)
+
+
+@dataclass(frozen=True)
+class RenderedPac:
+    body: bytes
+    etag: str
+
+
+def parse_rules(text: str) -> List[PacRule]:
+    """
+    :param text: rules like "intranet.example.com DIRECT; *.example.org PROXY 10.0.0.1:3128"
+    :return: rules in the order of text
+    :raises ValueError: if a rule is not "pattern route"
+    """
+    res: List[PacRule] = []
+    for item in PAC_RULES_SEPARATOR_REGEX.split(text.strip()):
+        item = item.strip()
+        if not item:
+            continue
+        match = PAC_RULE_REGEX.match(item)
+        if match is None or not PAC_DOMAIN_REGEX.match(_pattern_domain(match.group("pattern").lower())) or \
+                (match.group("port") and not 0 < int(match.group("port")) < 65536):
+            raise ValueError(f"Bad PAC rule {item}, expected like *.example.com DIRECT or example.com PROXY host:port")
+        if match.group("direct"):
+            route = DIRECT_ROUTE
+        else:
+            route = PacRoute(
+                kind=PacRouteKinds(match.group("kind").upper()),
+                domain=match.group("domain"),
+                port=match.group("port"),
+            )
+        res.append(PacRule(pattern=match.group("pattern").lower(), route=route))
+    return res
+
+
+def _pattern_domain(pattern: str) -> str:
+    for prefix in ("*.", "."):
+        if pattern.startswith(prefix):
+            return pattern[len(prefix):]
+    return pattern
+
+
+def render_pac(profile: PacProfile) -> str:
+    """
+    Render a script that finds the route of a host with a lookup per label of the host,
+    so that thousands of rules cost no more than a few.
+    The first rule for a pattern wins.
+    """
+    hosts: Dict[str, str] = {}
+    suffixes: Dict[str, str] = {}
+    for rule in profile.rules:
+        domain = _pattern_domain(rule.pattern)
+        if domain != rule.pattern:
+            suffixes.setdefault(domain, str(rule.route))
+        else:
+            hosts.setdefault(domain, str(rule.route))
+    return PAC_TEMPLATE % {
+        "default": json.dumps(str(profile.route)),
+        "hosts": json.dumps(hosts, indent=0, sort_keys=True),
+        "suffixes": json.dumps(suffixes, indent=0, sort_keys=True),
+    }
+
+
+class PacServer:
+    """
+    Serves a PAC script per name, a network service name, on /<name>.pac.
+    A name with no profile set serves DIRECT_PROFILE.
+
+    :param max_rendered: number of rendered profiles kept, least recently set are rendered again
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_rendered: int = 64):
+        self.host = host
+        self.port = port
+        self.max_rendered = max_rendered
+        self.render_count = 0
+        self.served_count = 0
+        self.not_modified_count = 0
+        self._lock = threading.Lock()
+        self._rendered: Dict[PacProfile, RenderedPac] = {}
+        # name -> (profile, rendered script, Last-Modified as a unix time)
+        self._served: Dict[str, Tuple[PacProfile, RenderedPac, int]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def url(self, name: str) -> str:
+        return f"http://{self.host}:{self.port}/{quote(name, safe='')}.pac"
+
+    def profile(self, name: str) -> PacProfile:
+        served = self._served.get(name)
+        return DIRECT_PROFILE if served is None else served[0]
+
+    def set_profile(self, name: str, profile: Optional[PacProfile]) -> bool:
+        """
+        Serve profile on the path of name, DIRECT_PROFILE if profile is None.
+
+        :return: whether the served script has changed
+        """
+        profile = profile or DIRECT_PROFILE
+        rendered = self._render(profile=profile)
+        with self._lock:
+            served = self._served.get(name)
+            if served is not None and served[1] == rendered:
+                self._served[name] = (profile, rendered, served[2])
+                return False
+            # strictly increasing, so If-Modified-Since with its seconds never misses a change
+            last_modified = int(time.time())
+            if served is not None:
+                last_modified = max(last_modified, served[2] + 1)
+            self._served[name] = (profile, rendered, last_modified)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rendered": self.render_count,
+            "served": self.served_count,
+            "not_modified": self.not_modified_count,
+        }
+
+    def start_in_thread(self) -> threading.Thread:
+        """
+        Listen and serve on a daemon thread, return once it listens.
+        """
+        server = ThreadingHTTPServer((self.host, self.port), _PacRequestHandler)
+        server.daemon_threads = True
+        server.pac_server = self
+        self._server = server
+        self.port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, name="PacServer", daemon=True)
+        thread.start()
+        logger.info(f"PAC server listening on {self.host}:{self.port}")
+        return thread
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _render(self, profile: PacProfile) -> RenderedPac:
+        with self._lock:
+            rendered = self._rendered.pop(profile, None)
+            if rendered is not None:
+                self._rendered[profile] = rendered
+                return rendered
+        body = render_pac(profile=profile).encode("utf-8")
+        rendered = RenderedPac(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        with self._lock:
+            self.render_count += 1
+            self._rendered[profile] = rendered
+            while len(self._rendered) > self.max_rendered:
+                del self._rendered[next(iter(self._rendered))]
+        return rendered
+
+    def _get_served(self, path: str) -> Optional[Tuple[RenderedPac, int]]:
+        path = urlsplit(path).path
+        if not (path.startswith("/") and path.endswith(".pac")):
+            return None
+        name = unquote(path[1:-len(".pac")])
+        served = self._served.get(name)
+        if served is None:
+            return self._render(profile=DIRECT_PROFILE), 0
+        return served[1], served[2]
+
+
+class _PacRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ProxyManagerPAC"
+
+    def do_GET(self) -> None:
+        self._respond(with_body=True)
+
+    def do_HEAD(self) -> None:
+        self._respond(with_body=False)
+
+    def _respond(self, with_body: bool) -> None:
+        pac_server: PacServer = self.server.pac_server
+        served = pac_server._get_served(self.path)
+        if served is None:
+            self.send_error(404)
+            return
+        rendered, last_modified = served
+        if self._is_not_modified(etag=rendered.etag, last_modified=last_modified):
+            pac_server.not_modified_count += 1
+            self.send_response(304)
+            self._send_validators(rendered=rendered, last_modified=last_modified)
+            self.end_headers()
+            return
+        pac_server.served_count += 1
+        self.send_response(200)
+        self.send_header("Content-Type", PAC_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(rendered.body)))
+        self._send_validators(rendered=rendered, last_modified=last_modified)
+        self.end_headers()
+        if with_body:
+            self.wfile.write(rendered.body)
+
+    def _send_validators(self, rendered: RenderedPac, last_modified: int) -> None:
+        self.send_header("ETag", rendered.etag)
+        if last_modified:
+            self.send_header("Last-Modified", formatdate(last_modified, usegmt=True))
+        # cached, but revalidated before every use
+        self.send_header("Cache-Control", "no-cache")
+
+    def _is_not_modified(self, etag: str, last_modified: int) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # If-Modified-Since is ignored when If-None-Match is sent, RFC 7232
+            return etag in (item.strip() for item in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is None or not last_modified:
+            return False
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"{self.address_string()} {format % args}")
@@ -0,0 +1,269 @@
+"""
+Health probing of the configured proxies, independent of the system proxy settings.
+
+Every round opens a TCP connection to each unique (domain, port) and optionally checks that a proxy
+answers on it: a SOCKS5 greeting or an HTTP CONNECT request. Keys sharing an endpoint share its probe.
+"""
+import asyncio
+import logging
+import math
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Address = Tuple[str, int]  # (ip, port)
+
+SOCKS5_GREETING = b"\x05\x01\x00"  # version 5, one method: no authentication
+HTTP_CONNECT_TARGET = "www.apple.com:443"
+
+
+class ProbeHandshakes(Enum):
+    TCP = "tcp"  # the connection is enough
+    SOCKS5 = "socks5"
+    HTTP_CONNECT = "http_connect"
+
+
+@dataclass(frozen=True)
+class ProbeTarget:
+    domain: str
+    port: int
+    handshake: ProbeHandshakes = ProbeHandshakes.TCP
+
+    def __str__(self) -> str:
+        return f"{self.handshake.value}://{self.domain}:{self.port}"
+
+
+@dataclass(frozen=True)
+class ProbeStats:
+    p50_ms: Optional[float]  # None until a probe has succeeded
+    p95_ms: Optional[float]
+    ok: bool  # whether the last probe succeeded
+    error: str = ""  # error of the last probe
+    samples: int = 0
+
+
+class ProbeError(Exception):
+    pass
+
+
+class DnsCache:
+    """
+    Resolves host names once per ttl. Concurrent lookups of the same name share one resolution.
+
+    :param ttl: seconds a resolution is reused, failed resolutions are not cached
+    :param resolve: async function (host, port) -> addresses, getaddrinfo of the running loop by default
+    """
+
+    def __init__(
+            self,
+            ttl: float = 60,
+            resolve: Optional[Callable[[str, int], Awaitable[List[Address]]]] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.clock = clock
+        self.resolve_count = 0
+        self._resolve = resolve or self._getaddrinfo
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[Address]]] = {}
+        self._pending: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def resolve(self, host: str, port: int) -> List[Address]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is not None and self.clock() < entry[0]:
+            return entry[1]
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            self.resolve_count += 1
+            addresses = await self._resolve(host, port)
+            if not addresses:
+                raise ProbeError(f"{host} has no addresses")
+            self._entries[key] = (self.clock() + self.ttl, addresses)
+            future.set_result(addresses)
+            return addresses
+        except Exception as err:
+            future.set_exception(err)
+            future.exception()  # retrieved, so an exception nobody waits for is not reported
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._pending[key]
+
+    @staticmethod
+    async def _getaddrinfo(host: str, port: int) -> List[Address]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return [(info[4][0], info[4][1]) for info in infos]
+
+
+class LatencyWindow:
+    """
+    Latencies of the last size successful probes.
+    """
+
+    def __init__(self, size: int = 20):
+        self._latencies_ms: Deque[float] = deque(maxlen=size)
+
+    def add(self, latency_ms: float) -> None:
+        self._latencies_ms.append(latency_ms)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        :return: nearest-rank percentile, None if the window is empty
+        """
+        if not self._latencies_ms:
+            return None
+        latencies_ms = sorted(self._latencies_ms)
+        rank = max(math.ceil(fraction * len(latencies_ms)), 1)
+        return latencies_ms[rank - 1]
+
+    def __len__(self) -> int:
+        return len(self._latencies_ms)
+
+
+async def _handshake(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        target: ProbeTarget,
+) -> None:
+    if target.handshake is ProbeHandshakes.SOCKS5:
+        writer.write(SOCKS5_GREETING)
+        await writer.drain()
+        reply = await reader.readexactly(2)
+        # 0xFF means no offered method is accepted, the server is still a SOCKS5 proxy asking for credentials
+        if reply[0] != 5:
+            raise ProbeError(f"Not a SOCKS5 reply {reply!r}")
+    elif target.handshake is ProbeHandshakes.HTTP_CONNECT:
+        writer.write(f"CONNECT {HTTP_CONNECT_TARGET} HTTP/1.1\r\nHost: {HTTP_CONNECT_TARGET}\r\n\r\n".encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        # any status, 407 Proxy Authentication Required included, means an HTTP proxy answers
+        if not status_line.startswith(b"HTTP/1."):
+            raise ProbeError(f"Not an HTTP reply {status_line[:32]!r}")
+
+
+async def probe(target: ProbeTarget, dns_cache: DnsCache, timeout: float = 2) -> float:
+    """
+    Connect to target and do its handshake.
+
+    :param timeout: seconds for the whole probe, resolution included
+    :return: milliseconds from the start of the connection to the end of the handshake
+    :raises ProbeError: or OSError if the proxy cannot be reached, asyncio.TimeoutError on timeout
+    """
+
+    async def run() -> float:
+        addresses = await dns_cache.resolve(target.domain, target.port)
+        started_at = time.perf_counter()
+        reader, writer = await asyncio.open_connection(*addresses[0])
+        try:
+            await _handshake(reader=reader, writer=writer, target=target)
+            return (time.perf_counter() - started_at) * 1000
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(run(), timeout=timeout)
+
+
+class ProxyProber:
+    """
+    Probes targets concurrently every interval on an asyncio loop of its own thread,
+    keeping a LatencyWindow per target.
+
+    :param get_targets: returns the targets to probe, with the keys showing each of them
+    :param on_stats: called from the prober thread after every round with the stats of the probed targets
+        and the keys showing them
+    :param max_concurrency: number of probes running at the same time
+    """
+
+    def __init__(
+            self,
+            get_targets: Callable[[], Dict[ProbeTarget, List[Hashable]]],
+            on_stats: Callable[[Dict[ProbeTarget, ProbeStats], Dict[ProbeTarget, List[Hashable]]], None],
+            interval: float = 10,
+            timeout: float = 2,
+            window_size: int = 20,
+            dns_ttl: float = 60,
+            max_concurrency: int = 16,
+    ):
+        self.get_targets = get_targets
+        self.on_stats = on_stats
+        self.interval = interval
+        self.timeout = timeout
+        self.window_size = window_size
+        self.max_concurrency = max_concurrency
+        self.dns_cache = DnsCache(ttl=dns_ttl)
+        self.probe_count = 0
+        self._windows: Dict[ProbeTarget, LatencyWindow] = {}
+        self._errors: Dict[ProbeTarget, str] = {}
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=asyncio.run, args=(self.run(),), name="ProxyProber", daemon=True)
+        thread.start()
+        return thread
+
+    async def run(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            try:
+                target_to_keys = self.get_targets()
+                target_to_stats = await self.probe_targets(targets=target_to_keys)
+                self.on_stats(target_to_stats, target_to_keys)
+            except Exception as err:
+                logger.exception(err)
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started_at), 0))
+
+    async def probe_targets(self, targets: Iterable[ProbeTarget]) -> Dict[ProbeTarget, ProbeStats]:
+        """
+        Probe every target once and forget the targets that are not probed anymore.
+        """
+        targets = set(targets)
+        for target in (set(self._windows) | set(self._errors)) - targets:
+            self._windows.pop(target, None)
+            self._errors.pop(target, None)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def probe_target(target: ProbeTarget) -> None:
+            async with semaphore:
+                self.probe_count += 1
+                try:
+                    latency_ms = await probe(target=target, dns_cache=self.dns_cache, timeout=self.timeout)
+                except (ProbeError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as err:
+                    self._errors[target] = str(err) or type(err).__name__
+                    logger.debug(f"Probe of {target} failed: {self._errors[target]}")
+                    return
+            self._errors.pop(target, None)
+            self._windows.setdefault(target, LatencyWindow(size=self.window_size)).add(latency_ms)
+
+        await asyncio.gather(*(probe_target(target) for target in targets))
+        return {target: self.stats(target) for target in targets}
+
+    def stats(self, target: ProbeTarget) -> ProbeStats:
+        window = self._windows.get(target) or LatencyWindow(size=0)
+        error = self._errors.get(target, "")
+        return ProbeStats(
+            p50_ms=window.percentile(0.5),
+            p95_ms=window.percentile(0.95),
+            ok=not error and len(window) > 0,
+            error=error,
+            samples=len(window),
+        )
+
+
+def format_title(stats: ProbeStats) -> str:
+    """
+    :return: key title with the p50 and p95 latency, "down" if the last probe failed
+    """
+    if not stats.ok:
+        return "down"
+    return f"{stats.p50_ms:.0f}ms\np95 {stats.p95_ms:.0f}ms"
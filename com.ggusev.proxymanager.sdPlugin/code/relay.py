@@ -0,0 +1,595 @@
+"""
+Local forwarding proxy, so that switching proxies only changes where the relay forwards to.
+
+The system proxies point at the relay once. The relay accepts HTTP proxy requests (CONNECT and
+absolute-form requests) and SOCKS5 CONNECT requests on the same port. It forwards them through
+its upstream proxy, or directly while it has no upstream.
+
+Connections accepted before a switch keep their upstream and are given drain_timeout seconds to finish.
+"""
+import asyncio
+import base64
+import ipaddress
+import logging
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from prober import DnsCache, ProbeError
+
+logger = logging.getLogger(__name__)
+
+HEAD_LIMIT = 64 * 1024
+HEAD_END = b"\r\n\r\n"
+# SOCKS5 reply codes
+SOCKS5_SUCCEEDED = 0x00
+SOCKS5_GENERAL_FAILURE = 0x01
+SOCKS5_HOST_UNREACHABLE = 0x04
+SOCKS5_CONNECTION_REFUSED = 0x05
+SOCKS5_COMMAND_NOT_SUPPORTED = 0x07
+SOCKS5_ADDRESS_TYPE_NOT_SUPPORTED = 0x08
+# hop-by-hop headers of the client that are not forwarded
+PROXY_HEADERS = (b"proxy-authorization:", b"proxy-connection:", b"connection:", b"keep-alive:")
+
+
+class UpstreamKinds(Enum):
+    HTTP = "http"  # HTTP proxy supporting CONNECT
+    SOCKS5 = "socks5"
+
+
+@dataclass(frozen=True)
+class Upstream:
+    kind: UpstreamKinds
+    domain: str
+    port: int
+    username: str = ""
+    password: str = ""
+
+    def __str__(self) -> str:
+        return f"{self.kind.value}://{self.domain}:{self.port}"
+
+
+class RelayError(Exception):
+    """
+    :param socks5_reply: reply code sent to SOCKS5 clients
+    :param http_status: status line sent to HTTP clients
+    """
+
+    def __init__(
+            self,
+            message: str,
+            socks5_reply: int = SOCKS5_GENERAL_FAILURE,
+            http_status: bytes = b"502 Bad Gateway",
+    ):
+        super().__init__(message)
+        self.socks5_reply = socks5_reply
+        self.http_status = http_status
+
+
+class _Socket:
+    """
+    Non-blocking socket with buffered reads for the handshakes.
+    Bytes read past a handshake stay in pending and are forwarded first.
+    """
+
+    def __init__(self, sock: socket.socket, loop: asyncio.AbstractEventLoop):
+        sock.setblocking(False)
+        self.sock = sock
+        self.loop = loop
+        self.pending = b""
+
+    async def read_exactly(self, size: int) -> bytes:
+        while len(self.pending) < size:
+            await self._recv()
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    async def read_until(self, separator: bytes, limit: int = HEAD_LIMIT) -> bytes:
+        """
+        :return: the bytes up to and including separator
+        """
+        while True:
+            index = self.pending.find(separator)
+            if index >= 0:
+                index += len(separator)
+                data, self.pending = self.pending[:index], self.pending[index:]
+                return data
+            if len(self.pending) > limit:
+                raise RelayError(f"No {separator!r} in {limit} bytes",
+                                 http_status=b"431 Request Header Fields Too Large")
+            await self._recv()
+
+    async def sendall(self, data: bytes) -> None:
+        await self.loop.sock_sendall(self.sock, data)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    async def _recv(self) -> None:
+        data = await self.loop.sock_recv(self.sock, 65536)
+        if not data:
+            raise RelayError("Connection closed during the handshake")
+        self.pending += data
+
+
+def _split_host_port(target: bytes, default_port: int) -> Tuple[str, int]:
+    """
+    :param target: host:port, [ipv6]:port or host
+    """
+    try:
+        text = target.decode()
+    except UnicodeDecodeError:
+        raise RelayError(f"Bad target {target[:64]!r}", http_status=b"400 Bad Request") from None
+    if text.startswith("["):
+        host, _, rest = text[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else ""
+    elif text.count(":") == 1:
+        host, port = text.split(":")
+    else:
+        host, port = text, ""
+    try:
+        return host, int(port) if port else default_port
+    except ValueError:
+        raise RelayError(f"Bad target {text}", http_status=b"400 Bad Request") from None
+
+
+def _socks5_address(host: str) -> bytes:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        encoded = host.encode("idna")
+        return b"\x03" + bytes([len(encoded)]) + encoded
+    return (b"\x01" if address.version == 4 else b"\x04") + address.packed
+
+
+def _basic_auth(username: str, password: str) -> bytes:
+    return b"Basic " + base64.b64encode(f"{username}:{password}".encode())
+
+
+class _UpstreamPool:
+    """
+    TCP connections to the upstream proxy opened in advance, so a request does not wait for the connect.
+    Every connection is used for one request, the pool is refilled in the background.
+    """
+
+    def __init__(self, relay: "LocalRelay", upstream: Upstream, size: int, idle_timeout: float):
+        self.relay = relay
+        self.upstream = upstream
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.closed = False
+        self._idle: Deque[Tuple[_Socket, float]] = deque()
+        self._refill_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> _Socket:
+        now = time.monotonic()
+        while self._idle:
+            conn, opened_at = self._idle.popleft()
+            if now - opened_at < self.idle_timeout and self._is_open(conn):
+                self.relay.pool_hits += 1
+                self.refill()
+                return conn
+            conn.close()
+        self.relay.pool_misses += 1
+        self.refill()
+        return await self.relay.connect(self.upstream.domain, self.upstream.port)
+
+    def close(self) -> None:
+        self.closed = True
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        while self._idle:
+            self._idle.popleft()[0].close()
+
+    def refill(self) -> None:
+        if self.size and (self._refill_task is None or self._refill_task.done()):
+            self._refill_task = asyncio.ensure_future(self._fill())
+
+    async def _fill(self) -> None:
+        while not self.closed and len(self._idle) < self.size:
+            try:
+                conn = await self.relay.connect(self.upstream.domain, self.upstream.port)
+            except (OSError, RelayError) as err:
+                logger.debug(f"Could not open a pooled connection to {self.upstream}: {err}")
+                return
+            if self.closed:
+                conn.close()
+                return
+            self._idle.append((conn, time.monotonic()))
+
+    @staticmethod
+    def _is_open(conn: _Socket) -> bool:
+        try:
+            return conn.sock.recv(1, socket.MSG_PEEK) != b""
+        except BlockingIOError:
+            return True  # nothing to read: open and idle
+        except OSError:
+            return False
+
+
+class LocalRelay:
+    """
+    :param host: address to listen on, keep it local: clients are not authenticated
+    :param port: port to listen on, 0 for any free port
+    :param buffer_size: bytes of every buffer copying between a client and its upstream
+    :param pool_size: idle connections to the upstream proxy kept open, 0 disables the pool
+    :param pool_idle_timeout: seconds an idle pooled connection is used for, older ones are closed
+    :param drain_timeout: seconds connections accepted before a switch keep going, they are closed after
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            buffer_size: int = 256 * 1024,
+            pool_size: int = 4,
+            pool_idle_timeout: float = 30,
+            drain_timeout: float = 30,
+            connect_timeout: float = 10,
+            max_idle_buffers: int = 64,
+    ):
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.pool_size = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.drain_timeout = drain_timeout
+        self.connect_timeout = connect_timeout
+        self.max_idle_buffers = max_idle_buffers
+        self.accepted_count = 0
+        self.failed_count = 0
+        self.drained_count = 0  # connections closed when the drain timeout of a switch expired
+        self.bytes_relayed = 0
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self._upstream: Optional[Upstream] = None
+        self._generation = 0
+        self._pool: Optional[_UpstreamPool] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[socket.socket] = None
+        self._accept_task: Optional[asyncio.Task] = None
+        self._connections: Dict[asyncio.Task, int] = {}  # connection -> generation it was accepted in
+        self._buffers: List[bytearray] = []
+        self._dns_cache = DnsCache()
+
+    @property
+    def upstream(self) -> Optional[Upstream]:
+        return self._upstream
+
+    def set_upstream(self, upstream: Optional[Upstream]) -> None:
+        """
+        Forward new connections through upstream, directly if None. Thread-safe.
+        """
+        with self._lock:
+            if upstream == self._upstream:
+                return
+            self._upstream = upstream
+            self._generation += 1
+            generation = self._generation
+        logger.info(f"Relay upstream: {upstream or 'direct'}")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._switch, upstream, generation)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "accepted": self.accepted_count,
+            "active": len(self._connections),
+            "failed": self.failed_count,
+            "drained": self.drained_count,
+            "bytes": self.bytes_relayed,
+            "pool_hits": self.pool_hits,
+            "pool_misses": self.pool_misses,
+        }
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        listener = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(128)
+        listener.setblocking(False)
+        self._listener = listener
+        self.port = listener.getsockname()[1]
+        self._switch(self._upstream, self._generation)
+        self._accept_task = asyncio.ensure_future(self._accept())
+        logger.info(f"Relay listening on {self.host}:{self.port}")
+
+    def start_in_thread(self) -> threading.Thread:
+        """
+        Run the relay on an event loop of its own daemon thread, return once it listens.
+        """
+        started = threading.Event()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.start())
+            except BaseException as err:
+                errors.append(err)
+                started.set()
+                return
+            started.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name="LocalRelay", daemon=True)
+        thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        return thread
+
+    async def close(self) -> None:
+        if self._accept_task is not None:
+            self._accept_task.cancel()
+        if self._listener is not None:
+            self._listener.close()
+        if self._pool is not None:
+            self._pool.close()
+        tasks = list(self._connections)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def connect(self, host: str, port: int) -> _Socket:
+        """
+        Open a TCP connection, trying every address of host.
+        """
+        try:
+            addresses = await self._dns_cache.resolve(host, port)
+        except ProbeError as err:
+            raise OSError(str(err)) from None
+        last_error: Optional[OSError] = None
+        for address in addresses:
+            sock = socket.socket(socket.AF_INET6 if ":" in address[0] else socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(self._loop.sock_connect(sock, address), timeout=self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as err:
+                sock.close()
+                last_error = err if isinstance(err, OSError) else OSError(f"Connect to {host}:{port} timed out")
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return _Socket(sock=sock, loop=self._loop)
+        raise last_error or OSError(f"{host} has no addresses")
+
+    def _switch(self, upstream: Optional[Upstream], generation: int) -> None:
+        if generation != self._generation:
+            return  # a later switch is already scheduled
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        if upstream is not None:
+            self._pool = _UpstreamPool(
+                relay=self,
+                upstream=upstream,
+                size=self.pool_size,
+                idle_timeout=self.pool_idle_timeout,
+            )
+            self._pool.refill()
+        old_tasks = [task for task, task_generation in self._connections.items() if task_generation < generation]
+        if old_tasks:
+            asyncio.ensure_future(self._drain(old_tasks))
+
+    async def _drain(self, tasks: List[asyncio.Task]) -> None:
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        self.drained_count += len(pending)
+
+    async def _accept(self) -> None:
+        while True:
+            try:
+                sock, _ = await self._loop.sock_accept(self._listener)
+            except OSError as err:
+                logger.warning(f"Relay accept failed: {err}")
+                await asyncio.sleep(0.1)
+                continue
+            self.accepted_count += 1
+            with self._lock:
+                upstream, generation = self._upstream, self._generation
+            task = asyncio.ensure_future(self._handle(client=_Socket(sock=sock, loop=self._loop), upstream=upstream))
+            self._connections[task] = generation
+            task.add_done_callback(self._connections.pop)
+
+    async def _handle(self, client: _Socket, upstream: Optional[Upstream]) -> None:
+        remote: Optional[_Socket] = None
+        try:
+            first_byte = await client.read_exactly(1)
+            client.pending = first_byte + client.pending
+            if first_byte == b"\x05":
+                remote = await self._handle_socks5(client=client, upstream=upstream)
+            else:
+                remote = await self._handle_http(client=client, upstream=upstream)
+            if remote is None:
+                return
+            await self._relay(client=client, remote=remote)
+        except (RelayError, OSError, asyncio.TimeoutError) as err:
+            self.failed_count += 1
+            logger.debug(f"Relay connection failed: {err}")
+        finally:
+            client.close()
+            if remote is not None:
+                remote.close()
+
+    async def _handle_socks5(
+            self,
+            client: _Socket,
+            upstream: Optional[Upstream],
+    ) -> Optional[_Socket]:
+        _, methods_count = await client.read_exactly(2)
+        methods = await client.read_exactly(methods_count)
+        if 0 not in methods:
+            await client.sendall(b"\x05\xff")
+            return None
+        await client.sendall(b"\x05\x00")
+        _, command, _, address_type = await client.read_exactly(4)
+        try:
+            if address_type == 1:
+                host = str(ipaddress.IPv4Address(await client.read_exactly(4)))
+            elif address_type == 3:
+                host = (await client.read_exactly((await client.read_exactly(1))[0])).decode("idna")
+            elif address_type == 4:
+                host = str(ipaddress.IPv6Address(await client.read_exactly(16)))
+            else:
+                raise RelayError(f"Bad SOCKS5 address type {address_type}", SOCKS5_ADDRESS_TYPE_NOT_SUPPORTED)
+            port = struct.unpack("!H", await client.read_exactly(2))[0]
+            if command != 1:
+                raise RelayError(f"SOCKS5 command {command} is not supported", SOCKS5_COMMAND_NOT_SUPPORTED)
+            remote = await self._open_tunnel(host=host, port=port, upstream=upstream)
+        except RelayError as err:
+            await client.sendall(b"\x05" + bytes([err.socks5_reply]) + b"\x00\x01\x00\x00\x00\x00\x00\x00")
+            raise
+        except OSError:
+            await client.sendall(b"\x05" + bytes([SOCKS5_CONNECTION_REFUSED]) + b"\x00\x01\x00\x00\x00\x00\x00\x00")
+            raise
+        await client.sendall(b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+        return remote
+
+    async def _handle_http(
+            self,
+            client: _Socket,
+            upstream: Optional[Upstream],
+    ) -> Optional[_Socket]:
+        head = await client.read_until(HEAD_END)
+        request_line, _, headers = head.partition(b"\r\n")
+        try:
+            method, target, version = request_line.split(b" ")
+        except ValueError:
+            await client.sendall(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n")
+            return None
+        try:
+            if method == b"CONNECT":
+                host, port = _split_host_port(target, default_port=443)
+                remote = await self._open_tunnel(host=host, port=port, upstream=upstream)
+                await client.sendall(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                return remote
+            url = urlsplit(target)
+            if url.scheme != b"http" or not url.netloc:
+                raise RelayError(f"Bad proxy request target {target[:64]!r}", http_status=b"400 Bad Request")
+            forwarded_headers = b"".join(
+                line + b"\r\n" for line in headers[:-len(HEAD_END)].split(b"\r\n")
+                if line and not line.lower().startswith(PROXY_HEADERS)
+            )
+            if upstream is not None and upstream.kind is UpstreamKinds.HTTP:
+                remote = await self._pool_connection(upstream=upstream)
+                if upstream.username and upstream.password:
+                    forwarded_headers += b"Proxy-Authorization: " + _basic_auth(upstream.username,
+                                                                                upstream.password) + b"\r\n"
+                request_line = b" ".join([method, target, version])
+            else:
+                host, port = _split_host_port(url.netloc, default_port=80)
+                remote = await self._open_tunnel(host=host, port=port, upstream=upstream)
+                path = url.path or b"/"
+                request_line = b" ".join([method, path + (b"?" + url.query if url.query else b""), version])
+            # one request per connection, the next one may be for another host
+            await remote.sendall(request_line + b"\r\n" + forwarded_headers + b"Connection: close\r\n\r\n")
+            return remote
+        except (RelayError, OSError) as err:
+            status = err.http_status if isinstance(err, RelayError) else b"502 Bad Gateway"
+            await client.sendall(b"HTTP/1.1 " + status + b"\r\nConnection: close\r\n\r\n")
+            raise
+
+    async def _pool_connection(self, upstream: Upstream) -> _Socket:
+        pool = self._pool
+        if pool is None or pool.upstream != upstream:
+            # accepted before a switch: no pool for the old upstream
+            return await self.connect(upstream.domain, upstream.port)
+        return await pool.get()
+
+    async def _open_tunnel(self, host: str, port: int, upstream: Optional[Upstream]) -> _Socket:
+        """
+        :return: connection to host:port, through upstream if it is not None
+        """
+        if upstream is None:
+            return await self.connect(host, port)
+        remote = await self._pool_connection(upstream=upstream)
+        try:
+            if upstream.kind is UpstreamKinds.HTTP:
+                await self._connect_http(remote=remote, upstream=upstream, host=host, port=port)
+            else:
+                await self._connect_socks5(remote=remote, upstream=upstream, host=host, port=port)
+        except BaseException:
+            remote.close()
+            raise
+        return remote
+
+    @staticmethod
+    async def _connect_http(remote: _Socket, upstream: Upstream, host: str, port: int) -> None:
+        authority = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+        request = f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n".encode()
+        if upstream.username and upstream.password:
+            request += b"Proxy-Authorization: " + _basic_auth(upstream.username, upstream.password) + b"\r\n"
+        await remote.sendall(request + b"\r\n")
+        status_line = (await remote.read_until(HEAD_END)).split(b"\r\n", 1)[0]
+        parts = status_line.split(b" ", 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") or not parts[1].startswith(b"2"):
+            raise RelayError(
+                f"{upstream} refused CONNECT {authority}: {status_line[:64]!r}",
+                socks5_reply=SOCKS5_HOST_UNREACHABLE,
+            )
+
+    @staticmethod
+    async def _connect_socks5(remote: _Socket, upstream: Upstream, host: str, port: int) -> None:
+        authenticate = bool(upstream.username and upstream.password)
+        await remote.sendall(b"\x05\x02\x00\x02" if authenticate else b"\x05\x01\x00")
+        version, method = await remote.read_exactly(2)
+        if version != 5 or method not in ((0, 2) if authenticate else (0,)):
+            raise RelayError(f"{upstream} accepts no offered SOCKS5 method")
+        if method == 2:
+            username, password = upstream.username.encode(), upstream.password.encode()
+            await remote.sendall(b"\x01" + bytes([len(username)]) + username + bytes([len(password)]) + password)
+            if (await remote.read_exactly(2))[1] != 0:
+                raise RelayError(f"{upstream} rejected the username and password")
+        await remote.sendall(b"\x05\x01\x00" + _socks5_address(host) + struct.pack("!H", port))
+        _, reply, _, address_type = await remote.read_exactly(4)
+        if address_type == 1:
+            await remote.read_exactly(4 + 2)
+        elif address_type == 3:
+            await remote.read_exactly((await remote.read_exactly(1))[0] + 2)
+        elif address_type == 4:
+            await remote.read_exactly(16 + 2)
+        if reply != SOCKS5_SUCCEEDED:
+            raise RelayError(f"{upstream} could not connect to {host}:{port}: reply {reply}", socks5_reply=reply)
+
+    async def _relay(self, client: _Socket, remote: _Socket) -> None:
+        if client.pending:
+            await remote.sendall(client.pending)
+            client.pending = b""
+        if remote.pending:
+            await client.sendall(remote.pending)
+            remote.pending = b""
+        await asyncio.gather(self._copy(client, remote), self._copy(remote, client))
+
+    async def _copy(self, source: _Socket, destination: _Socket) -> None:
+        """
+        Copy until source is closed through a buffer reused by other connections afterwards.
+        """
+        buffer = self._buffers.pop() if self._buffers else bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        try:
+            while True:
+                size = await self._loop.sock_recv_into(source.sock, buffer)
+                if not size:
+                    break
+                await self._loop.sock_sendall(destination.sock, view[:size])
+                self.bytes_relayed += size
+            how = socket.SHUT_WR
+        except OSError:
+            how = socket.SHUT_RDWR  # stop the other direction too
+        finally:
+            view.release()
+            if len(self._buffers) < self.max_idle_buffers:
+                self._buffers.append(buffer)
+        for sock in (destination.sock, source.sock) if how == socket.SHUT_RDWR else (destination.sock,):
+            try:
+                sock.shutdown(how)
+            except OSError:
+                pass
@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+_UNSET = object()
+
+
+@dataclass
+class _Schedule:
+    interval: float
+    boost_until: float
+    due: Optional[float] = None  # None while the key is being polled
+    last_value: Any = _UNSET
+
+
+class MonitoringScheduler:
+    """
+    Polls every key on its own timer, all timers share one heap.
+
+    A key is polled every fast_interval for boost_window seconds after boost().
+    After that its interval is multiplied by backoff_factor on every poll, up to max_interval.
+    A poll that reports a different value than the previous one boosts the key again.
+    """
+
+    def __init__(
+            self,
+            fast_interval: float = 0.2,
+            boost_window: float = 3,
+            max_interval: float = 10,
+            backoff_factor: float = 2,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.fast_interval = fast_interval
+        self.boost_window = boost_window
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._schedules: Dict[Hashable, _Schedule] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+
+    def boost(self, keys: Optional[Iterable[Hashable]] = None) -> None:
+        """
+        Poll keys now and keep polling them fast. New keys are added.
+
+        :param keys: keys to boost, all known keys if None
+        """
+        with self._condition:
+            now = self.clock()
+            for key in list(self._schedules) if keys is None else keys:
+                schedule = self._schedules.get(key)
+                if schedule is None:
+                    schedule = self._schedules[key] = _Schedule(interval=self.fast_interval, boost_until=now)
+                schedule.interval = self.fast_interval
+                schedule.boost_until = now + self.boost_window
+                self._push(key=key, due=now)
+            self._condition.notify_all()
+
+    def remove(self, key: Hashable) -> None:
+        with self._condition:
+            self._schedules.pop(key, None)
+
+    def due_keys(self) -> List[Hashable]:
+        """
+        Pop the keys that are due. Every popped key must be passed back to report().
+        """
+        with self._condition:
+            return self._pop_due(now=self.clock())
+
+    def wait_due(self, timeout: Optional[float] = None) -> List[Hashable]:
+        """
+        Block until some keys are due and pop them, or until timeout.
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._condition:
+            while True:
+                now = self.clock()
+                keys = self._pop_due(now=now)
+                if keys:
+                    return keys
+                wait_until = self._heap[0][0] if self._heap else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return []
+                    wait_until = deadline if wait_until is None else min(wait_until, deadline)
+                self._condition.wait(None if wait_until is None else wait_until - now)
+
+    def report(self, key: Hashable, value: Any = _UNSET) -> None:
+        """
+        Schedule the next poll of a popped key.
+
+        :param value: polled value, compared to the previous one. Leave unset if the poll failed.
+        """
+        with self._condition:
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                return
+            now = self.clock()
+            changed = (value is not _UNSET and schedule.last_value is not _UNSET
+                       and value != schedule.last_value)
+            if value is not _UNSET:
+                schedule.last_value = value
+            if changed:
+                schedule.boost_until = now + self.boost_window
+            if now < schedule.boost_until:
+                schedule.interval = self.fast_interval
+            else:
+                schedule.interval = min(schedule.interval * self.backoff_factor, self.max_interval)
+            if schedule.due is not None:  # boosted while being polled
+                return
+            self._push(key=key, due=now + schedule.interval)
+
+    def next_due(self, key: Hashable) -> Optional[float]:
+        with self._condition:
+            schedule = self._schedules.get(key)
+            return None if schedule is None else schedule.due
+
+    def _push(self, key: Hashable, due: float) -> None:
+        schedule = self._schedules[key]
+        if schedule.due is not None and schedule.due <= due:
+            return
+        schedule.due = due
+        heapq.heappush(self._heap, (due, next(self._counter), key))
+
+    def _pop_due(self, now: float) -> List[Hashable]:
+        keys = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, key = heapq.heappop(self._heap)
+            schedule = self._schedules.get(key)
+            if schedule is None or schedule.due != due:  # removed or rescheduled
+                continue
+            schedule.due = None
+            keys.append(key)
+        return keys
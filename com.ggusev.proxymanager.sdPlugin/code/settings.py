@@ -1,8 +1,67 @@
-import logging
 import os
 from pathlib import Path
 
 PLUGIN_LOGS_DIR_PATH: Path = Path(os.environ.get("PLUGIN_LOGS_DIR_PATH", Path(__file__).parents[2] / "logs"))
 PLUGIN_NAME: str = os.environ.get("PLUGIN_NAME", Path(__file__).parents[1].name)
 LOG_FILE_PATH: Path = PLUGIN_LOGS_DIR_PATH / Path(f"{PLUGIN_NAME}.log")
-LOG_LEVEL: int = logging.DEBUG
+# DEBUG, INFO, WARNING or ERROR, can be changed at runtime with the log_level global setting
+LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "DEBUG")
+# seconds the same message from the same line is not logged again for, 0 to log every message
+LOG_RATE_LIMIT_INTERVAL: float = float(os.environ.get("LOG_RATE_LIMIT_INTERVAL", "60"))
+# records waiting for the log writer thread, more are dropped instead of blocking
+LOG_QUEUE_SIZE: int = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# networksetup | memory | replay. memory simulates MEMORY_BACKEND_NETWORKSERVICES networkservices
+# without changing the system, replay serves the corpus at NETWORKSETUP_REPLAY_PATH.
+PROXY_BACKEND: str = os.environ.get("PROXY_BACKEND", "networksetup")
+MEMORY_BACKEND_NETWORKSERVICES: int = int(os.environ.get("MEMORY_BACKEND_NETWORKSERVICES", "1000"))
+MEMORY_BACKEND_LATENCY: float = float(os.environ.get("MEMORY_BACKEND_LATENCY", "0"))
+MEMORY_BACKEND_FAILURE_RATE: float = float(os.environ.get("MEMORY_BACKEND_FAILURE_RATE", "0"))
+NETWORKSETUP_REPLAY_PATH: str = os.environ.get("NETWORKSETUP_REPLAY_PATH", "")
+NETWORKSETUP_REPLAY_TIMINGS: bool = os.environ.get("NETWORKSETUP_REPLAY_TIMINGS", "1") == "1"
+# JSONL corpus every networksetup run is appended to, empty to not record
+NETWORKSETUP_RECORD_PATH: str = os.environ.get("NETWORKSETUP_RECORD_PATH", "")
+# networksetup | preferences | scutil, used with the networksetup PROXY_BACKEND
+PROXY_READ_BACKEND: str = os.environ.get("PROXY_READ_BACKEND", "networksetup")
+WATCH_PROXY_CHANGES: bool = os.environ.get("WATCH_PROXY_CHANGES", "1") == "1"
+PROXY_CACHE_TTL: float = float(os.environ.get("PROXY_CACHE_TTL", "1"))
+PROXY_CACHE_MAX_SIZE: int = int(os.environ.get("PROXY_CACHE_MAX_SIZE", "256"))
+MONITORING_FAST_INTERVAL: float = float(os.environ.get("MONITORING_FAST_INTERVAL", "0.2"))
+MONITORING_BOOST_WINDOW: float = float(os.environ.get("MONITORING_BOOST_WINDOW", "3"))
+MONITORING_MAX_INTERVAL: float = float(os.environ.get("MONITORING_MAX_INTERVAL", "10"))
+MONITORING_WATCHED_MAX_INTERVAL: float = float(os.environ.get("MONITORING_WATCHED_MAX_INTERVAL", "60"))
+PROXY_EXECUTOR_MAX_WORKERS: int = int(os.environ.get("PROXY_EXECUTOR_MAX_WORKERS", "4"))
+MONITORING_CONCURRENCY: int = int(os.environ.get("MONITORING_CONCURRENCY", "4"))
+# last known state of every key, shown on launch until the proxy settings have been read
+STATE_SNAPSHOT_PATH: Path = Path(os.environ.get("STATE_SNAPSHOT_PATH", Path(__file__).parents[1] / "state_snapshot.json"))
+OPTIMISTIC_KEY_STATE: bool = os.environ.get("OPTIMISTIC_KEY_STATE", "1") == "1"
+# counts and latency histograms of networksetup commands, key presses and monitoring iterations
+METRICS_ENABLED: bool = os.environ.get("METRICS_ENABLED", "0") == "1"
+METRICS_DUMP_INTERVAL: float = float(os.environ.get("METRICS_DUMP_INTERVAL", "60"))
+METRICS_FILE_PATH: Path = PLUGIN_LOGS_DIR_PATH / Path(f"{PLUGIN_NAME}.metrics.jsonl")
+# written on the first willAppear when run.sh runs with PLUGIN_PROFILE_STARTUP=1
+STARTUP_REPORT_PATH: Path = PLUGIN_LOGS_DIR_PATH / Path("startup_profile.json")
+# off by default: TCP connect probes of the configured proxies, their p50 and p95 latency is shown as the key title
+PROXY_PROBE_ENABLED: bool = os.environ.get("PROXY_PROBE_ENABLED", "0") == "1"
+PROXY_PROBE_INTERVAL: float = float(os.environ.get("PROXY_PROBE_INTERVAL", "10"))
+PROXY_PROBE_TIMEOUT: float = float(os.environ.get("PROXY_PROBE_TIMEOUT", "2"))
+# check that a SOCKS5 or HTTP proxy answers on the connection, not only that it is accepted
+PROXY_PROBE_HANDSHAKE: bool = os.environ.get("PROXY_PROBE_HANDSHAKE", "0") == "1"
+PROXY_PROBE_WINDOW: int = int(os.environ.get("PROXY_PROBE_WINDOW", "20"))
+PROXY_PROBE_DNS_TTL: float = float(os.environ.get("PROXY_PROBE_DNS_TTL", "60"))
+# seconds a key press waits for one of the endpoints of the key to answer
+ENDPOINT_SELECTION_DEADLINE: float = float(os.environ.get("ENDPOINT_SELECTION_DEADLINE", "1.5"))
+# forward through a local relay: the system proxy points at it once and key presses switch its upstream.
+# While the relay is used, proxies stop working when the plugin is not running.
+LOCAL_RELAY_ENABLED: bool = os.environ.get("LOCAL_RELAY_ENABLED", "0") == "1"
+LOCAL_RELAY_HOST: str = os.environ.get("LOCAL_RELAY_HOST", "127.0.0.1")
+LOCAL_RELAY_PORT: int = int(os.environ.get("LOCAL_RELAY_PORT", "18080"))
+LOCAL_RELAY_BUFFER_SIZE: int = int(os.environ.get("LOCAL_RELAY_BUFFER_SIZE", str(256 * 1024)))
+LOCAL_RELAY_POOL_SIZE: int = int(os.environ.get("LOCAL_RELAY_POOL_SIZE", "4"))
+LOCAL_RELAY_POOL_IDLE_TIMEOUT: float = float(os.environ.get("LOCAL_RELAY_POOL_IDLE_TIMEOUT", "30"))
+LOCAL_RELAY_DRAIN_TIMEOUT: float = float(os.environ.get("LOCAL_RELAY_DRAIN_TIMEOUT", "30"))
+# serve PAC scripts from memory: the auto-proxy URL of a networkservice points at the server once
+# and key presses swap the script. Takes precedence over LOCAL_RELAY_ENABLED.
+# Scripts are not kept across restarts, so after one the networkservices go direct until a key is pressed.
+PAC_SERVER_ENABLED: bool = os.environ.get("PAC_SERVER_ENABLED", "0") == "1"
+PAC_SERVER_HOST: str = os.environ.get("PAC_SERVER_HOST", "127.0.0.1")
+PAC_SERVER_PORT: int = int(os.environ.get("PAC_SERVER_PORT", "18081"))
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from monitoring import MonitoringParams
+
+logger = logging.getLogger(__name__)
+
+SnapshotKey = Tuple[str, str, str, str]  # (networkservice, proxy_type, domain, port)
+
+SNAPSHOT_VERSION = 1
+
+
+class StateSnapshot:
+    """
+    Last known state of every (networkservice, proxy_type, domain, port), kept in a JSON file
+    so keys can show it right after a restart, before the proxy settings have been read.
+
+    :param path: JSON file of the snapshot
+    :param max_entries: number of entries kept, least recently updated are dropped
+    """
+
+    def __init__(self, path: Path, max_entries: int = 1024):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # one save at a time, so the temporary file is not shared and the newest states are written last
+        self._save_lock = threading.Lock()
+        self._states: Dict[SnapshotKey, bool] = {}
+        self._dirty = False
+
+    def load(self) -> None:
+        """
+        Read the snapshot file. A missing or broken file leaves the snapshot empty.
+        """
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(f"Bad snapshot version {data.get('version')}")
+            states = {
+                (item["networkservice"], item["proxy_type"], item["domain"], item["port"]): bool(item["enabled"])
+                for item in data["states"]
+            }
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError, AttributeError) as err:
+            logger.warning(f"Skipping the state snapshot {self.path}: {err}")
+            return
+        with self._lock:
+            self._states = states
+            self._dirty = False
+
+    def get(self, monitoring_params: MonitoringParams) -> Optional[bool]:
+        """
+        :return: whether the proxy was applied when last read, None if it has never been read
+        """
+        with self._lock:
+            return self._states.get(self._key(monitoring_params))
+
+    def update(self, monitoring_params: MonitoringParams, enabled: bool) -> None:
+        key = self._key(monitoring_params)
+        with self._lock:
+            if self._states.get(key) is enabled:
+                return
+            self._states.pop(key, None)
+            self._states[key] = enabled
+            while len(self._states) > self.max_entries:
+                del self._states[next(iter(self._states))]
+            self._dirty = True
+
+    def save(self) -> bool:
+        """
+        Write the snapshot file if it has changed since it was loaded or saved.
+        The file is replaced atomically, so a crash never leaves half of it.
+
+        :return: whether the file has been written
+        """
+        with self._save_lock:
+            return self._save()
+
+    def _save(self) -> bool:
+        with self._lock:
+            if not self._dirty:
+                return False
+            states = list(self._states.items())
+            self._dirty = False
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "states": [
+                {"networkservice": networkservice, "proxy_type": proxy_type, "domain": domain, "port": port,
+                 "enabled": enabled}
+                for (networkservice, proxy_type, domain, port), enabled in states
+            ],
+        }
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+            raise
+        return True
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @staticmethod
+    def _key(monitoring_params: MonitoringParams) -> SnapshotKey:
+        return (
+            monitoring_params.networkservice,
+            monitoring_params.proxy_type.value,
+            monitoring_params.domain,
+            monitoring_params.port,
+        )
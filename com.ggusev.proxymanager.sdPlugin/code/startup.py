@@ -0,0 +1,106 @@
+"""
+Startup profiling of run.sh -> init.py -> main.py, enabled by PLUGIN_PROFILE_STARTUP=1.
+
+run.sh passes the times it started and finished init in PLUGIN_PROFILE_*_AT variables
+and runs main.py with -X importtime, its stderr copied to PLUGIN_PROFILE_IMPORTTIME_PATH.
+main.py marks its own phases and writes the report once the first key appears.
+
+Import this module before anything else: the time it is imported is when main.py started.
+"""
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+MAIN_STARTED_AT: float = time.time()
+
+PROFILE_STARTUP: bool = os.environ.get("PLUGIN_PROFILE_STARTUP", "0") == "1"
+# phase name -> environment variable run.sh sets to the time of the phase
+RUN_SH_PHASES: Dict[str, str] = {
+    "run_sh_started": "PLUGIN_PROFILE_RUN_SH_STARTED_AT",
+    "init_started": "PLUGIN_PROFILE_INIT_STARTED_AT",
+    "init_finished": "PLUGIN_PROFILE_INIT_FINISHED_AT",
+}
+IMPORTTIME_LINE_REGEX = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$", re.MULTILINE)
+
+_phases: List[Tuple[str, float]] = [("main_started", MAIN_STARTED_AT)]
+_lock = threading.Lock()
+_report_written = False
+
+
+def mark(phase: str) -> None:
+    if not PROFILE_STARTUP:
+        return
+    with _lock:
+        _phases.append((phase, time.time()))
+
+
+def parse_importtime(text: str) -> List[dict]:
+    """
+    :param text: stderr of python -X importtime
+    :return: imported modules with their own and cumulative import time, slowest cumulative first
+    """
+    modules = [
+        {
+            "module": module,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": len(indent) // 2,
+        }
+        for self_us, cumulative_us, indent, module in IMPORTTIME_LINE_REGEX.findall(text)
+    ]
+    return sorted(modules, key=lambda item: item["cumulative_ms"], reverse=True)
+
+
+def build_report(
+        phases: List[Tuple[str, float]],
+        importtime_text: Optional[str] = None,
+        top_imports: int = 30,
+) -> dict:
+    phases = sorted(phases, key=lambda item: item[1])
+    started_at = phases[0][1]
+    report_phases = []
+    previous_at = started_at
+    for name, at in phases:
+        report_phases.append({
+            "phase": name,
+            "at": at,
+            "since_previous_ms": round((at - previous_at) * 1000, 3),
+            "since_start_ms": round((at - started_at) * 1000, 3),
+        })
+        previous_at = at
+    report = {
+        "total_ms": report_phases[-1]["since_start_ms"],
+        "phases": report_phases,
+    }
+    if importtime_text:
+        report["imports"] = parse_importtime(importtime_text)[:top_imports]
+    return report
+
+
+def write_report(path: Path) -> Optional[dict]:
+    """
+    Write the report of the phases marked so far once, with the run.sh phases and -X importtime data.
+
+    :return: the report, None if profiling is disabled or the report has already been written
+    """
+    global _report_written
+    with _lock:
+        if not PROFILE_STARTUP or _report_written:
+            return None
+        _report_written = True
+        phases = list(_phases)
+    for name, variable in RUN_SH_PHASES.items():
+        if os.environ.get(variable):
+            phases.append((name, float(os.environ[variable])))
+    importtime_text = None
+    importtime_path = os.environ.get("PLUGIN_PROFILE_IMPORTTIME_PATH")
+    if importtime_path and Path(importtime_path).exists():
+        importtime_text = Path(importtime_path).read_text(encoding="utf-8", errors="replace")
+    report = build_report(phases=phases, importtime_text=importtime_text)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
@@ -0,0 +1,69 @@
+import threading
+from typing import List, Tuple
+from unittest import TestCase
+
+from commands import KeyCommand, KeyCommandQueue
+from macos_proxy_settings.simple_settings import ProxyTypes
+
+
+def make_command(enabled: bool) -> KeyCommand:
+    return KeyCommand(
+        enabled=enabled,
+        networkservice="Wi-Fi",
+        proxy_type=ProxyTypes.SOCKS,
+        domain="127.0.0.1",
+        port="1080",
+    )
+
+
+class TestsKeyCommandQueue(TestCase):
+    def setUp(self):
+        self.executed: List[Tuple[str, bool]] = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.queue = KeyCommandQueue(execute=self.execute)
+
+    def execute(self, context: str, command: KeyCommand) -> bool:
+        self.executed.append((context, command.enabled))
+        if context == "slow":
+            self.started.set()
+            self.release.wait(timeout=5)
+        return context != "broken"
+
+    def test_latest_wins(self):
+        self.queue.submit(context="slow", command=make_command(enabled=True))
+        self.assertTrue(self.started.wait(timeout=5))
+        for enabled in [False, True, False]:
+            self.queue.submit(context="slow", command=make_command(enabled=enabled))
+        self.assertFalse(self.queue.latest(context="slow").enabled)
+        self.release.set()
+        self.queue.join(timeout=5)
+        self.assertEqual(self.executed, [("slow", True), ("slow", False)])
+        self.assertEqual(self.queue.coalesced_count, 2)
+        self.assertIsNone(self.queue.latest(context="slow"))
+
+    def test_pending_equal_to_applied_is_skipped(self):
+        self.queue.submit(context="slow", command=make_command(enabled=True))
+        self.assertTrue(self.started.wait(timeout=5))
+        self.queue.submit(context="slow", command=make_command(enabled=False))
+        self.queue.submit(context="slow", command=make_command(enabled=True))
+        self.release.set()
+        self.queue.join(timeout=5)
+        self.assertEqual(self.executed, [("slow", True)])
+
+    def test_other_contexts_stay_responsive(self):
+        self.queue.submit(context="slow", command=make_command(enabled=True))
+        self.assertTrue(self.started.wait(timeout=5))
+        done = threading.Event()
+        self.queue.execute = lambda context, command: done.set() or True
+        self.queue.submit(context="fast", command=make_command(enabled=True))
+        self.assertTrue(done.wait(timeout=5))
+        self.release.set()
+        self.queue.join(timeout=5)
+
+    def test_failed_command_is_retried(self):
+        self.queue.submit(context="broken", command=make_command(enabled=True))
+        self.queue.join(timeout=5)
+        self.queue.submit(context="broken", command=make_command(enabled=True))
+        self.queue.join(timeout=5)
+        self.assertEqual(self.executed, [("broken", True), ("broken", True)])
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from endpoints import EndpointSelection, parse_endpoints, race_endpoints, select_fastest
+from prober import ProbeHandshakes
+from test_prober import ProxyServersTestCase, silent_server, socks5_server, unused_port
+
+
+class TestsParseEndpoints(TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_endpoints(" 10.0.0.1:1080, proxy.example.com:1081;[fd00::1]:1082\n10.0.0.1:1080 "),
+            [("10.0.0.1", "1080"), ("proxy.example.com", "1081"), ("fd00::1", "1082")],
+        )
+        self.assertEqual(parse_endpoints(""), [])
+
+    def test_bad_endpoints(self):
+        for text in ["10.0.0.1", "10.0.0.1:", "10.0.0.1:http", "fd00::1:1080", "10.0.0.1:70000", "10.0.0.1:0"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_endpoints(text)
+
+
+class TestsRaceEndpoints(ProxyServersTestCase):
+    async def test_fastest_wins(self):
+        async def slow_socks5_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            await asyncio.sleep(0.2)
+            await socks5_server(reader, writer)
+
+        slow_port = await self.start_server(slow_socks5_server)
+        fast_port = await self.start_server(socks5_server)
+        selection = await race_endpoints(
+            endpoints=[("127.0.0.1", str(slow_port)), ("127.0.0.1", str(fast_port))],
+            handshake=ProbeHandshakes.SOCKS5,
+            deadline=2,
+        )
+        self.assertEqual(selection.endpoint, ("127.0.0.1", str(fast_port)))
+        self.assertLess(selection.latency_ms, 200)
+
+    async def test_down_endpoints_skipped(self):
+        silent_port = await self.start_server(silent_server)
+        slow_port = await self.start_server(socks5_server)
+        started_at = time.monotonic()
+        selection = await race_endpoints(
+            endpoints=[("127.0.0.1", str(unused_port())), ("127.0.0.1", str(silent_port)),
+                       ("127.0.0.1", str(slow_port))],
+            handshake=ProbeHandshakes.SOCKS5,
+            deadline=2,
+        )
+        self.assertEqual(selection.endpoint, ("127.0.0.1", str(slow_port)))
+        self.assertLess(time.monotonic() - started_at, 1)
+
+    async def test_all_down(self):
+        started_at = time.monotonic()
+        selection = await race_endpoints(
+            endpoints=[("127.0.0.1", str(unused_port())), ("127.0.0.1", str(unused_port()))],
+            handshake=ProbeHandshakes.TCP,
+            deadline=2,
+        )
+        self.assertIsNone(selection)
+        self.assertLess(time.monotonic() - started_at, 1)
+
+        silent_port = await self.start_server(silent_server)
+        started_at = time.monotonic()
+        selection = await race_endpoints(
+            endpoints=[("127.0.0.1", str(silent_port))],
+            handshake=ProbeHandshakes.SOCKS5,
+            deadline=0.2,
+        )
+        self.assertIsNone(selection)
+        self.assertLess(time.monotonic() - started_at, 1)
+
+
+class TestsSelectFastest(TestCase):
+    def test_without_loop(self):
+        self.assertIsNone(select_fastest(endpoints=[("127.0.0.1", str(unused_port()))], deadline=1))
+        self.assertEqual(EndpointSelection(domain="a", port="1", latency_ms=1).endpoint, ("a", "1"))
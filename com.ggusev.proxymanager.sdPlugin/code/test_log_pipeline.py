@@ -0,0 +1,134 @@
+import atexit
+import logging
+import queue
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from log_pipeline import (
+    QueueingHandler,
+    RateLimitFilter,
+    configure_logging,
+    parse_log_level,
+    set_log_level,
+)
+
+
+def make_record(msg: str, *args, lineno: int = 1, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord(
+        name="tests",
+        level=logging.WARNING,
+        pathname=__file__,
+        lineno=lineno,
+        msg=msg,
+        args=args,
+        exc_info=exc_info,
+    )
+
+
+class TestsLogLevel(TestCase):
+    def test_parse_log_level(self):
+        self.assertEqual(parse_log_level("info"), logging.INFO)
+        self.assertEqual(parse_log_level(" WARNING "), logging.WARNING)
+        self.assertEqual(parse_log_level(logging.DEBUG), logging.DEBUG)
+        with self.assertRaises(ValueError):
+            parse_log_level("verbose")
+
+    def test_set_log_level(self):
+        root_logger = logging.getLogger()
+        level = root_logger.level
+        try:
+            self.assertEqual(set_log_level("error"), logging.ERROR)
+            self.assertEqual(root_logger.level, logging.ERROR)
+        finally:
+            root_logger.setLevel(level)
+
+
+class TestsRateLimitFilter(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.rate_limit_filter = RateLimitFilter(interval=60, clock=lambda: self.now)
+
+    def test_repeated_message_dropped(self):
+        self.assertTrue(self.rate_limit_filter.filter(make_record("get_proxy failed: %s", "timeout")))
+        self.now = 2
+        self.assertFalse(self.rate_limit_filter.filter(make_record("get_proxy failed: %s", "timeout")))
+        self.now = 4
+        self.assertFalse(self.rate_limit_filter.filter(make_record("get_proxy failed: %s", "timeout")))
+        self.assertTrue(self.rate_limit_filter.filter(make_record("get_proxy failed: %s", "other")))
+        self.assertTrue(self.rate_limit_filter.filter(make_record("get_proxy failed: %s", "timeout", lineno=2)))
+        self.assertEqual(self.rate_limit_filter.suppressed_count, 2)
+
+        self.now = 61
+        record = make_record("get_proxy failed: %s", "timeout")
+        self.assertTrue(self.rate_limit_filter.filter(record))
+        self.assertEqual(record.getMessage(), "get_proxy failed: timeout (2 similar messages suppressed)")
+
+    def test_disabled(self):
+        rate_limit_filter = RateLimitFilter(interval=0)
+        self.assertTrue(rate_limit_filter.filter(make_record("message")))
+        self.assertTrue(rate_limit_filter.filter(make_record("message")))
+
+    def test_max_keys(self):
+        rate_limit_filter = RateLimitFilter(interval=60, max_keys=2, clock=lambda: self.now)
+        for message in ["a", "b", "c"]:
+            self.assertTrue(rate_limit_filter.filter(make_record(message)))
+        self.assertTrue(rate_limit_filter.filter(make_record("a")))
+        self.assertFalse(rate_limit_filter.filter(make_record("c")))
+
+
+class TestsQueueingHandler(TestCase):
+    def test_formats_on_listener(self):
+        queue_ = queue.Queue()
+        handler = QueueingHandler(queue_)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = make_record("failed %s", "read", exc_info=sys.exc_info())
+        handler.handle(record)
+        queued = queue_.get_nowait()
+        self.assertEqual(queued.msg, "failed read")
+        self.assertIsNone(queued.args)
+        self.assertIsNotNone(queued.exc_info)
+        self.assertIsNone(queued.exc_text)
+
+    def test_full_queue_drops(self):
+        queue_ = queue.Queue(maxsize=1)
+        handler = QueueingHandler(queue_)
+        for message in ["a", "b", "c"]:
+            handler.handle(make_record(message))
+        self.assertEqual(handler.dropped_count, 2)
+        self.assertEqual(queue_.get_nowait().msg, "a")
+
+        handler.handle(make_record("d"))
+        self.assertEqual(queue_.get_nowait().getMessage(), "2 log records dropped, the log file is written too slowly")
+        self.assertEqual(handler.dropped_count, 3)
+        handler.handle(make_record("e"))
+        self.assertEqual(queue_.get_nowait().getMessage(), "1 log records dropped, the log file is written too slowly")
+
+class TestsConfigureLogging(TestCase):
+    def test_writes_log_file(self):
+        root_logger = logging.getLogger()
+        handlers, level = list(root_logger.handlers), root_logger.level
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            log_file = Path(tmp_dir) / "logs" / "plugin.log"
+            listener = configure_logging(log_file=log_file, level="info", rate_limit_interval=60)
+            try:
+                test_logger = logging.getLogger("tests.log_pipeline")
+                test_logger.debug("hidden")
+                for _ in range(3):
+                    test_logger.warning("get_proxy failed")
+            finally:
+                atexit.unregister(listener.stop)
+                listener.stop()
+                for handler in root_logger.handlers:
+                    if handler not in handlers:
+                        root_logger.removeHandler(handler)
+                root_logger.setLevel(level)
+                for handler in listener.handlers:
+                    handler.close()
+            lines = log_file.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn("[WARNING] - tests.log_pipeline", lines[0])
+        self.assertTrue(lines[0].endswith(": get_proxy failed"))
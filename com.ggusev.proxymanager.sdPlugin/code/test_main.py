@@ -0,0 +1,99 @@
+import logging
+import re
+import socket
+from pathlib import Path
+from unittest import TestCase, mock
+
+from streamdeck_sdk import events_received_objs
+
+import main
+import settings
+from macos_proxy_settings import networksetup
+from main import ConnectDisconnectAction, configure_local_relay, configure_pac_server, point_autoproxy_url
+
+PI_PATH = Path(__file__).parent.parent / "property_inspector" / "connectdisconnect_pi.html"
+
+
+class TestsLogLevelGlobalSetting(TestCase):
+    def setUp(self):
+        self.action = ConnectDisconnectAction()
+        root_logger = logging.getLogger()
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+
+    def receive_global_settings(self, global_settings: dict) -> None:
+        self.action.on_did_receive_global_settings(events_received_objs.DidReceiveGlobalSettings(
+            payload=events_received_objs.DidReceiveGlobalSettingsPayload(settings=global_settings),
+        ))
+
+    def test_pi_round_trip(self):
+        html = PI_PATH.read_text(encoding="utf-8")
+        select = re.search(r'<select[^>]*id="log_level".*?</select>', html, re.S).group(0)
+        values = re.findall(r'<option[^>]*value="([^"]*)"', select)
+        self.assertEqual(values, ["", "DEBUG", "INFO", "WARNING", "ERROR"])
+        self.assertIn('global_settings["log_level"] = log_level_el.value;', html)
+        self.assertIn("$PI.setGlobalSettings(global_settings);", html)
+
+        for value in values:
+            self.receive_global_settings({"log_level": value})
+            self.assertEqual(logging.getLogger().level, logging.getLevelName(value or settings.LOG_LEVEL), value)
+
+    def test_bad_level_kept(self):
+        self.receive_global_settings({"log_level": "WARNING"})
+        with self.assertLogs(level="WARNING"):
+            self.receive_global_settings({"log_level": "LOUD"})
+        self.assertEqual(logging.getLogger().level, logging.WARNING)
+
+
+class TestsPointAutoproxyUrl(TestCase):
+    def setUp(self):
+        pac_server = mock.Mock()
+        pac_server.url.return_value = "http://127.0.0.1:18081/Wi-Fi.pac"
+        patches = [
+            mock.patch.object(main, "PAC_SERVER", pac_server),
+            mock.patch.object(main, "PAC_POINTED_NETWORKSERVICES", set()),
+            mock.patch.object(networksetup, "getautoproxyurl",
+                              return_value=networksetup.AutoProxyInfo(url="", enabled=False)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_pointed_once(self):
+        with mock.patch.object(networksetup, "setautoproxyurl", return_value="") as setautoproxyurl:
+            self.assertEqual(point_autoproxy_url(networkservice="Wi-Fi"), ["setautoproxyurl"])
+            self.assertEqual(point_autoproxy_url(networkservice="Wi-Fi"), [])
+        setautoproxyurl.assert_called_once_with(networkservice="Wi-Fi", url="http://127.0.0.1:18081/Wi-Fi.pac")
+
+    def test_failed_write(self):
+        error = "** Error: The parameters were not valid."
+        with mock.patch.object(networksetup, "setautoproxyurl", return_value=error) as setautoproxyurl:
+            for _ in range(2):
+                with self.assertRaisesRegex(ValueError, "parameters were not valid"):
+                    point_autoproxy_url(networkservice="Wi-Fi")
+        self.assertEqual(setautoproxyurl.call_count, 2)
+        self.assertEqual(main.PAC_POINTED_NETWORKSERVICES, set())
+
+
+class TestsTakenPorts(TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.addCleanup(self.listener.close)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+
+    def test_relay_not_started(self):
+        with mock.patch.multiple(settings, LOCAL_RELAY_ENABLED=True, LOCAL_RELAY_HOST="127.0.0.1",
+                                 LOCAL_RELAY_PORT=self.port), \
+                mock.patch.object(main, "LOCAL_RELAY", None):
+            with self.assertLogs(level="WARNING"):
+                configure_local_relay()
+            self.assertIsNone(main.LOCAL_RELAY)
+
+    def test_pac_server_not_started(self):
+        with mock.patch.multiple(settings, PAC_SERVER_ENABLED=True, PROXY_BACKEND="networksetup",
+                                 PAC_SERVER_HOST="127.0.0.1", PAC_SERVER_PORT=self.port), \
+                mock.patch.object(main, "PAC_SERVER", None):
+            with self.assertLogs(level="WARNING"):
+                configure_pac_server()
+            self.assertIsNone(main.PAC_SERVER)
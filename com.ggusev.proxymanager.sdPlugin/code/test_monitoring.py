@@ -0,0 +1,137 @@
+from collections import Counter
+from unittest import TestCase, mock
+
+from macos_proxy_settings.networksetup import AutoProxyInfo
+from macos_proxy_settings.simple_settings import ProxyInfo, ProxyTypes
+from monitoring import (
+    MonitoringParams,
+    MonitoringRegistry,
+    StateCache,
+    read_autoproxy_infos,
+    read_proxy_infos,
+)
+
+
+def make_params(networkservice: str, proxy_type: ProxyTypes, port: str = "1080") -> MonitoringParams:
+    return MonitoringParams(networkservice=networkservice, proxy_type=proxy_type, domain="127.0.0.1", port=port)
+
+
+class TestsMonitoringParams(TestCase):
+    def test_is_applied(self):
+        monitoring_params = MonitoringParams(
+            networkservice="Wi-Fi",
+            proxy_type=ProxyTypes.SOCKS,
+            domain="127.0.0.1",
+            port="1080",
+            alternatives=(("127.0.0.2", "1080"),),
+        )
+        self.assertTrue(monitoring_params.is_applied(ProxyInfo(enabled=True, server="127.0.0.1", port="1080")))
+        self.assertTrue(monitoring_params.is_applied(ProxyInfo(enabled=True, server="127.0.0.2", port="1080")))
+        self.assertFalse(monitoring_params.is_applied(ProxyInfo(enabled=False, server="127.0.0.2", port="1080")))
+        self.assertFalse(monitoring_params.is_applied(ProxyInfo(enabled=True, server="127.0.0.3", port="1080")))
+
+
+class TestsMonitoringRegistry(TestCase):
+    def test_add_groups_by_key(self):
+        registry = MonitoringRegistry()
+        registry.add(context="a", monitoring_params=make_params("Wi-Fi", ProxyTypes.SOCKS))
+        registry.add(context="b", monitoring_params=make_params("Wi-Fi", ProxyTypes.SOCKS, port="1081"))
+        registry.add(context="c", monitoring_params=make_params("Ethernet", ProxyTypes.SOCKS))
+
+        snapshot = registry.snapshot()
+        self.assertEqual(set(snapshot[("Wi-Fi", ProxyTypes.SOCKS)]), {"a", "b"})
+        self.assertEqual(set(snapshot[("Ethernet", ProxyTypes.SOCKS)]), {"c"})
+        self.assertEqual(len(registry), 3)
+
+    def test_add_moves_context_to_new_key(self):
+        registry = MonitoringRegistry()
+        registry.add(context="a", monitoring_params=make_params("Wi-Fi", ProxyTypes.SOCKS))
+        registry.add(context="a", monitoring_params=make_params("Wi-Fi", ProxyTypes.HTTP))
+        self.assertEqual(registry.keys(), {("Wi-Fi", ProxyTypes.HTTP)})
+        self.assertEqual(registry.get("a").proxy_type, ProxyTypes.HTTP)
+
+    def test_remove_drops_unused_key(self):
+        registry = MonitoringRegistry()
+        registry.add(context="a", monitoring_params=make_params("Wi-Fi", ProxyTypes.SOCKS))
+        registry.add(context="b", monitoring_params=make_params("Wi-Fi", ProxyTypes.SOCKS))
+        registry.remove(context="a")
+        self.assertEqual(registry.keys(), {("Wi-Fi", ProxyTypes.SOCKS)})
+        registry.remove(context="b")
+        registry.remove(context="unknown")
+        self.assertEqual(registry.keys(), set())
+        self.assertEqual(len(registry), 0)
+
+
+class TestsReadProxyInfos(TestCase):
+    def setUp(self):
+        self.calls = Counter()
+
+    def fake_get_proxy(self, proxy_type: ProxyTypes, networkservice: str) -> ProxyInfo:
+        self.calls[(networkservice, proxy_type)] += 1
+        if networkservice == "Broken":
+            raise IndexError("list index out of range")
+        return ProxyInfo(enabled=True, server="127.0.0.1", port="1080")
+
+    def test_each_pair_read_once(self):
+        keys = [
+            ("Wi-Fi", ProxyTypes.SOCKS),
+            ("Wi-Fi", ProxyTypes.HTTP),
+            ("Wi-Fi", ProxyTypes.HTTPS),
+            ("Wi-Fi", ProxyTypes.HTTP_HTTPS),
+            ("Ethernet", ProxyTypes.HTTP_HTTPS),
+        ]
+        with mock.patch("monitoring.get_proxy", side_effect=self.fake_get_proxy):
+            res = read_proxy_infos(keys=keys)
+
+        self.assertEqual(set(res), set(keys))
+        self.assertTrue(res[("Wi-Fi", ProxyTypes.HTTP_HTTPS)].enabled)
+        self.assertEqual(self.calls, Counter({
+            ("Wi-Fi", ProxyTypes.SOCKS): 1,
+            ("Wi-Fi", ProxyTypes.HTTP): 1,
+            ("Wi-Fi", ProxyTypes.HTTPS): 1,
+            ("Ethernet", ProxyTypes.HTTP): 1,
+            ("Ethernet", ProxyTypes.HTTPS): 1,
+        }))
+
+    def test_failed_reads_are_skipped(self):
+        keys = [("Broken", ProxyTypes.HTTP_HTTPS), ("Wi-Fi", ProxyTypes.SOCKS)]
+        with mock.patch("monitoring.get_proxy", side_effect=self.fake_get_proxy):
+            with self.assertLogs("monitoring", level="WARNING"):
+                res = read_proxy_infos(keys=keys)
+        self.assertEqual(set(res), {("Wi-Fi", ProxyTypes.SOCKS)})
+
+    def test_autoproxy_read_once_per_networkservice(self):
+        def getautoproxyurl(networkservice: str) -> AutoProxyInfo:
+            self.calls[networkservice] += 1
+            if networkservice == "Broken":
+                raise ValueError("** Error: The parameters were not valid.")
+            return AutoProxyInfo(url=f"http://127.0.0.1:8089/{networkservice}.pac", enabled=True)
+
+        keys = [("Wi-Fi", ProxyTypes.SOCKS), ("Wi-Fi", ProxyTypes.HTTP_HTTPS), ("Broken", ProxyTypes.HTTP)]
+        with mock.patch("monitoring.networksetup.getautoproxyurl", side_effect=getautoproxyurl):
+            with self.assertLogs("monitoring", level="WARNING"):
+                res = read_autoproxy_infos(keys=keys)
+        self.assertEqual(set(res), {("Wi-Fi", ProxyTypes.SOCKS), ("Wi-Fi", ProxyTypes.HTTP_HTTPS)})
+        self.assertEqual(res[("Wi-Fi", ProxyTypes.SOCKS)].url, "http://127.0.0.1:8089/Wi-Fi.pac")
+        self.assertEqual(self.calls, Counter({"Wi-Fi": 1, "Broken": 1}))
+
+
+class TestsStateCache(TestCase):
+    def test_only_transitions_are_sent(self):
+        cache = StateCache()
+        sent = [cache.should_send(context="a", state=state) for state in [0, 0, 1, 1, 1, 0]]
+        self.assertEqual(sent, [True, False, True, False, False, True])
+        self.assertEqual(cache.stats(), {"sent": 3, "suppressed": 3})
+
+    def test_force_refresh(self):
+        cache = StateCache()
+        cache.should_send(context="a", state=1)
+        cache.force_refresh(context="a")
+        self.assertTrue(cache.should_send(context="a", state=1))
+        self.assertFalse(cache.should_send(context="a", state=1))
+
+    def test_forget(self):
+        cache = StateCache()
+        cache.should_send(context="a", state=1)
+        cache.forget(context="a")
+        self.assertTrue(cache.should_send(context="a", state=1))
@@ -0,0 +1,138 @@
+import json
+import re
+import urllib.error
+import urllib.request
+from typing import Dict, Optional, Tuple
+from unittest import TestCase
+
+from pac import (
+    DIRECT_PROFILE,
+    DIRECT_ROUTE,
+    PAC_CONTENT_TYPE,
+    PacProfile,
+    PacRoute,
+    PacRouteKinds,
+    PacRule,
+    PacServer,
+    parse_rules,
+    render_pac,
+)
+
+# not through the proxies of the environment
+OPENER = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+SOCKS_ROUTE = PacRoute(kind=PacRouteKinds.SOCKS5, domain="10.0.0.1", port="1080")
+HTTP_ROUTE = PacRoute(kind=PacRouteKinds.PROXY, domain="10.0.0.2", port="3128")
+
+
+def find_proxy(script: str, host: str) -> str:
+    """
+    FindProxyForURL of a script rendered by render_pac, in Python.
+    """
+    values = {name: json.loads(value) for name, value in re.findall(r"^var (\w+) = (.*?);$", script, re.M | re.S)}
+    if host in values["HOSTS"]:
+        return values["HOSTS"][host]
+    suffix = host
+    while True:
+        if suffix in values["SUFFIXES"]:
+            return values["SUFFIXES"][suffix]
+        if "." not in suffix:
+            return values["DEFAULT"]
+        suffix = suffix.split(".", 1)[1]
+
+
+class TestsPacRules(TestCase):
+    def test_parse_rules(self):
+        rules = parse_rules(
+            "intranet.example.com DIRECT; *.Example.org proxy 10.0.0.2:3128\n.corp socks5 10.0.0.1:1080\n")
+        self.assertEqual(rules, [
+            PacRule(pattern="intranet.example.com", route=DIRECT_ROUTE),
+            PacRule(pattern="*.example.org", route=HTTP_ROUTE),
+            PacRule(pattern=".corp", route=SOCKS_ROUTE),
+        ])
+        self.assertEqual(parse_rules(" "), [])
+
+    def test_parse_bad_rules(self):
+        for text in ["example.com", "example.com PROXY 10.0.0.1", "example.com PROXY 10.0.0.1:99999",
+                     "*example.com DIRECT", "example.com HTTPS 10.0.0.1:443"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_rules(text)
+
+    def test_route(self):
+        self.assertEqual(str(DIRECT_ROUTE), "DIRECT")
+        self.assertEqual(str(HTTP_ROUTE), "PROXY 10.0.0.2:3128")
+        self.assertEqual(str(SOCKS_ROUTE), "SOCKS5 10.0.0.1:1080; SOCKS 10.0.0.1:1080")
+
+    def test_render_pac(self):
+        profile = PacProfile(route=SOCKS_ROUTE, rules=tuple(parse_rules(
+            "intranet.example.com DIRECT; *.example.org PROXY 10.0.0.2:3128; example.org DIRECT; "
+            "*.example.org DIRECT")))
+        script = render_pac(profile=profile)
+        self.assertIn("function FindProxyForURL(url, host)", script)
+        self.assertEqual(find_proxy(script, "intranet.example.com"), "DIRECT")
+        self.assertEqual(find_proxy(script, "www.example.com"), str(SOCKS_ROUTE))
+        self.assertEqual(find_proxy(script, "example.org"), "DIRECT")  # the host rule comes first
+        self.assertEqual(find_proxy(script, "a.b.example.org"), str(HTTP_ROUTE))  # the first rule wins
+        self.assertEqual(find_proxy(script, "localhost"), str(SOCKS_ROUTE))
+        self.assertEqual(find_proxy(render_pac(profile=DIRECT_PROFILE), "example.com"), "DIRECT")
+
+
+class TestsPacServer(TestCase):
+    def setUp(self):
+        self.server = PacServer(port=0)
+        self.server.start_in_thread()
+
+    def tearDown(self):
+        self.server.close()
+
+    def get(self, name: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        request = urllib.request.Request(self.server.url(name), headers=headers or {})
+        try:
+            with OPENER.open(request, timeout=5) as response:
+                return response.status, dict(response.headers), response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, dict(err.headers), b""
+
+    def test_serve(self):
+        self.assertTrue(self.server.set_profile("Wi-Fi", PacProfile(route=SOCKS_ROUTE)))
+        status, headers, body = self.get("Wi-Fi")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], PAC_CONTENT_TYPE)
+        self.assertEqual(body, render_pac(PacProfile(route=SOCKS_ROUTE)).encode())
+        self.assertIn("Last-Modified", headers)
+
+        # a service without a profile goes direct
+        status, _, body = self.get("USB 10/100/1000 LAN")
+        self.assertEqual(status, 200)
+        self.assertEqual(body, render_pac(DIRECT_PROFILE).encode())
+
+        with self.assertRaises(urllib.error.HTTPError):
+            OPENER.open(f"http://{self.server.host}:{self.server.port}/favicon.ico", timeout=5)
+
+    def test_revalidation(self):
+        self.server.set_profile("Wi-Fi", PacProfile(route=SOCKS_ROUTE))
+        _, headers, _ = self.get("Wi-Fi")
+        status, _, body = self.get("Wi-Fi", headers={"If-None-Match": headers["ETag"]})
+        self.assertEqual((status, body), (304, b""))
+        status, _, _ = self.get("Wi-Fi", headers={"If-Modified-Since": headers["Last-Modified"]})
+        self.assertEqual(status, 304)
+        self.assertEqual(self.server.stats()["not_modified"], 2)
+
+        # a swap in the same second is not missed
+        self.assertTrue(self.server.set_profile("Wi-Fi", PacProfile(route=HTTP_ROUTE)))
+        status, new_headers, body = self.get("Wi-Fi", headers={"If-None-Match": headers["ETag"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(body, render_pac(PacProfile(route=HTTP_ROUTE)).encode())
+        status, _, _ = self.get("Wi-Fi", headers={"If-Modified-Since": headers["Last-Modified"]})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_headers["Last-Modified"], headers["Last-Modified"])
+
+    def test_rendered_once_per_profile(self):
+        for _ in range(3):
+            for route in (SOCKS_ROUTE, HTTP_ROUTE):
+                self.server.set_profile("Wi-Fi", PacProfile(route=route))
+                self.server.set_profile("Ethernet", PacProfile(route=route))
+        self.assertEqual(self.server.stats()["rendered"], 2)
+        self.assertFalse(self.server.set_profile("Wi-Fi", PacProfile(route=HTTP_ROUTE)))
+        self.assertEqual(self.server.profile("Wi-Fi"), PacProfile(route=HTTP_ROUTE))
+        self.server.set_profile("Wi-Fi", None)
+        self.assertEqual(self.server.profile("Wi-Fi"), DIRECT_PROFILE)
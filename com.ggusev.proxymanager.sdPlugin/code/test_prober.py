@@ -0,0 +1,182 @@
+import asyncio
+import socket
+from typing import List
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from prober import (
+    Address,
+    DnsCache,
+    LatencyWindow,
+    ProbeError,
+    ProbeHandshakes,
+    ProbeStats,
+    ProbeTarget,
+    ProxyProber,
+    format_title,
+    probe,
+)
+
+
+async def socks5_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    if await reader.read(3):
+        writer.write(b"\x05\x00")
+        await writer.drain()
+    writer.close()
+
+
+async def http_proxy_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        pass
+    else:
+        writer.write(b"HTTP/1.1 407 Proxy Authentication Required\r\n\r\n")
+        await writer.drain()
+    writer.close()
+
+
+async def silent_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    await reader.read()
+    writer.close()
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestsLatencyWindow(TestCase):
+    def test_percentile(self):
+        window = LatencyWindow(size=4)
+        self.assertIsNone(window.percentile(0.5))
+        for latency_ms in [100, 1, 2, 3, 4]:
+            window.add(latency_ms)
+        self.assertEqual(len(window), 4)
+        self.assertEqual(window.percentile(0.5), 2)
+        self.assertEqual(window.percentile(0.95), 4)
+
+    def test_format_title(self):
+        self.assertEqual(format_title(ProbeStats(p50_ms=12.4, p95_ms=30.6, ok=True, samples=3)), "12ms\np95 31ms")
+        self.assertEqual(format_title(ProbeStats(p50_ms=12.4, p95_ms=30.6, ok=False, error="timeout")), "down")
+
+
+class TestsDnsCache(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.now = 0.0
+        self.resolved: List[str] = []
+
+    async def fake_resolve(self, host: str, port: int) -> List[Address]:
+        self.resolved.append(host)
+        await asyncio.sleep(0.01)
+        if host == "broken":
+            raise socket.gaierror("Name or service not known")
+        return [("127.0.0.1", port)]
+
+    async def test_ttl(self):
+        dns_cache = DnsCache(ttl=60, resolve=self.fake_resolve, clock=lambda: self.now)
+        self.assertEqual(await dns_cache.resolve("proxy", 1080), [("127.0.0.1", 1080)])
+        await dns_cache.resolve("proxy", 1080)
+        self.now = 61
+        await dns_cache.resolve("proxy", 1080)
+        self.assertEqual(self.resolved, ["proxy", "proxy"])
+
+    async def test_concurrent_lookups_shared(self):
+        dns_cache = DnsCache(ttl=60, resolve=self.fake_resolve, clock=lambda: self.now)
+        results = await asyncio.gather(*(dns_cache.resolve("proxy", 1080) for _ in range(5)))
+        self.assertEqual(results, [[("127.0.0.1", 1080)]] * 5)
+        self.assertEqual(self.resolved, ["proxy"])
+
+    async def test_failures_not_cached(self):
+        dns_cache = DnsCache(ttl=60, resolve=self.fake_resolve, clock=lambda: self.now)
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                await dns_cache.resolve("broken", 1080)
+        self.assertEqual(self.resolved, ["broken", "broken"])
+
+
+class ProxyServersTestCase(IsolatedAsyncioTestCase):
+    """
+    Runs stand-in proxy servers on localhost.
+    """
+
+    async def asyncSetUp(self):
+        self.servers = []
+        self.dns_cache = DnsCache()
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def start_server(self, handler) -> int:
+        server = await asyncio.start_server(handler, host="127.0.0.1", port=0)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+
+class TestsProbe(ProxyServersTestCase):
+    async def test_handshakes(self):
+        socks5_port = await self.start_server(socks5_server)
+        http_port = await self.start_server(http_proxy_server)
+        for target in [
+            ProbeTarget(domain="127.0.0.1", port=socks5_port, handshake=ProbeHandshakes.SOCKS5),
+            ProbeTarget(domain="localhost", port=http_port, handshake=ProbeHandshakes.HTTP_CONNECT),
+            ProbeTarget(domain="127.0.0.1", port=http_port, handshake=ProbeHandshakes.TCP),
+        ]:
+            latency_ms = await probe(target=target, dns_cache=self.dns_cache, timeout=2)
+            self.assertGreaterEqual(latency_ms, 0)
+
+    async def test_wrong_protocol(self):
+        socks5_port = await self.start_server(socks5_server)
+        target = ProbeTarget(domain="127.0.0.1", port=socks5_port, handshake=ProbeHandshakes.HTTP_CONNECT)
+        with self.assertRaises(ProbeError):
+            await probe(target=target, dns_cache=self.dns_cache, timeout=2)
+
+    async def test_timeout(self):
+        silent_port = await self.start_server(silent_server)
+        target = ProbeTarget(domain="127.0.0.1", port=silent_port, handshake=ProbeHandshakes.SOCKS5)
+        with self.assertRaises(asyncio.TimeoutError):
+            await probe(target=target, dns_cache=self.dns_cache, timeout=0.1)
+
+    async def test_refused(self):
+        target = ProbeTarget(domain="127.0.0.1", port=unused_port())
+        with self.assertRaises(OSError):
+            await probe(target=target, dns_cache=self.dns_cache, timeout=2)
+
+
+class TestsProxyProber(ProxyServersTestCase):
+    async def test_probe_targets(self):
+        socks5_port = await self.start_server(socks5_server)
+        up = ProbeTarget(domain="127.0.0.1", port=socks5_port, handshake=ProbeHandshakes.SOCKS5)
+        down = ProbeTarget(domain="127.0.0.1", port=unused_port())
+        prober = ProxyProber(get_targets=dict, on_stats=lambda *args: None)
+        for _ in range(3):
+            target_to_stats = await prober.probe_targets(targets=[up, down, up])
+        self.assertEqual(prober.probe_count, 6)
+        self.assertTrue(target_to_stats[up].ok)
+        self.assertEqual(target_to_stats[up].samples, 3)
+        self.assertLessEqual(target_to_stats[up].p50_ms, target_to_stats[up].p95_ms)
+        self.assertFalse(target_to_stats[down].ok)
+        self.assertTrue(target_to_stats[down].error)
+        self.assertIsNone(target_to_stats[down].p50_ms)
+
+        self.assertEqual(await prober.probe_targets(targets=[down]), {down: target_to_stats[down]})
+        self.assertEqual(prober.stats(up).samples, 0)
+
+    async def test_run(self):
+        socks5_port = await self.start_server(socks5_server)
+        target = ProbeTarget(domain="127.0.0.1", port=socks5_port, handshake=ProbeHandshakes.SOCKS5)
+        rounds = []
+        prober = ProxyProber(
+            get_targets=lambda: {target: ["a", "b"]},
+            on_stats=lambda target_to_stats, target_to_keys: rounds.append((target_to_stats, target_to_keys)),
+            interval=0.01,
+        )
+        task = asyncio.ensure_future(prober.run())
+        while len(rounds) < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        target_to_stats, target_to_keys = rounds[1]
+        self.assertTrue(target_to_stats[target].ok)
+        self.assertEqual(target_to_keys, {target: ["a", "b"]})
@@ -0,0 +1,260 @@
+import asyncio
+import base64
+import struct
+from typing import List, Optional, Tuple
+from unittest import IsolatedAsyncioTestCase
+from urllib.parse import urlsplit
+
+from relay import LocalRelay, Upstream, UpstreamKinds
+
+
+class StandInUpstream:
+    """
+    HTTP CONNECT or SOCKS5 proxy on localhost that requires a username and password if they are set.
+    """
+
+    def __init__(self, kind: UpstreamKinds, username: str = "", password: str = ""):
+        self.kind = kind
+        self.username = username
+        self.password = password
+        self.accepted_count = 0
+        self.targets: List[Tuple[str, int]] = []
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, host="127.0.0.1", port=0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.accepted_count += 1
+        try:
+            if self.kind is UpstreamKinds.HTTP:
+                target = await self.handshake_http(reader=reader, writer=writer)
+            else:
+                target = await self.handshake_socks5(reader=reader, writer=writer)
+            if target is None:
+                return
+            target, forwarded = target
+            self.targets.append(target)
+            remote_reader, remote_writer = await asyncio.open_connection(*target)
+            remote_writer.write(forwarded)
+            await asyncio.gather(pipe(reader, remote_writer), pipe(remote_reader, writer))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def handshake_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        head = await reader.readuntil(b"\r\n\r\n")
+        method, target = head.split(b" ")[:2]
+        if self.username:
+            credentials = base64.b64encode(f"{self.username}:{self.password}".encode())
+            if b"Proxy-Authorization: Basic " + credentials not in head:
+                writer.write(b"HTTP/1.1 407 Proxy Authentication Required\r\n\r\n")
+                await writer.drain()
+                return None
+        if method != b"CONNECT":
+            # absolute-form request, forwarded as it is
+            host, port = urlsplit(target.decode()).netloc.rsplit(":", 1)
+            return (host, int(port)), head
+        host, port = target.decode().rsplit(":", 1)
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await writer.drain()
+        return (host, int(port)), b""
+
+    async def handshake_socks5(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        _, methods_count = await reader.readexactly(2)
+        methods = await reader.readexactly(methods_count)
+        if self.username:
+            if 2 not in methods:
+                writer.write(b"\x05\xff")
+                return None
+            writer.write(b"\x05\x02")
+            await reader.readexactly(1)
+            username = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+            password = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+            if (username, password) != (self.username, self.password):
+                writer.write(b"\x01\x01")
+                return None
+            writer.write(b"\x01\x00")
+        else:
+            writer.write(b"\x05\x00")
+        _, _, _, address_type = await reader.readexactly(4)
+        if address_type == 1:
+            host = ".".join(str(byte) for byte in await reader.readexactly(4))
+        else:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        port = struct.unpack("!H", await reader.readexactly(2))[0]
+        writer.write(b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+        await writer.drain()
+        return (host, port), b""
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        writer.write_eof()
+    except (ConnectionError, OSError):
+        pass
+
+
+async def echo_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    await pipe(reader, writer)
+    writer.close()
+
+
+async def http_origin_server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    head = await reader.readuntil(b"\r\n\r\n")
+    request_line = head.split(b"\r\n", 1)[0]
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: " + str(len(request_line)).encode() + b"\r\n\r\n" + request_line)
+    await writer.drain()
+    writer.close()
+
+
+async def socks5_client(port: int, host: str, target_port: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"\x05\x01\x00")
+    assert await reader.readexactly(2) == b"\x05\x00"
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(host)]) + host.encode() + struct.pack("!H", target_port))
+    reply = await reader.readexactly(10)
+    if reply[1] != 0:
+        writer.close()
+        raise ConnectionRefusedError(f"SOCKS5 reply {reply[1]}")
+    return reader, writer
+
+
+async def http_connect_client(port: int, authority: str) -> Tuple[bytes, asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n\r\n".encode())
+    status_line = (await reader.readuntil(b"\r\n\r\n")).split(b"\r\n", 1)[0]
+    return status_line, reader, writer
+
+
+async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, data: bytes) -> bytes:
+    writer.write(data)
+    await writer.drain()
+    return await reader.readexactly(len(data))
+
+
+class TestsLocalRelay(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+        self.upstreams: List[StandInUpstream] = []
+        self.echo_port = await self.start_server(echo_server)
+        self.relay = LocalRelay(port=0, buffer_size=4096, pool_size=2, drain_timeout=0.5)
+        await self.relay.start()
+
+    async def asyncTearDown(self):
+        await self.relay.close()
+        for upstream in self.upstreams:
+            await upstream.close()
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def start_server(self, handler) -> int:
+        server = await asyncio.start_server(handler, host="127.0.0.1", port=0)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def start_upstream(self, kind: UpstreamKinds, username: str = "", password: str = "") -> Upstream:
+        stand_in = StandInUpstream(kind=kind, username=username, password=password)
+        port = await stand_in.start()
+        self.upstreams.append(stand_in)
+        return Upstream(kind=kind, domain="127.0.0.1", port=port, username=username, password=password)
+
+    async def test_direct(self):
+        reader, writer = await socks5_client(self.relay.port, "localhost", self.echo_port)
+        self.assertEqual(await echo(reader, writer, b"hello"), b"hello")
+        writer.close()
+
+        status_line, reader, writer = await http_connect_client(self.relay.port, f"127.0.0.1:{self.echo_port}")
+        self.assertEqual(status_line, b"HTTP/1.1 200 Connection established")
+        data = bytes(range(256)) * 100  # bigger than the buffers
+        self.assertEqual(await echo(reader, writer, data), data)
+        writer.close()
+
+    async def test_upstreams_with_auth(self):
+        for kind in UpstreamKinds:
+            upstream = await self.start_upstream(kind=kind, username="user", password="secret")
+            self.relay.set_upstream(upstream)
+            for client in ("socks5", "http"):
+                if client == "socks5":
+                    reader, writer = await socks5_client(self.relay.port, "127.0.0.1", self.echo_port)
+                else:
+                    status_line, reader, writer = await http_connect_client(
+                        self.relay.port, f"127.0.0.1:{self.echo_port}")
+                    self.assertEqual(status_line, b"HTTP/1.1 200 Connection established")
+                self.assertEqual(await echo(reader, writer, kind.value.encode()), kind.value.encode())
+                writer.close()
+            self.assertEqual(self.upstreams[-1].targets, [("127.0.0.1", self.echo_port)] * 2)
+
+    async def test_wrong_credentials(self):
+        upstream = await self.start_upstream(kind=UpstreamKinds.HTTP, username="user", password="secret")
+        self.relay.set_upstream(Upstream(kind=upstream.kind, domain=upstream.domain, port=upstream.port,
+                                         username="user", password="wrong"))
+        status_line, reader, writer = await http_connect_client(self.relay.port, f"127.0.0.1:{self.echo_port}")
+        self.assertEqual(status_line, b"HTTP/1.1 502 Bad Gateway")
+        writer.close()
+        with self.assertRaises(ConnectionRefusedError):
+            await socks5_client(self.relay.port, "127.0.0.1", self.echo_port)
+        self.assertEqual(self.relay.stats()["failed"], 2)
+
+    async def test_plain_http_requests(self):
+        origin_port = await self.start_server(http_origin_server)
+        for upstream in [None, await self.start_upstream(kind=UpstreamKinds.SOCKS5),
+                         await self.start_upstream(kind=UpstreamKinds.HTTP)]:
+            self.relay.set_upstream(upstream)
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.relay.port)
+            writer.write(f"GET http://127.0.0.1:{origin_port}/path?q=1 HTTP/1.1\r\n"
+                         f"Host: 127.0.0.1:{origin_port}\r\nProxy-Connection: keep-alive\r\n\r\n".encode())
+            response = await reader.read()
+            writer.close()
+            request_line = f"GET /path?q=1 HTTP/1.1" if upstream is None or upstream.kind is UpstreamKinds.SOCKS5 \
+                else f"GET http://127.0.0.1:{origin_port}/path?q=1 HTTP/1.1"
+            self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"), response)
+            self.assertTrue(response.endswith(request_line.encode()), response)
+
+    async def test_pool(self):
+        upstream = await self.start_upstream(kind=UpstreamKinds.SOCKS5)
+        self.relay.set_upstream(upstream)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.upstreams[-1].accepted_count, 2)  # opened before any request
+        for _ in range(3):
+            reader, writer = await socks5_client(self.relay.port, "127.0.0.1", self.echo_port)
+            self.assertEqual(await echo(reader, writer, b"ping"), b"ping")
+            writer.close()
+            await asyncio.sleep(0.05)
+        self.assertEqual(self.relay.stats()["pool_hits"], 3)
+        self.assertEqual(self.relay.stats()["pool_misses"], 0)
+
+    async def test_switch_drains_connections(self):
+        first = await self.start_upstream(kind=UpstreamKinds.SOCKS5)
+        second = await self.start_upstream(kind=UpstreamKinds.HTTP)
+        self.relay.set_upstream(first)
+        old_reader, old_writer = await socks5_client(self.relay.port, "127.0.0.1", self.echo_port)
+        self.relay.set_upstream(second)
+        await asyncio.sleep(0)
+
+        # the connection accepted before the switch keeps its upstream until the drain timeout
+        self.assertEqual(await echo(old_reader, old_writer, b"old"), b"old")
+        reader, writer = await socks5_client(self.relay.port, "127.0.0.1", self.echo_port)
+        self.assertEqual(await echo(reader, writer, b"new"), b"new")
+        self.assertEqual(len(self.upstreams[0].targets), 1)
+        self.assertEqual(len(self.upstreams[1].targets), 1)
+
+        await asyncio.sleep(0.7)
+        self.assertEqual(await old_reader.read(), b"")
+        self.assertEqual(self.relay.stats()["drained"], 1)
+        self.assertEqual(await echo(reader, writer, b"still"), b"still")
+        writer.close()
+        old_writer.close()
@@ -0,0 +1,99 @@
+import threading
+from typing import List
+from unittest import TestCase
+
+from scheduler import MonitoringScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestsMonitoringScheduler(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = MonitoringScheduler(
+            fast_interval=0.2,
+            boost_window=1,
+            max_interval=10,
+            clock=self.clock,
+        )
+
+    def poll(self, key, value) -> List[float]:
+        """
+        Poll key with an unchanged value until the clock reaches 30s, return the poll times.
+        """
+        poll_times = []
+        while self.clock.now < 30:
+            self.clock.now = self.scheduler.next_due(key)
+            self.assertEqual(self.scheduler.due_keys(), [key])
+            poll_times.append(self.clock.now)
+            self.scheduler.report(key=key, value=value)
+        return poll_times
+
+    def test_backoff(self):
+        self.scheduler.boost(keys=["a"])
+        poll_times = self.poll("a", value=1)
+        intervals = [round(b - a, 6) for a, b in zip(poll_times, poll_times[1:])]
+        self.assertEqual(intervals[:5], [0.2] * 5)
+        self.assertEqual(intervals[5:10], [0.4, 0.8, 1.6, 3.2, 6.4])
+        self.assertEqual(set(intervals[10:]), {10})
+
+    def test_change_snaps_back(self):
+        self.scheduler.boost(keys=["a"])
+        self.poll("a", value=1)
+        self.clock.now = self.scheduler.next_due("a")
+        self.scheduler.due_keys()
+        self.scheduler.report(key="a", value=2)
+        self.assertAlmostEqual(self.scheduler.next_due("a"), self.clock.now + 0.2)
+
+    def test_failed_poll_is_not_a_change(self):
+        self.scheduler.boost(keys=["a"])
+        self.poll("a", value=1)
+        self.clock.now = self.scheduler.next_due("a")
+        self.scheduler.due_keys()
+        self.scheduler.report(key="a")
+        self.assertAlmostEqual(self.scheduler.next_due("a"), self.clock.now + 10)
+
+    def test_keys_have_own_timers(self):
+        self.scheduler.boost(keys=["a", "b"])
+        self.assertEqual(sorted(self.scheduler.due_keys()), ["a", "b"])
+        self.clock.now = 5
+        self.scheduler.report(key="a", value=1)
+        self.scheduler.report(key="b", value=1)
+        self.scheduler.boost(keys=["b"])
+        self.assertEqual(self.scheduler.due_keys(), ["b"])
+        self.scheduler.report(key="b", value=1)
+        self.clock.now = 5.2
+        self.assertEqual(self.scheduler.due_keys(), ["b"])
+        self.clock.now = 5.4
+        self.assertEqual(self.scheduler.due_keys(), ["a"])
+
+    def test_boost_while_polled(self):
+        self.scheduler.boost(keys=["a"])
+        self.poll("a", value=1)
+        self.clock.now = self.scheduler.next_due("a")
+        self.scheduler.due_keys()
+        self.scheduler.boost(keys=["a"])
+        self.scheduler.report(key="a", value=1)
+        self.assertEqual(self.scheduler.due_keys(), ["a"])
+
+    def test_remove(self):
+        self.scheduler.boost(keys=["a"])
+        self.scheduler.remove(key="a")
+        self.assertEqual(self.scheduler.due_keys(), [])
+        self.assertIsNone(self.scheduler.next_due("a"))
+
+    def test_wait_due_wakes_on_boost(self):
+        scheduler = MonitoringScheduler()
+        result = []
+        thread = threading.Thread(target=lambda: result.extend(scheduler.wait_due(timeout=5)))
+        thread.start()
+        scheduler.boost(keys=["a"])
+        thread.join(timeout=5)
+        self.assertEqual(result, ["a"])
+        self.assertEqual(MonitoringScheduler().wait_due(timeout=0.01), [])
@@ -0,0 +1,87 @@
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+
+from macos_proxy_settings.simple_settings import ProxyTypes
+from monitoring import MonitoringParams
+from snapshot import StateSnapshot
+
+
+def make_params(port: str = "1080") -> MonitoringParams:
+    return MonitoringParams(networkservice="Wi-Fi", proxy_type=ProxyTypes.SOCKS, domain="127.0.0.1", port=port)
+
+
+class TestsStateSnapshot(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "state_snapshot.json"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        snapshot = StateSnapshot(path=self.path)
+        snapshot.update(monitoring_params=make_params(), enabled=True)
+        snapshot.update(monitoring_params=make_params(port="1081"), enabled=False)
+        self.assertTrue(snapshot.save())
+
+        loaded = StateSnapshot(path=self.path)
+        loaded.load()
+        self.assertIs(loaded.get(monitoring_params=make_params()), True)
+        self.assertIs(loaded.get(monitoring_params=make_params(port="1081")), False)
+        self.assertIsNone(loaded.get(monitoring_params=make_params(port="1082")))
+
+    def test_save_only_changes(self):
+        snapshot = StateSnapshot(path=self.path)
+        self.assertFalse(snapshot.save())
+        snapshot.update(monitoring_params=make_params(), enabled=True)
+        self.assertTrue(snapshot.save())
+        snapshot.update(monitoring_params=make_params(), enabled=True)
+        self.assertFalse(snapshot.save())
+        snapshot.update(monitoring_params=make_params(), enabled=False)
+        self.assertTrue(snapshot.save())
+        self.assertFalse(self.path.with_name("state_snapshot.json.tmp").exists())
+
+    def test_concurrent_saves(self):
+        snapshot = StateSnapshot(path=self.path)
+        errors = []
+
+        def save_states(port: str) -> None:
+            for index in range(50):
+                snapshot.update(monitoring_params=make_params(port=port), enabled=index % 2 == 0)
+                try:
+                    snapshot.save()
+                except OSError as err:
+                    errors.append(err)
+
+        threads = [threading.Thread(target=save_states, args=(str(port),)) for port in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        loaded = StateSnapshot(path=self.path)
+        loaded.load()
+        for port in range(8):
+            self.assertIs(loaded.get(monitoring_params=make_params(port=str(port))), False)
+
+    def test_max_entries(self):
+        snapshot = StateSnapshot(path=self.path, max_entries=2)
+        snapshot.update(monitoring_params=make_params(port="1"), enabled=True)
+        snapshot.update(monitoring_params=make_params(port="2"), enabled=True)
+        snapshot.update(monitoring_params=make_params(port="1"), enabled=False)
+        snapshot.update(monitoring_params=make_params(port="3"), enabled=True)
+        self.assertEqual(len(snapshot), 2)
+        self.assertIsNone(snapshot.get(monitoring_params=make_params(port="2")))
+        self.assertIs(snapshot.get(monitoring_params=make_params(port="1")), False)
+
+    def test_load_missing_or_broken(self):
+        snapshot = StateSnapshot(path=self.path)
+        snapshot.load()
+        self.assertEqual(len(snapshot), 0)
+        for content in ["{", json.dumps({"version": 0, "states": []}), json.dumps({"version": 1, "states": [{}]})]:
+            self.path.write_text(content, encoding="utf-8")
+            snapshot.load()
+            self.assertEqual(len(snapshot), 0)
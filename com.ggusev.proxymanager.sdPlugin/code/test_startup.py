@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+import startup
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |      15000 |   streamdeck_sdk
+import time:     14000 |      14700 |     pydantic
+import time:       700 |        700 |       annotated_types
+import time:       250 |        250 |   settings
+"""
+
+
+class TestsStartup(TestCase):
+    def test_parse_importtime(self):
+        res = startup.parse_importtime(IMPORTTIME)
+        self.assertEqual([item["module"] for item in res], ["streamdeck_sdk", "pydantic", "annotated_types",
+                                                           "settings", "_io"])
+        self.assertEqual(res[1], {"module": "pydantic", "self_ms": 14, "cumulative_ms": 14.7, "depth": 2})
+
+    def test_build_report(self):
+        report = startup.build_report(phases=[("main_started", 10.5), ("run_sh_started", 10), ("connecting", 11)])
+        self.assertEqual([phase["phase"] for phase in report["phases"]], ["run_sh_started", "main_started",
+                                                                          "connecting"])
+        self.assertEqual(report["phases"][1]["since_previous_ms"], 500)
+        self.assertEqual(report["total_ms"], 1000)
+        self.assertNotIn("imports", report)
+
+    def test_write_report_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir)
+            (tmp_path / "importtime.log").write_text(IMPORTTIME, encoding="utf-8")
+            environ = {
+                "PLUGIN_PROFILE_RUN_SH_STARTED_AT": str(startup.MAIN_STARTED_AT - 1),
+                "PLUGIN_PROFILE_IMPORTTIME_PATH": str(tmp_path / "importtime.log"),
+            }
+            with mock.patch.dict(os.environ, environ), \
+                    mock.patch.object(startup, "PROFILE_STARTUP", True), \
+                    mock.patch.object(startup, "_report_written", False), \
+                    mock.patch.object(startup, "_phases", [("main_started", startup.MAIN_STARTED_AT)]):
+                startup.mark("connecting")
+                report = startup.write_report(path=tmp_path / "logs" / "startup_profile.json")
+                self.assertIsNone(startup.write_report(path=tmp_path / "logs" / "startup_profile.json"))
+            self.assertEqual(json.loads((tmp_path / "logs" / "startup_profile.json").read_text()), report)
+        self.assertEqual([phase["phase"] for phase in report["phases"]],
+                         ["run_sh_started", "main_started", "connecting"])
+        self.assertEqual(report["imports"][0]["module"], "streamdeck_sdk")
+
+    def test_disabled(self):
+        with mock.patch.object(startup, "PROFILE_STARTUP", False):
+            startup.mark("connecting")
+            self.assertIsNone(startup.write_report(path=Path("unused.json")))
+        self.assertNotIn("connecting", [phase for phase, _ in startup._phases])
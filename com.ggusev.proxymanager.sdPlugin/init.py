@@ -1,12 +1,15 @@
+import hashlib
+import json
 import logging
 import os
 import platform
 import re
 import subprocess
 import sys
+import time
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 # region environ
 PYTHON_COMMAND: str = os.environ["PYTHON_COMMAND"]
@@ -21,10 +24,18 @@ PLUGIN_CODE_REQUIREMENTS_PATH: Path = Path(os.environ["PLUGIN_CODE_REQUIREMENTS_
 
 PLUGIN_CODE_VENV_DIR_PATH: Path = Path(os.environ["PLUGIN_CODE_VENV_DIR_PATH"])
 PLUGIN_CODE_VENV_ACTIVATE: Path = Path(os.environ["PLUGIN_CODE_VENV_ACTIVATE"])
+PLUGIN_CODE_VENV_PYTHON: Path = Path(os.environ["PLUGIN_CODE_VENV_PYTHON"])
+# wheels of requirements.txt to install without the network, see build_wheelhouse.py
+PLUGIN_CODE_WHEELHOUSE_PATH: Path = Path(
+    os.environ.get("PLUGIN_CODE_WHEELHOUSE_PATH", PLUGIN_CODE_DIR_PATH / "wheelhouse")
+)
+UPGRADE_PIP: bool = os.environ.get("PLUGIN_UPGRADE_PIP", "0") == "1"
 # endregion environ
 
 OS_NAME = platform.system()
 MANIFEST_FILE_PATH = PLUGIN_DIR_PATH / "manifest.json"
+# written once the requirements are verified, see compute_requirements_stamp
+REQUIREMENTS_STAMP_PATH: Path = PLUGIN_CODE_VENV_DIR_PATH / "requirements.stamp"
 
 # region logging settings
 LOG_FILE_PATH: Path = PLUGIN_LOGS_DIR_PATH / Path("init.log")
@@ -33,7 +44,8 @@ logger: logging.Logger = logging.getLogger(__name__)
 # endregion logging settings
 
 # region regex
-PARSE_REQUIREMENTS_REGEX = re.compile(r"^\s*?(\S*).=", flags=re.MULTILINE)
+# name and pinned version of every line of requirements.txt
+PARSE_REQUIREMENTS_REGEX = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9_.\-]*)\s*(?:==\s*([^\s;#]+))?", flags=re.MULTILINE)
 BEGIN_S_REGEX = re.compile(r"^\s+|\s+$")
 BEGIN_END_WHITESPACES_REGEX = re.compile(r"^ +| +$", flags=re.MULTILINE)
 LINE_TRANSLATION_REGEX = re.compile(r"\n|\r$", flags=re.MULTILINE)
@@ -49,6 +61,7 @@ class InitError(Exception):
 def main():
     init_logger(log_file=LOG_FILE_PATH, log_level=LOG_LEVEL)
     logger.info("INIT STARTED")
+    start = time.perf_counter()
     try:
         init_project()
         logger.info("INIT COMPLETED SUCCESSFULLY")
@@ -57,13 +70,16 @@ def main():
         logger.exception(err)
         logger.error("INIT COMPLETED WITH ERRORS")
         init_result = False
-    logger.info(f"{init_result=}")
+    logger.info(f"{init_result=}, init took {time.perf_counter() - start:.2f}s")
     print(init_result)
 
 
 def init_project():
     if check_venv_activate_exists():
         logger.info("Current venv found")
+        if check_requirements_stamp():
+            logger.info("Current venv. Requirements stamp matches, requirements check skipped")
+            return
         try:
             check_requirements()
         except Exception as err:
@@ -78,6 +94,7 @@ def init_project():
             except Exception as err:
                 raise InitError(f"Current venv. Second check requirements ERROR: {err}")
         logger.info("Current venv is correct")
+        write_requirements_stamp()
         return
     else:
         logger.info("Current venv not found")
@@ -105,23 +122,97 @@ def init_project():
     except Exception as err:
         raise InitError(f"New venv. Check requirements ERROR: {err}")
     logger.info("New venv is correct")
+    write_requirements_stamp()
 
 
 def check_requirements() -> None:
-    requirements_packages_text = PLUGIN_CODE_REQUIREMENTS_PATH.read_text("utf-8")
-    requirements_packages_names = PARSE_REQUIREMENTS_REGEX.findall(requirements_packages_text)
-
-    installed_packages_names = get_installed_packages_names()
-    installed_packages_names_underscore = [package_name.replace("-", "_") for package_name in installed_packages_names]
-    installed_packages_names.extend(installed_packages_names_underscore)
-
-    for requirements_package_name in requirements_packages_names:
-        requirements_package_name_underscore = requirements_package_name.replace("-", "_")
-        if not (requirements_package_name in installed_packages_names or
-                requirements_package_name_underscore in installed_packages_names):
-            message = f'Package "{requirements_package_name}" not installed'
-            logger.error(message)
-            raise InitError(message)
+    """
+    Check with importlib.metadata in the venv that every requirement is installed with its pinned version.
+    """
+    requirements = parse_requirements(PLUGIN_CODE_REQUIREMENTS_PATH.read_text("utf-8"))
+    process = subprocess.run(
+        [PLUGIN_CODE_VENV_PYTHON, "-c", CHECK_REQUIREMENTS_SCRIPT, json.dumps(requirements)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+    )
+    if process.returncode != 0:
+        logger.error(process.stderr)
+        raise InitError(process.stderr)
+    problems: List[str] = json.loads(process.stdout)
+    if problems:
+        message = "; ".join(problems)
+        logger.error(message)
+        raise InitError(message)
+
+
+# Runs in the venv. argv[1] is a JSON list of [name, pinned version or null], prints a JSON list of problems.
+CHECK_REQUIREMENTS_SCRIPT = """
+import json
+import sys
+from importlib import metadata
+
+problems = []
+for name, pinned_version in json.loads(sys.argv[1]):
+    version = None
+    for candidate in (name, name.replace("-", "_"), name.replace("_", "-")):
+        try:
+            version = metadata.version(candidate)
+            break
+        except metadata.PackageNotFoundError:
+            pass
+    if version is None:
+        problems.append(f'Package "{name}" not installed')
+    elif pinned_version is not None and version != pinned_version:
+        problems.append(f'Package "{name}" {version} installed, {pinned_version} required')
+print(json.dumps(problems))
+"""
+
+
+def parse_requirements(requirements_text: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    :return: name and pinned version, or None if it is not pinned, of every requirement
+    """
+    return [(name, version or None) for name, version in PARSE_REQUIREMENTS_REGEX.findall(requirements_text)]
+
+
+def compute_requirements_stamp() -> Dict[str, str]:
+    """
+    Identify the requirements and the venv interpreter without running it:
+    the version comes from pyvenv.cfg, the path is the interpreter the venv python links to.
+    """
+    pyvenv_cfg = {}
+    pyvenv_cfg_path = PLUGIN_CODE_VENV_DIR_PATH / "pyvenv.cfg"
+    if pyvenv_cfg_path.exists():
+        for line in pyvenv_cfg_path.read_text("utf-8").splitlines():
+            key, _, value = line.partition("=")
+            pyvenv_cfg[key.strip()] = value.strip()
+    return {
+        "requirements_sha256": hashlib.sha256(PLUGIN_CODE_REQUIREMENTS_PATH.read_bytes()).hexdigest(),
+        "python_version": pyvenv_cfg.get("version_info", pyvenv_cfg.get("version", "")),
+        "python_path": os.path.realpath(PLUGIN_CODE_VENV_PYTHON),
+    }
+
+
+def check_requirements_stamp() -> bool:
+    """
+    :return: True if the requirements have been verified for the current requirements.txt and interpreter
+    """
+    try:
+        stamp = json.loads(REQUIREMENTS_STAMP_PATH.read_text("utf-8"))
+    except (OSError, ValueError):
+        logger.info(f'Requirements stamp not found in "{REQUIREMENTS_STAMP_PATH}"')
+        return False
+    current_stamp = compute_requirements_stamp()
+    if stamp != current_stamp:
+        logger.info(f"Requirements stamp changed: {stamp} -> {current_stamp}")
+        return False
+    return True
+
+
+def write_requirements_stamp() -> None:
+    REQUIREMENTS_STAMP_PATH.write_text(json.dumps(compute_requirements_stamp()), "utf-8")
+    logger.info(f'Requirements stamp written to "{REQUIREMENTS_STAMP_PATH}"')
 
 
 def create_venv() -> None:
@@ -137,46 +228,49 @@ def create_venv() -> None:
 
 
 def install_requirements() -> None:
-    if OS_NAME == "Darwin":
-        command = f'''
-        source "{PLUGIN_CODE_VENV_ACTIVATE}" &&\
-        export PYTHONPATH="{PLUGIN_CODE_DIR_PATH}" &&\
-        {PYTHON_COMMAND} -m pip install --upgrade pip &&\
-        {PYTHON_COMMAND} -m pip install -r "{PLUGIN_CODE_REQUIREMENTS_PATH}"\
-        '''
-    elif OS_NAME == "Windows":
-        command = f'''
-        "{PLUGIN_CODE_VENV_ACTIVATE}" &&\
-        {PYTHON_COMMAND} -m pip install --upgrade pip &&\
-        {PYTHON_COMMAND} -m pip install -r "{PLUGIN_CODE_REQUIREMENTS_PATH}"\
-        '''
+    """
+    Install the requirements from the wheelhouse without the network if it has wheels,
+    from the package index if it has none or the wheelhouse install fails.
+    """
+    if UPGRADE_PIP:
+        run_pip(pip_args="install --upgrade pip", description="Upgrade pip")
+    if any(PLUGIN_CODE_WHEELHOUSE_PATH.glob("*.whl")):
+        try:
+            run_pip(
+                pip_args=f'install --no-index --find-links "{PLUGIN_CODE_WHEELHOUSE_PATH}" '
+                         f'-r "{PLUGIN_CODE_REQUIREMENTS_PATH}"',
+                description="Install requirements from the wheelhouse",
+            )
+            return
+        except InitError as err:
+            logger.warning(f"Wheelhouse install failed, installing from the package index: {err}")
     else:
-        raise InitError("Unsupported Operation System.")
-    process = subprocess.run(
-        clean_up_shell_command(command=command),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        encoding="utf-8",
-        shell=True,
+        logger.info(f'No wheels in "{PLUGIN_CODE_WHEELHOUSE_PATH}"')
+    run_pip(
+        pip_args=f'install -r "{PLUGIN_CODE_REQUIREMENTS_PATH}"',
+        description="Install requirements from the package index",
     )
-    if process.stderr:
-        logger.error(process.stderr)
-        raise InitError(process.stderr)
 
 
-def get_installed_packages_names() -> List[str]:
+def run_pip(pip_args: str, description: str) -> None:
+    """
+    Run pip with pip_args in the venv and log how long it took.
+    """
+    pip_command = f"{PYTHON_COMMAND} -m pip --disable-pip-version-check {pip_args}"
     if OS_NAME == "Darwin":
         command = f'''
         source "{PLUGIN_CODE_VENV_ACTIVATE}" &&\
-        {PYTHON_COMMAND} -m pip freeze\
+        export PYTHONPATH="{PLUGIN_CODE_DIR_PATH}" &&\
+        {pip_command}\
         '''
     elif OS_NAME == "Windows":
         command = f'''
         "{PLUGIN_CODE_VENV_ACTIVATE}" &&\
-        {PYTHON_COMMAND} -m pip freeze\
+        {pip_command}\
         '''
     else:
         raise InitError("Unsupported Operation System.")
+    start = time.perf_counter()
     process = subprocess.run(
         clean_up_shell_command(command=command),
         stdout=subprocess.PIPE,
@@ -184,11 +278,13 @@ def get_installed_packages_names() -> List[str]:
         encoding="utf-8",
         shell=True,
     )
-    if process.stderr:
-        logger.error(process.stderr)
+    duration = time.perf_counter() - start
+    if process.returncode != 0:
+        logger.error(f"{description} failed in {duration:.2f}s: {process.stderr}")
         raise InitError(process.stderr)
-    installed_packages_names = PARSE_REQUIREMENTS_REGEX.findall(process.stdout)
-    return installed_packages_names
+    if process.stderr:
+        logger.warning(process.stderr)
+    logger.info(f"{description} took {duration:.2f}s")
 
 
 def clean_up_shell_command(command: str) -> str:
@@ -1,9 +1,20 @@
+import tempfile
 from pathlib import Path
 
 from streamdeck_sdk_pi import *
 
 OUTPUT_DIR = Path(__file__).parent
 TEMPLATE = Path(__file__).parent / "pi_template.html"
+# the log_level global setting is shared by every key, so its select is in the template instead of elements,
+# "default" keeps LOG_LEVEL
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", ]
+LOG_LEVEL_OPTIONS_PLACEHOLDER = "<!--    LOG LEVEL OPTIONS   -->"
+
+
+def render_template(path: Path) -> None:
+    options = "\n".join(f'<option value="{level}">{level}</option>' for level in LOG_LEVELS)
+    text = TEMPLATE.read_text(encoding="utf-8").replace(LOG_LEVEL_OPTIONS_PLACEHOLDER, options)
+    path.write_text(text, encoding="utf-8")
 
 
 def main():
@@ -36,6 +47,24 @@ def main():
                 pattern=r"\d{1,}",
                 placeholder="1080",
             ),
+            Textfield(
+                label="Endpoints",
+                uid="endpoints",
+                required=False,
+                placeholder="192.168.61.2:1080, 192.168.61.3:1080",
+            ),
+            Textfield(
+                label="PAC rules",
+                uid="pac_rules",
+                required=False,
+                placeholder="*.corp.example.com DIRECT; example.org PROXY 192.168.61.4:3128",
+            ),
+            Textfield(
+                label="Bypass list file",
+                uid="bypass_domains_file",
+                required=False,
+                placeholder="~/proxy-bypass.txt",
+            ),
             Textfield(
                 label="Username",
                 uid="username",
@@ -50,7 +79,10 @@ def main():
             ),
         ]
     )
-    pi.build(output_dir=OUTPUT_DIR, template=TEMPLATE)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        template = Path(tmp_dir) / TEMPLATE.name
+        render_template(path=template)
+        pi.build(output_dir=OUTPUT_DIR, template=template)
 
 
 if __name__ == '__main__':
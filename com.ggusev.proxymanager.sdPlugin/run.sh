@@ -1,6 +1,18 @@
 #!/bin/sh
 
 export PYTHON_COMMAND="python3"
+
+# Startup profiling: set PLUGIN_PROFILE_STARTUP=1 or create a .profile_startup file in the plugin directory.
+# The report is written to logs/startup_profile.json.
+profile_now() {
+  ${PYTHON_COMMAND} -S -c "import time; print(time.time())"
+}
+if [ -f "$(dirname "$0")/.profile_startup" ]; then
+  export PLUGIN_PROFILE_STARTUP="1"
+fi
+if [ "$PLUGIN_PROFILE_STARTUP" = "1" ]; then
+  export PLUGIN_PROFILE_RUN_SH_STARTED_AT=$(profile_now)
+fi
 export PYTHON_OK_VERSION="Python 3"
 export PYTHON_MINIMUM_VERSION="3.8"
 
@@ -44,8 +56,14 @@ if [[ $PYTHON_VERSION != $PYTHON_OK_VERSION* ]]; then
   exit
 fi
 
+if [ "$PLUGIN_PROFILE_STARTUP" = "1" ]; then
+  export PLUGIN_PROFILE_INIT_STARTED_AT=$(profile_now)
+fi
 INIT_RESULT=$(${PYTHON_COMMAND} "${PYTHON_INIT_PATH}")
 echo $INIT_RESULT
+if [ "$PLUGIN_PROFILE_STARTUP" = "1" ]; then
+  export PLUGIN_PROFILE_INIT_FINISHED_AT=$(profile_now)
+fi
 
 if [ "$INIT_RESULT" != "True" ] && [ "$INIT_RESULT" != "False" ]; then
   echo "init error"
@@ -61,4 +79,18 @@ fi
 export PYTHONPATH="${PLUGIN_CODE_DIR_PATH}"
 echo $PYTHONPATH
 
+if [ "$PLUGIN_PROFILE_STARTUP" = "1" ]; then
+  export PLUGIN_PROFILE_IMPORTTIME_PATH="${PLUGIN_LOGS_DIR_PATH}/importtime.log"
+  # stderr still reaches the terminal, tee copies it to the log. The pipeline returns the status of tee,
+  # so the one of python is passed through a file.
+  PLUGIN_PROFILE_STATUS_PATH="${PLUGIN_LOGS_DIR_PATH}/importtime.status"
+  {
+    {
+      "${PLUGIN_CODE_VENV_PYTHON}" -X importtime "${PLUGIN_CODE_PATH}" "$@" 2>&1 1>&3 3>&-
+      echo $? > "${PLUGIN_PROFILE_STATUS_PATH}"
+    } | tee "${PLUGIN_PROFILE_IMPORTTIME_PATH}" >&2
+  } 3>&1
+  exit $(cat "${PLUGIN_PROFILE_STATUS_PATH}")
+fi
+
 "${PLUGIN_CODE_VENV_PYTHON}" "${PLUGIN_CODE_PATH}" "$@"